@@ -43,6 +43,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Collected static files, before sessions and auth get involved
+    'pages.middleware.PrecompressedStaticMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -85,6 +87,17 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Take the write lock when a transaction starts so concurrent
+            # checkouts queue up instead of failing with "database is locked"
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+        # A file (not the in-memory default) so tests that run concurrent
+        # checkouts see the same locking behaviour as the real database
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
@@ -126,6 +139,19 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# `manage.py build_static` collects fingerprinted, minified and precompressed
+# copies here; PrecompressedStaticMiddleware serves them
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'pages.staticfiles.CompressedManifestStaticFilesStorage',
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -140,3 +166,60 @@ import os
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Invoice numbers and customer IDs are reserved this many at a time per worker
+SEQUENCE_BLOCK_SIZE = 20
+
+# How long (in seconds) create_invoice remembers an Idempotency-Key
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+
+# Largest backlog a terminal may upload to /api/sync-sales/ in one request
+OFFLINE_SYNC_MAX_SALES = 1000
+
+# Seconds a worker may serve the active tax rate from memory. Changes made
+# in the same process apply immediately (signals.py); others within this TTL.
+TAX_RATE_CACHE_TTL = 60
+
+# Seconds a cart line keeps its stock on hold after the cart last changed.
+# Expired holds are returned by `manage.py sweep_stock_holds` (run it from
+# cron, or with --interval as a long-running process).
+STOCK_HOLD_TTL = 15 * 60
+
+# Most product IDs one /api/products/stock/ request may ask for
+PRODUCT_STOCK_MAX_IDS = 500
+
+# Products per page of the cashier grid feed (/api/products/feed/)
+PRODUCT_FEED_PAGE_SIZE = 60
+
+# Scanned barcodes/SKUs remembered per worker for the scan endpoint
+SKU_CACHE_SIZE = 50000
+
+# Catalog sync for terminals (see pages/catalog.py): seconds between delta
+# polls on the cashier screen, and the most changed rows sent as a delta
+# before a full snapshot is sent instead
+CATALOG_POLL_INTERVAL = 5
+CATALOG_DELTA_MAX_ROWS = 2000
+
+# Product import (products page and `manage.py import_products`): rows
+# written per transaction, and the most changes listed in a preview
+PRODUCT_IMPORT_CHUNK_SIZE = 500
+PRODUCT_IMPORT_DIFF_LIMIT = 200
+
+# Report PDFs are rendered by `manage.py run_report_worker`, which should
+# run next to the web server; while no worker has checked in for
+# REPORT_WORKER_TIMEOUT seconds, reports are rendered in the request instead.
+# Processes it renders in, seconds a finished report is reused for the same
+# filters, seconds before a job whose worker died is queued again, and
+# seconds finished jobs and their files are kept
+REPORT_WORKER_PROCESSES = 2
+REPORT_WORKER_TIMEOUT = 30
+REPORT_CACHE_TTL = 10 * 60
+REPORT_JOB_TIMEOUT = 10 * 60
+REPORT_JOB_RETENTION = 24 * 60 * 60
+
+# Thermal receipt printing (see pages/receipts.py): characters per line
+# (48 for 80mm paper, 32 for 58mm), and the network printer every sale's
+# receipt is sent to as ESC/POS, as "host:port" ('' to print from the browser)
+RECEIPT_COLUMNS = 48
+RECEIPT_PRINTER = ''
+RECEIPT_PRINTER_TIMEOUT = 3
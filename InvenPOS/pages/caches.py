@@ -0,0 +1,150 @@
+# caches.py
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .models import CatalogChange, Product, TaxRate, normalize_sku
+from .sequences import catalog_version
+
+
+class TaxRateCacheEntry:
+    def __init__(self, tax_rate):
+        self.tax_rate = tax_rate
+        self.loaded_at = time.monotonic()
+        if tax_rate:
+            fingerprint = f"{tax_rate.id}:{tax_rate.name}:{tax_rate.percentage}"
+        else:
+            fingerprint = 'none'
+        self.etag = '"%s"' % hashlib.md5(fingerprint.encode()).hexdigest()
+
+    def is_fresh(self):
+        ttl = getattr(settings, 'TAX_RATE_CACHE_TTL', 60)
+        return time.monotonic() - self.loaded_at < ttl
+
+
+_tax_rate_lock = threading.Lock()
+_tax_rate_entry = None
+
+
+def get_tax_rate_entry():
+    """Active tax rate, read from the database at most once per TTL.
+
+    Saving or deleting a TaxRate invalidates the entry in this process right
+    away (see signals.py); other worker processes pick the change up when
+    their TAX_RATE_CACHE_TTL runs out.
+    """
+    global _tax_rate_entry
+
+    entry = _tax_rate_entry
+    if entry is not None and entry.is_fresh():
+        return entry
+
+    with _tax_rate_lock:
+        if _tax_rate_entry is not None and _tax_rate_entry.is_fresh():
+            return _tax_rate_entry
+
+        tax_rate = TaxRate.objects.filter(is_active=True).first()
+        _tax_rate_entry = TaxRateCacheEntry(tax_rate)
+        return _tax_rate_entry
+
+
+async def aget_tax_rate_entry():
+    entry = _tax_rate_entry
+    if entry is not None and entry.is_fresh():
+        return entry
+    return await sync_to_async(get_tax_rate_entry)()
+
+
+def get_active_tax_rate():
+    """The TaxRate applied to new sales, or None"""
+    return get_tax_rate_entry().tax_rate
+
+
+def invalidate_tax_rate():
+    global _tax_rate_entry
+    with _tax_rate_lock:
+        _tax_rate_entry = None
+
+
+# ---------------- SKU LOOKUP ----------------
+# Scanned codes map to their product's grid fields in memory. Every change
+# to a product (price, stock, holds) or category bumps the catalog version,
+# so a repeat scan only reads that counter; when it has moved, the change
+# log says which products to forget.
+
+_sku_lock = threading.Lock()
+_sku_products = OrderedDict()  # code -> grid fields plus sku, least recently scanned first
+_sku_codes = {}  # product id -> code, to forget changed products
+_sku_version = 0  # catalog version the remembered products are current as of
+
+
+def _forget_changed_products(version):
+    """Drop remembered products changed after _sku_version, or all of them
+    if a category changed or too much did. Call with _sku_lock held."""
+    global _sku_version
+
+    limit = getattr(settings, 'CATALOG_DELTA_MAX_ROWS', 2000)
+    changes = []
+    if 0 < _sku_version < version:
+        changes = list(
+            CatalogChange.objects.filter(version__gt=_sku_version).values_list('kind', 'object_id')[:limit + 1]
+        )
+    if not changes or len(changes) > limit or any(kind != CatalogChange.PRODUCT for kind, _ in changes):
+        _sku_products.clear()
+        _sku_codes.clear()
+    else:
+        for _, product_id in changes:
+            code = _sku_codes.pop(product_id, None)
+            if code is not None:
+                _sku_products.pop(code, None)
+    _sku_version = version
+
+
+def lookup_sku(code):
+    """Grid fields plus sku of the product with this barcode/SKU, or None.
+
+    A repeat scan costs one read of the catalog version while nothing in the
+    catalog changed, and otherwise one read of the change log; the product
+    row is only read again if it is among the changes.
+    """
+    from .search import GRID_FIELDS, grid_product
+
+    code = normalize_sku(code)
+    if not code:
+        return None
+
+    # Read first, so a change made while the row is fetched moves it on
+    version = catalog_version()
+    with _sku_lock:
+        if version != _sku_version:
+            _forget_changed_products(version)
+        product = _sku_products.get(code)
+        if product is not None:
+            _sku_products.move_to_end(code)
+            return dict(product)
+
+    row = Product.objects.filter(sku=code).values_list(*GRID_FIELDS + ('sku',)).first()
+    if row is None:
+        return None
+    product = dict(grid_product(*row[:-1]), sku=row[-1])
+
+    with _sku_lock:
+        if version == _sku_version:
+            _sku_products[code] = product
+            _sku_codes[product['id']] = code
+            while len(_sku_products) > getattr(settings, 'SKU_CACHE_SIZE', 50000):
+                _, forgotten = _sku_products.popitem(last=False)
+                _sku_codes.pop(forgotten['id'], None)
+    return dict(product)
+
+
+def clear_sku_cache():
+    global _sku_version
+    with _sku_lock:
+        _sku_products.clear()
+        _sku_codes.clear()
+        _sku_version = 0
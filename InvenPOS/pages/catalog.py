@@ -0,0 +1,140 @@
+# catalog.py
+import json
+import threading
+
+from django.conf import settings
+from django.utils.text import compress_string
+
+from .models import CatalogChange, Category, Product
+from .search import GRID_FIELDS, grid_product
+from .sequences import bump_catalog_version, catalog_version
+
+PRODUCT = CatalogChange.PRODUCT
+CATEGORY = CatalogChange.CATEGORY
+
+# Columns catalog_product() expects, in order, for values_list()
+CATALOG_FIELDS = GRID_FIELDS + ('product_category_id', 'sku')
+
+
+def record_changes(kind, ids, deleted=False):
+    """Advance the catalog version and stamp ``ids`` with it in the change log.
+
+    One UPDATE for the version and one upsert for the log, however many ids
+    there are. Returns the new version.
+    """
+    ids = sorted(set(ids))
+    version = bump_catalog_version()
+    if ids:
+        CatalogChange.objects.bulk_create(
+            [CatalogChange(kind=kind, object_id=object_id, version=version, deleted=deleted) for object_id in ids],
+            update_conflicts=True,
+            unique_fields=['kind', 'object_id'],
+            update_fields=['version', 'deleted'],
+        )
+    return version
+
+
+def catalog_product(*row):
+    """What a terminal keeps for one product: the grid fields plus its category id and SKU.
+
+    The category name is left out; terminals look it up in the categories
+    they hold, so renaming a category doesn't resend its products.
+    """
+    *grid, category_id, sku = row
+    product = grid_product(*grid)
+    del product['category']
+    product['category_id'] = category_id
+    product['sku'] = sku
+    return product
+
+
+def catalog_snapshot():
+    """Every product and category, as of the returned version.
+
+    The version is read first, so rows changed while the snapshot is built are
+    sent again by the next delta rather than missed.
+    """
+    version = catalog_version()
+    return {
+        'version': version,
+        'full': True,
+        'categories': list(Category.objects.order_by('id').values('id', 'name')),
+        'products': [
+            catalog_product(*row)
+            for row in Product.objects.order_by('id').values_list(*CATALOG_FIELDS).iterator(chunk_size=2000)
+        ],
+        'deleted': {'products': [], 'categories': []},
+    }
+
+
+def catalog_changes(since):
+    """Products and categories changed after version ``since``, or None if a full snapshot is due.
+
+    A snapshot is due when ``since`` doesn't belong to this database (0, or
+    ahead of the current version) or when so much changed that sending
+    everything is about as cheap.
+    """
+    version = catalog_version()
+    if since <= 0 or since > version:
+        return None
+    if since == version:
+        return {'version': version, 'full': False, 'categories': [], 'products': [],
+                'deleted': {'products': [], 'categories': []}}
+
+    limit = getattr(settings, 'CATALOG_DELTA_MAX_ROWS', 2000)
+    changes = list(
+        CatalogChange.objects.filter(version__gt=since).values_list('kind', 'object_id', 'deleted')[:limit + 1]
+    )
+    if len(changes) > limit:
+        return None
+
+    changed = {PRODUCT: [], CATEGORY: []}
+    deleted = {PRODUCT: [], CATEGORY: []}
+    for kind, object_id, is_deleted in changes:
+        (deleted if is_deleted else changed)[kind].append(object_id)
+
+    categories = []
+    if changed[CATEGORY]:
+        categories = list(Category.objects.filter(id__in=changed[CATEGORY]).order_by('id').values('id', 'name'))
+    products = []
+    if changed[PRODUCT]:
+        rows = Product.objects.filter(id__in=changed[PRODUCT]).order_by('id').values_list(*CATALOG_FIELDS)
+        products = [catalog_product(*row) for row in rows]
+
+    return {
+        'version': version,
+        'full': False,
+        'categories': categories,
+        'products': products,
+        'deleted': {'products': sorted(deleted[PRODUCT]), 'categories': sorted(deleted[CATEGORY])},
+    }
+
+
+# The last full snapshot, serialized and gzipped, so a room full of terminals
+# starting up together costs one catalog scan instead of one each
+_snapshot_lock = threading.Lock()
+_snapshot_cache = None  # (version, json bytes, gzipped bytes)
+
+
+def snapshot_bytes():
+    """JSON of the current full snapshot and its gzipped form, built at most once per version"""
+    global _snapshot_cache
+
+    version = catalog_version()
+    cached = _snapshot_cache
+    if cached is not None and cached[0] == version:
+        return cached[1], cached[2]
+
+    with _snapshot_lock:
+        if _snapshot_cache is not None and _snapshot_cache[0] == version:
+            return _snapshot_cache[1], _snapshot_cache[2]
+        snapshot = catalog_snapshot()
+        content = json.dumps(snapshot, separators=(',', ':')).encode()
+        _snapshot_cache = (snapshot['version'], content, compress_string(content))
+        return _snapshot_cache[1], _snapshot_cache[2]
+
+
+def clear_snapshot_cache():
+    global _snapshot_cache
+    with _snapshot_lock:
+        _snapshot_cache = None
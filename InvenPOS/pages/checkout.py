@@ -0,0 +1,358 @@
+# checkout.py
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Q, When
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .catalog import PRODUCT, record_changes
+from .models import IdempotencyKey, Invoice, Product, SoldItem, StockHold
+from .reservations import held_by
+from .rollups import add_sales
+
+
+class CheckoutError(Exception):
+    """Raised when a sale can't be applied. Nothing is written to the database."""
+
+
+def to_decimal(value):
+    """JSON numbers arrive as floats; go through str() so 0.1 stays 0.1."""
+    try:
+        return Decimal(str(value))
+    except ArithmeticError:
+        raise CheckoutError(f'Invalid amount: {value}')
+
+
+def not_enough_stock(product, quantity, available=None):
+    if available is None:
+        available = product.available_quantity
+    return CheckoutError(
+        f'Not enough stock for {product.product_name}. '
+        f'Available: {available}, Requested: {quantity}'
+    )
+
+
+def parse_sold_items(sold_items):
+    """Validate the cart lines sent by the payment page.
+
+    Returns the cleaned lines and the total quantity requested per product,
+    so a product that appears on two lines is checked against its stock once.
+    """
+    lines = []
+    quantities = {}
+
+    for item_data in sold_items:
+        try:
+            product_id = int(item_data['product_id'])
+            quantity = int(item_data['quantity'])
+            unit_price = to_decimal(item_data['unit_price'])
+        except (KeyError, TypeError, ValueError):
+            raise CheckoutError('Invalid item in cart')
+
+        if quantity <= 0:
+            raise CheckoutError(f'Invalid quantity for product with ID {product_id}')
+
+        lines.append({
+            'product_id': product_id,
+            'product_name': item_data.get('product_name') or '',
+            'quantity': quantity,
+            'unit_price': unit_price,
+        })
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+
+    if not lines:
+        raise CheckoutError('Cart is empty')
+
+    return lines, quantities
+
+
+def decrement_stock(products, quantities, held=None):
+    """Take ``quantities`` out of stock with a single conditional UPDATE.
+
+    Every product row is only touched if it still has enough unreserved stock
+    at the time the UPDATE runs, so two cashiers selling the last units can't
+    both succeed. ``held`` maps product ids to the units the selling terminal
+    has on hold; those count as available to this sale and are released by the
+    same UPDATE. Raises CheckoutError if any line could not be covered; the
+    caller's transaction is expected to roll the partial sale back. Records
+    the stock change in the catalog log on success.
+    """
+    held = held or {}
+    enough_stock = Q()
+    new_quantity = []
+    new_reserved = []
+    for product_id, quantity in quantities.items():
+        own = held.get(product_id, 0)
+        enough_stock |= Q(id=product_id, product_quantity__gte=F('reserved_quantity') - own + quantity)
+        new_quantity.append(When(id=product_id, then=F('product_quantity') - quantity))
+        if own:
+            new_reserved.append(When(id=product_id, then=F('reserved_quantity') - own))
+
+    changes = {'product_quantity': Case(*new_quantity, default=F('product_quantity'))}
+    if new_reserved:
+        changes['reserved_quantity'] = Case(*new_reserved, default=F('reserved_quantity'))
+    updated = Product.objects.filter(enough_stock).update(**changes)
+
+    if updated != len(quantities):
+        # Someone else sold the stock between our read and the UPDATE.
+        # Only the failure path pays for working out which line it was.
+        current = Product.objects.in_bulk(list(quantities))
+        for product_id, quantity in quantities.items():
+            product = current.get(product_id) or products[product_id]
+            available = product.available_quantity + held.get(product_id, 0)
+            if available < quantity:
+                raise not_enough_stock(product, quantity, available)
+        raise CheckoutError('Stock changed during checkout, please try again')
+
+    record_changes(PRODUCT, quantities)
+
+
+def sale_summary(invoice):
+    """JSON body returned to the payment page for a recorded sale"""
+    return {
+        'success': True,
+        'invoice_number': invoice.invoice_number,
+        'customer_id': invoice.customer_id,
+        'total_amount': float(invoice.total_amount),
+        'tax_amount': float(invoice.tax_amount),
+        'tax_rate_name': invoice.tax_rate.name if invoice.tax_rate else 'No Tax',
+        'tax_rate_percentage': float(invoice.tax_rate.percentage) if invoice.tax_rate else 0,
+        'invoice_id': invoice.id,
+        'staff_name': invoice.staff_name,
+        'message': 'Invoice created successfully'
+    }
+
+
+def idempotency_cutoff():
+    ttl = getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 60 * 60)
+    return timezone.now() - timedelta(seconds=ttl)
+
+
+def find_replay(user, key):
+    """Stored response for a retried request, or None if the key is new or expired"""
+    return (
+        IdempotencyKey.objects
+        .filter(user=user, key=key, created_at__gte=idempotency_cutoff())
+        .values_list('response', flat=True)
+        .first()
+    )
+
+
+def remember_response(user, key, response):
+    """Store ``response`` under ``key`` and drop entries past their TTL.
+
+    Must run in the same transaction as the sale, so that a concurrent retry
+    with the same key fails on the unique constraint and rolls back.
+    """
+    IdempotencyKey.objects.filter(created_at__lt=idempotency_cutoff()).delete()
+    IdempotencyKey.objects.create(user=user, key=key, response=response)
+
+
+def build_invoice(data, user, staff_name, tax_rate):
+    """Unsaved Invoice for a sale payload"""
+    invoice = Invoice(
+        customer_id=data['customer_id'],
+        subtotal=to_decimal(data['subtotal']),
+        cash_received=to_decimal(data['cash_received']),
+        change=to_decimal(data['change']),
+        staff_name=staff_name,
+        tax_rate=tax_rate,
+        created_by=user,
+    )
+    if data.get('date_issued'):
+        # Sales queued by an offline terminal keep the time they were rung up
+        date_issued = parse_datetime(str(data['date_issued']))
+        if date_issued is None:
+            raise CheckoutError(f"Invalid date_issued: {data['date_issued']}")
+        if timezone.is_naive(date_issued):
+            date_issued = timezone.make_aware(date_issued)
+        invoice.date_issued = date_issued
+
+    return invoice
+
+
+def build_sold_items(invoice, lines, products):
+    # bulk_create skips SoldItem.save(), so fill in what it would compute
+    return [
+        SoldItem(
+            invoice=invoice,
+            product=products[line['product_id']],
+            product_name=line['product_name'] or products[line['product_id']].product_name,
+            quantity=line['quantity'],
+            unit_price=line['unit_price'],
+            total_price=line['quantity'] * line['unit_price'],
+        )
+        for line in lines
+    ]
+
+
+def process_sale(data, user, staff_name, tax_rate=None, idempotency_key=None, terminal=None):
+    """Record one sale from the cashier payment page.
+
+    The cart is loaded with one ``in_bulk``, stock is decremented with one
+    conditional UPDATE and the sold items are written with one ``bulk_create``,
+    all inside a single transaction, along with the daily sales rollup. The
+    number of queries does not depend on the number of cart lines.
+
+    With an ``idempotency_key`` the sale summary is stored in the same
+    transaction; a duplicate key raises IntegrityError and nothing is written.
+
+    Stock on hold for other carts can't be sold. Units the selling
+    ``terminal`` holds for these products are used by the sale, and its holds
+    on them are released.
+    """
+    lines, quantities = parse_sold_items(data['sold_items'])
+    invoice = build_invoice(data, user, staff_name, tax_rate)
+    # Numbers come from this worker's reserved block, outside the transaction,
+    # so a sale that fails below leaves a gap in the invoice numbers
+    invoice.assign_numbers()
+
+    with transaction.atomic():
+        products = Product.objects.select_for_update().in_bulk(list(quantities))
+        held = held_by(terminal, list(quantities)) if terminal else {}
+
+        for product_id, quantity in quantities.items():
+            product = products.get(product_id)
+            if product is None:
+                raise CheckoutError(f'Product with ID {product_id} does not exist')
+            available = product.available_quantity + held.get(product_id, 0)
+            if available < quantity:
+                raise not_enough_stock(product, quantity, available)
+
+        invoice.save()
+
+        decrement_stock(products, quantities, held)
+        if held:
+            StockHold.objects.filter(terminal=terminal, product_id__in=list(held)).delete()
+
+        sold_items = SoldItem.objects.bulk_create(build_sold_items(invoice, lines, products))
+        add_sales([invoice], sold_items, products)
+
+        if idempotency_key:
+            remember_response(user, idempotency_key, sale_summary(invoice))
+
+    return invoice, sold_items
+
+
+def process_sales_batch(sales, user, staff_name, tax_rate=None):
+    """Record a backlog of sales queued by a terminal that was offline.
+
+    Sales are validated in order against the stock left by the sales before
+    them, and the accepted ones are written together: one ``in_bulk`` for all
+    products, one ``bulk_create`` for the invoices and one for the sold items,
+    and a single conditional stock UPDATE. Query count does not depend on the
+    number of sales.
+
+    Each sale may carry an ``idempotency_key``; keys already recorded (by an
+    earlier batch or by create_invoice) are replayed instead of re-applied.
+    Returns one result dict per sale, in input order.
+    """
+    results = [None] * len(sales)
+    pending = []
+    seen_keys = {}
+
+    for index, data in enumerate(sales):
+        key = data.get('idempotency_key') if isinstance(data, dict) else None
+        key = str(key) if key else None
+        if key and key in seen_keys:
+            # The same sale was queued twice; answer both with one result
+            results[index] = seen_keys[key]
+            continue
+        try:
+            if not isinstance(data, dict):
+                raise CheckoutError('Invalid sale')
+            if key and len(key) > 100:
+                raise CheckoutError('idempotency_key is too long')
+            lines, quantities = parse_sold_items(data.get('sold_items') or [])
+            pending.append((index, key, data, lines, quantities))
+        except (CheckoutError, KeyError) as e:
+            results[index] = {'success': False, 'error': str(e)}
+        if key:
+            seen_keys[key] = index
+
+    keys = [key for _, key, _, _, _ in pending if key]
+    replays = {}
+    if keys:
+        replays = dict(
+            IdempotencyKey.objects
+            .filter(user=user, key__in=keys, created_at__gte=idempotency_cutoff())
+            .values_list('key', 'response')
+        )
+
+    to_apply = []
+    for index, key, data, lines, quantities in pending:
+        if key in replays:
+            results[index] = dict(replays[key], replayed=True)
+            continue
+        try:
+            to_apply.append((index, key, build_invoice(data, user, staff_name, tax_rate), lines, quantities))
+        except (CheckoutError, KeyError) as e:
+            results[index] = {'success': False, 'error': str(e)}
+
+    if to_apply:
+        Invoice.assign_numbers_in_bulk([invoice for _, _, invoice, _, _ in to_apply])
+        product_ids = {product_id for *_, quantities in to_apply for product_id in quantities}
+
+        with transaction.atomic():
+            products = Product.objects.select_for_update().in_bulk(list(product_ids))
+            # Held units belong to open carts; offline sales only get the rest
+            remaining = {product_id: product.available_quantity for product_id, product in products.items()}
+
+            accepted = []
+            for index, key, invoice, lines, quantities in to_apply:
+                try:
+                    for product_id, quantity in quantities.items():
+                        if product_id not in products:
+                            raise CheckoutError(f'Product with ID {product_id} does not exist')
+                        if remaining[product_id] < quantity:
+                            raise not_enough_stock(products[product_id], quantity, remaining[product_id])
+                except CheckoutError as e:
+                    results[index] = {'success': False, 'error': str(e)}
+                    continue
+
+                for product_id, quantity in quantities.items():
+                    remaining[product_id] -= quantity
+                invoice.compute_totals()
+                accepted.append((index, key, invoice, lines))
+
+            if accepted:
+                Invoice.objects.bulk_create([invoice for _, _, invoice, _ in accepted])
+
+                # What the accepted sales took, per product, in one UPDATE
+                sold = {
+                    product_id: products[product_id].available_quantity - quantity
+                    for product_id, quantity in remaining.items()
+                    if quantity != products[product_id].available_quantity
+                }
+                decrement_stock(products, sold)
+
+                sold_items = SoldItem.objects.bulk_create([
+                    sold_item
+                    for _, _, invoice, lines in accepted
+                    for sold_item in build_sold_items(invoice, lines, products)
+                ])
+                add_sales([invoice for _, _, invoice, _ in accepted], sold_items, products)
+
+                stored = []
+                for index, key, invoice, lines in accepted:
+                    results[index] = sale_summary(invoice)
+                    if key:
+                        stored.append(IdempotencyKey(user=user, key=key, response=results[index]))
+                if stored:
+                    IdempotencyKey.objects.filter(created_at__lt=idempotency_cutoff()).delete()
+                    IdempotencyKey.objects.bulk_create(stored)
+
+    # Duplicates inside the batch point at the index of their first copy
+    for index, result in enumerate(results):
+        if isinstance(result, int):
+            results[index] = results[result]
+
+    for index, data in enumerate(sales):
+        results[index] = dict(results[index], index=index)
+        if isinstance(data, dict) and data.get('idempotency_key'):
+            results[index]['idempotency_key'] = str(data['idempotency_key'])
+
+    return results
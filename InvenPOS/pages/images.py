@@ -0,0 +1,101 @@
+# images.py
+import hashlib
+import io
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# Sizes the templates can ask for (see templatetags/product_images.py).
+# Images are cropped to fill the box, like `object-fit: cover` in the grid.
+VARIANT_SIZES = {
+    'thumb': (96, 96),
+    'grid': (320, 192),
+}
+
+# Every size is written in both formats; browsers without WebP get the JPEG
+VARIANT_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+VARIANT_DIR = 'products/variants'
+
+
+def variant_key(size, fmt):
+    return f'{size}.{fmt}'
+
+
+# What a broken, truncated or oversized upload can raise anywhere from
+# opening it to saving the last variant
+IMAGE_ERRORS = (OSError, ValueError, UnidentifiedImageError, Image.DecompressionBombError)
+
+
+def generate_variants(source_name, storage=None):
+    """Write every size/format variant of the image stored at ``source_name``.
+
+    File names are derived from a hash of the source bytes, so regenerating
+    an unchanged image reuses the existing files and a replaced image never
+    collides with a cached copy of the old one. Returns a dict mapping
+    'size.format' to the stored name, or an empty dict if the file is missing
+    or can't be made into variants; the original is then served as it is.
+    Doesn't touch the database, so it can run in a worker process.
+    """
+    storage = storage or default_storage
+    try:
+        with storage.open(source_name, 'rb') as source:
+            data = source.read()
+        return _write_variants(data, storage)
+    except IMAGE_ERRORS:
+        return {}
+
+
+def _write_variants(data, storage):
+    image = Image.open(io.BytesIO(data))
+    image = ImageOps.exif_transpose(image)
+
+    digest = hashlib.sha1(data).hexdigest()[:16]
+    if image.mode not in ('RGB', 'RGBA'):
+        has_alpha = image.mode in ('LA', 'PA') or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    variants = {}
+    for size, box in VARIANT_SIZES.items():
+        resized = ImageOps.fit(image, box, Image.Resampling.LANCZOS)
+        for fmt, (pil_format, options) in VARIANT_FORMATS.items():
+            name = f'{VARIANT_DIR}/{digest}-{size}.{fmt}'
+            if not storage.exists(name):
+                output = resized
+                if pil_format == 'JPEG' and output.mode != 'RGB':
+                    # JPEG has no alpha; flatten onto white like the page background
+                    background = Image.new('RGB', output.size, 'white')
+                    background.paste(output, mask=output.getchannel('A'))
+                    output = background
+                buffer = io.BytesIO()
+                output.save(buffer, pil_format, **options)
+                name = storage.save(name, ContentFile(buffer.getvalue()))
+            variants[variant_key(size, fmt)] = name
+
+    return variants
+
+
+def update_variants(product):
+    """Regenerate the variants of ``product``'s current image and store them"""
+    from .catalog import PRODUCT, record_changes
+    from .models import Product
+
+    variants = generate_variants(product.product_img.name) if product.product_img else {}
+    product.product_img_variants = variants
+    Product.objects.filter(pk=product.pk).update(product_img_variants=variants)
+    record_changes(PRODUCT, [product.pk])
+    return variants
+
+
+def variant_url(image_name, variants, size, fmt='jpg'):
+    """URL of one variant, falling back to the original upload"""
+    name = (variants or {}).get(variant_key(size, fmt))
+    if name:
+        return default_storage.url(name)
+    if image_name:
+        return default_storage.url(image_name)
+    return ''
@@ -0,0 +1,219 @@
+# loadtest.py
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+
+def percentile(sorted_values, pct):
+    """Linear-interpolated percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * pct / 100
+    lower = int(k)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (k - lower)
+
+
+def summarize(latencies, elapsed, errors=0):
+    """Throughput and latency percentiles (in milliseconds) of a load run"""
+    values = sorted(latencies)
+    return {
+        'requests': len(values) + errors,
+        'errors': errors,
+        'throughput': len(values) / elapsed if elapsed else 0.0,
+        'p50': percentile(values, 50) * 1000,
+        'p95': percentile(values, 95) * 1000,
+        'p99': percentile(values, 99) * 1000,
+        'max': (values[-1] if values else 0.0) * 1000,
+    }
+
+
+def format_summary(label, summary):
+    return (
+        f"{label:<36} {summary['requests']:>6} req  {summary['errors']:>4} err  "
+        f"{summary['throughput']:>8.1f} req/s  p50 {summary['p50']:>7.1f} ms  "
+        f"p95 {summary['p95']:>7.1f} ms  p99 {summary['p99']:>7.1f} ms"
+    )
+
+
+def timed_get(url, headers=None, timeout=30):
+    """GET ``url`` and return its latency in seconds, or None on failure"""
+    start = time.perf_counter()
+    try:
+        with urlopen(Request(url, headers=headers or {}), timeout=timeout) as response:
+            response.read()
+    except (HTTPError, URLError, OSError):
+        return None
+    return time.perf_counter() - start
+
+
+@contextmanager
+def kept_busy(url, headers=None):
+    """Keep requesting ``url`` from one thread while the block runs (nothing if ``url`` is empty),
+    the way a manager pulling PDF reports occupies a worker while cashiers keep checking out"""
+    if not url:
+        yield
+        return
+
+    stop = threading.Event()
+
+    def keep_busy():
+        while not stop.is_set():
+            timed_get(url, headers)
+
+    background = threading.Thread(target=keep_busy, daemon=True)
+    background.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        background.join(timeout=60)
+
+
+def http_load(url, total, concurrency, headers=None, background_url=None):
+    """Send ``total`` GET requests to ``url`` from ``concurrency`` threads,
+    while ``background_url`` is kept busy (see kept_busy)"""
+    with kept_busy(background_url, headers):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(lambda _: timed_get(url, headers), range(total)))
+        elapsed = time.perf_counter() - start
+
+    latencies = [result for result in results if result is not None]
+    return summarize(latencies, elapsed, errors=len(results) - len(latencies))
+
+
+# ---------------- CHECKOUT LOAD ----------------
+# Simulated cashiers ringing up sales at the same time, through the test
+# client or against a running server (see the loadtest_checkout command).
+
+def make_cart(rng, products, min_lines, max_lines, max_quantity=3):
+    """Sale payload for a random cart of ``products``, a list of (id, name, price)"""
+    lines = rng.sample(products, rng.randint(min_lines, min(max_lines, len(products))))
+    sold_items = []
+    for product_id, name, price in lines:
+        quantity = rng.randint(1, max_quantity)
+        sold_items.append({
+            'product_id': product_id,
+            'product_name': name,
+            'quantity': quantity,
+            'unit_price': float(price),
+            'total_price': float(price) * quantity,
+        })
+    subtotal = round(sum(item['total_price'] for item in sold_items), 2)
+    cash_received = float(int(subtotal * 1.25) + 1)
+    return {
+        'customer_id': 'CUST-000',
+        'subtotal': subtotal,
+        'cash_received': cash_received,
+        'change': round(cash_received - subtotal, 2),
+        'sold_items': sold_items,
+    }
+
+
+def classify_error(message):
+    message = (message or '').lower()
+    if 'locked' in message:
+        return 'locked'
+    if 'not enough stock' in message:
+        return 'stock'
+    return 'other'
+
+
+def client_checkout(client, url):
+    """Checkout function posting through a Django test ``client``.
+
+    Counts the queries the request runs on this thread's connection.
+    """
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    def checkout(sale):
+        with CaptureQueriesContext(connection) as queries:
+            response = client.post(url, data=json.dumps(sale), content_type='application/json')
+        data = response.json()
+        return data.get('success', False), data.get('error'), len(queries)
+
+    return checkout
+
+
+def http_checkout(url, headers=None, timeout=30):
+    """Checkout function posting to a running server; queries are not known"""
+    headers = dict(headers or {}, **{'Content-Type': 'application/json'})
+
+    def checkout(sale):
+        request = Request(url, data=json.dumps(sale).encode(), headers=headers, method='POST')
+        try:
+            with urlopen(request, timeout=timeout) as response:
+                data = json.loads(response.read())
+        except HTTPError as e:
+            try:
+                data = json.loads(e.read())
+            except ValueError:
+                data = {'error': f'HTTP {e.code}'}
+        except (URLError, OSError) as e:
+            data = {'error': str(e)}
+        return data.get('success', False), data.get('error'), None
+
+    return checkout
+
+
+def checkout_load(checkouts, carts):
+    """Run one thread per cashier; cashier ``i`` calls ``checkouts[i]`` for each of ``carts[i]``.
+
+    Returns the summarize() figures plus error counts by kind and the mean
+    number of queries per successful sale (None if they weren't counted).
+    """
+    from django.db import connection
+
+    lock = threading.Lock()
+    latencies = []
+    errors = {'locked': 0, 'stock': 0, 'other': 0}
+    query_counts = []
+
+    def cashier(index):
+        try:
+            for sale in carts[index]:
+                start = time.perf_counter()
+                success, error, queries = checkouts[index](sale)
+                latency = time.perf_counter() - start
+                with lock:
+                    if success:
+                        latencies.append(latency)
+                        if queries is not None:
+                            query_counts.append(queries)
+                    else:
+                        errors[classify_error(error)] += 1
+        finally:
+            connection.close()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=cashier, args=(index,)) for index in range(len(checkouts))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    summary = summarize(latencies, elapsed, errors=sum(errors.values()))
+    summary.update(
+        locked=errors['locked'],
+        stock_errors=errors['stock'],
+        other_errors=errors['other'],
+        queries_per_sale=sum(query_counts) / len(query_counts) if query_counts else None,
+    )
+    return summary
+
+
+def format_checkout_summary(label, summary):
+    queries = summary['queries_per_sale']
+    return (
+        format_summary(label, summary) + "\n"
+        f"{'':<36} locked {summary['locked']}  out of stock {summary['stock_errors']}  "
+        f"other {summary['other_errors']}  queries/sale "
+        + (f"{queries:.1f}" if queries is not None else 'n/a')
+    )
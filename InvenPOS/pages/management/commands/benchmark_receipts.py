@@ -0,0 +1,74 @@
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from pages.models import Invoice, SoldItem, TaxRate
+from pages.receipts import render_receipt_escpos, render_receipt_text
+from pages.utils import generate_invoice_pdf
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the receipt renderers against each other: the PDF, plain text and ESC/POS. "
+        "Uses a made-up sale unless --invoice is given; nothing is written."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--invoice', type=int, help='ID of an invoice to render instead of a made-up sale')
+        parser.add_argument('--lines', type=int, default=10, help='Lines of the made-up sale')
+        parser.add_argument('--runs', type=int, default=200, help='Renders per renderer')
+
+    def handle(self, *args, **options):
+        if options['invoice']:
+            try:
+                invoice = Invoice.objects.select_related('tax_rate').get(id=options['invoice'])
+            except Invoice.DoesNotExist:
+                raise CommandError(f"No invoice with ID {options['invoice']}")
+            sold_items = list(invoice.sold_items.order_by('id'))
+        else:
+            invoice, sold_items = self.sample_sale(options['lines'])
+
+        renderers = [
+            ('PDF', generate_invoice_pdf),
+            ('text', render_receipt_text),
+            ('ESC/POS', render_receipt_escpos),
+        ]
+        self.stdout.write(f"{'renderer':<10}{'mean ms':>10}{'p95 ms':>10}{'max ms':>10}{'bytes':>10}")
+        for name, render in renderers:
+            timings = []
+            for _ in range(options['runs']):
+                start = time.perf_counter()
+                output = render(invoice, sold_items)
+                timings.append((time.perf_counter() - start) * 1000)
+            timings.sort()
+            p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+            self.stdout.write(
+                f"{name:<10}{statistics.mean(timings):>10.3f}{p95:>10.3f}{timings[-1]:>10.3f}{len(output):>10}"
+            )
+
+    def sample_sale(self, lines):
+        invoice = Invoice(
+            invoice_number='INV-000001',
+            customer_id='CUST-001',
+            staff_name='Cashier',
+            date_issued=timezone.now(),
+            tax_rate=TaxRate(name='VAT', percentage=Decimal('12.00')),
+            subtotal=Decimal(0),
+            cash_received=Decimal(0),
+            change=Decimal(0),
+        )
+        sold_items = []
+        for i in range(lines):
+            quantity, price = 1 + i % 3, Decimal('12.50') + i
+            sold_items.append(SoldItem(
+                product_name=f'Notebook {i} (80 leaves)', quantity=quantity,
+                unit_price=price, total_price=quantity * price,
+            ))
+            invoice.subtotal += quantity * price
+        invoice.compute_totals()
+        invoice.cash_received = (invoice.total_amount + 100).quantize(Decimal('1'))
+        invoice.change = invoice.cash_received - invoice.total_amount
+        return invoice, sold_items
@@ -0,0 +1,46 @@
+import statistics
+import time
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+
+from pages.models import Invoice, PurchaseOrder
+from pages.reports import purchase_report_data, sales_report_data
+from pages.utils import render_detailed_sales_report_pdf, render_purchase_report_pdf, render_sales_report_pdf
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the report PDFs section by section, over all sales and received purchase orders. "
+        "Building is making a section's flowables, layout is placing and drawing them; nothing is written."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=20, help='Renders per report')
+
+    def handle(self, *args, **options):
+        sales = sales_report_data(Invoice.objects.all())
+        reports = [
+            ('sales', render_sales_report_pdf, sales),
+            ('detailed sales', render_detailed_sales_report_pdf, sales),
+            ('purchases', render_purchase_report_pdf,
+             purchase_report_data(PurchaseOrder.objects.filter(status='Received'))),
+        ]
+        for name, render, data in reports:
+            sections = defaultdict(lambda: defaultdict(list))
+            totals = []
+            for _ in range(options['runs']):
+                timings = {}
+                start = time.perf_counter()
+                render(data, None, timings)
+                totals.append((time.perf_counter() - start) * 1000)
+                for section, parts in timings.items():
+                    for part, seconds in parts.items():
+                        sections[section][part].append(seconds * 1000)
+
+            self.stdout.write(f"{name} report: {statistics.mean(totals):.3f} ms mean")
+            self.stdout.write(f"  {'section':<20}{'build ms':>10}{'layout ms':>10}")
+            for section, parts in sections.items():
+                self.stdout.write(
+                    f"  {section:<20}{statistics.mean(parts['build']):>10.3f}{statistics.mean(parts['layout']):>10.3f}"
+                )
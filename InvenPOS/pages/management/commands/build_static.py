@@ -0,0 +1,48 @@
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from pages.staticfiles import ENCODINGS, WEBP_SUFFIX
+
+
+class Command(BaseCommand):
+    help = (
+        "Collect static files into STATIC_ROOT with content-hashed names, minified CSS, "
+        "recompressed images with WebP siblings and .gz/.br siblings of text files, then "
+        "report how many bytes a browser downloads for each."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clear', action='store_true', help='Delete STATIC_ROOT before collecting')
+
+    def handle(self, *args, **options):
+        call_command('collectstatic', interactive=False, clear=options['clear'], verbosity=0)
+
+        originals = total_source = total_served = 0
+        for source, name in sorted(staticfiles_storage.hashed_files.items()):
+            path = staticfiles_storage.path(name)
+            if not os.path.isfile(path):
+                continue
+            # The collected copy is already optimized; measure the original
+            source_size = os.path.getsize(finders.find(source) or staticfiles_storage.path(source))
+            sizes = [os.path.getsize(path)] + [
+                os.path.getsize(path + suffix)
+                for suffix in [suffix for _, suffix in ENCODINGS] + [WEBP_SUFFIX]
+                if os.path.isfile(path + suffix)
+            ]
+            # An empty .webp only marks an image whose WebP wasn't smaller
+            served = min(size for size in sizes if size)
+            originals += 1
+            total_source += source_size
+            total_served += served
+            if options['verbosity'] > 1:
+                self.stdout.write(f"{name:<60} {source_size:>10,} -> {served:>10,} bytes")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{originals} file(s) in {settings.STATIC_ROOT}: {total_source:,} bytes as written, "
+            f"{total_served:,} bytes as served"
+        ))
@@ -0,0 +1,82 @@
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pages.loadtest import (
+    checkout_load, format_checkout_summary, format_summary, http_checkout, http_load, kept_busy, make_cart,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the checkout API on a WSGI and an ASGI deployment of the same database, "
+        "e.g. `gunicorn InvenPOS.wsgi -w 1 -b :8000` against "
+        "`uvicorn InvenPOS.asgi:application --port 8001`. With --sessionid, sales are "
+        "rung up too and really recorded in that database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wsgi', default='http://127.0.0.1:8000', help='Base URL of the WSGI server')
+        parser.add_argument('--asgi', default='http://127.0.0.1:8001', help='Base URL of the ASGI server')
+        parser.add_argument('--requests', type=int, default=500, help='Requests per endpoint')
+        parser.add_argument('--concurrency', type=int, default=20, help='Simultaneous terminals')
+        parser.add_argument('--sales', type=int, default=10,
+                            help='Sales per terminal for the invoice endpoint (needs --sessionid; 0 to skip)')
+        parser.add_argument('--product-id', type=int, help='Also load /api/product/<id>/ (needs --sessionid)')
+        parser.add_argument('--slow-path', default='',
+                            help='Path kept busy in the background during the run, e.g. /sales-reports/print/')
+        parser.add_argument('--sessionid', default='', help='Session cookie of a logged-in user')
+
+    def handle(self, *args, **options):
+        headers = {}
+        if options['sessionid']:
+            headers['Cookie'] = f"sessionid={options['sessionid']}"
+
+        endpoints = [
+            ('tax rate', '/api/default-tax-rate/', '/api/async/default-tax-rate/'),
+        ]
+        if options['product_id']:
+            path = f"/api/product/{options['product_id']}/"
+            endpoints.append(('product lookup', path, path))
+
+        for name, wsgi_path, asgi_path in endpoints:
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{name}:"))
+            for label, base, path in self.servers(options, wsgi_path, asgi_path):
+                summary = http_load(
+                    base + path,
+                    options['requests'],
+                    options['concurrency'],
+                    headers=headers,
+                    background_url=base + options['slow_path'] if options['slow_path'] else None,
+                )
+                self.stdout.write(format_summary(f"  {label} {path}", summary))
+
+        if options['sessionid'] and options['sales']:
+            self.compare_checkout(options, headers)
+
+    def servers(self, options, wsgi_path, asgi_path):
+        for label, base, path in (('WSGI', options['wsgi'], wsgi_path), ('ASGI', options['asgi'], asgi_path)):
+            yield label, base.rstrip('/'), path
+
+    def compare_checkout(self, options, headers):
+        from pages.models import Product
+
+        # Assumes this settings module points at the servers' database
+        products = list(
+            Product.objects.filter(product_quantity__gt=0).values_list('id', 'product_name', 'product_price')
+        )
+        if not products:
+            raise CommandError('No products with stock to sell')
+
+        self.stdout.write(self.style.MIGRATE_HEADING("create invoice:"))
+        for label, base, path in self.servers(options, '/api/create-invoice/', '/api/async/create-invoice/'):
+            # The same carts on both servers, so the runs are comparable
+            rng = random.Random(1)
+            carts = [
+                [make_cart(rng, products, 1, 5) for _ in range(options['sales'])]
+                for _ in range(options['concurrency'])
+            ]
+            checkouts = [http_checkout(base + path, headers) for _ in range(options['concurrency'])]
+            with kept_busy(base + options['slow_path'] if options['slow_path'] else None, headers):
+                summary = checkout_load(checkouts, carts)
+            self.stdout.write(format_checkout_summary(f"  {label} {path}", summary))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from pages.spreadsheets import SpreadsheetError, export_product_rows, stream_csv, write_xlsx
+
+
+class Command(BaseCommand):
+    help = "Write every product as CSV (to stdout by default) or XLSX, in the format import_products reads."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', default='', help='File to write; .xlsx writes a workbook')
+
+    def handle(self, *args, **options):
+        path = options['output']
+        if path.lower().endswith('.xlsx'):
+            try:
+                with open(path, 'wb') as file:
+                    write_xlsx(export_product_rows(), file)
+            except (OSError, SpreadsheetError) as e:
+                raise CommandError(str(e))
+            return
+
+        if not path:
+            for line in stream_csv(export_product_rows()):
+                self.stdout.write(line, ending='')
+            return
+        with open(path, 'w', newline='', encoding='utf-8') as file:
+            file.writelines(stream_csv(export_product_rows()))
@@ -0,0 +1,55 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from pages.catalog import PRODUCT, record_changes
+from pages.images import VARIANT_FORMATS, VARIANT_SIZES, generate_variants, variant_key
+from pages.models import Product
+
+
+def expected_keys():
+    return {variant_key(size, fmt) for size in VARIANT_SIZES for fmt in VARIANT_FORMATS}
+
+
+class Command(BaseCommand):
+    help = "Generate thumbnail, grid and WebP variants for product images that don't have them yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Processes resizing images in parallel')
+        parser.add_argument('--force', action='store_true', help='Regenerate variants for every image')
+        parser.add_argument('--batch-size', type=int, default=200, help='Products saved per UPDATE')
+
+    def handle(self, *args, **options):
+        products = Product.objects.exclude(product_img='').exclude(product_img__isnull=True)
+        keys = expected_keys()
+        todo = [
+            (product_id, image)
+            for product_id, image, variants in products.values_list('id', 'product_img', 'product_img_variants')
+            if options['force'] or set(variants or {}) != keys
+        ]
+        if not todo:
+            self.stdout.write("All product images already have their variants")
+            return
+
+        # Workers only read and write files; the database stays in this process
+        connections.close_all()
+        done = []
+        failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            results = pool.map(generate_variants, [image for _, image in todo], chunksize=4)
+            for (product_id, image), variants in zip(todo, results):
+                if not variants:
+                    failed += 1
+                    self.stderr.write(f"Could not read {image} (product {product_id})")
+                    continue
+                done.append(Product(id=product_id, product_img_variants=variants))
+
+        Product.objects.bulk_update(done, ['product_img_variants'], batch_size=options['batch_size'])
+        record_changes(PRODUCT, [product.id for product in done])
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated variants for {len(done)} image(s) with {options['workers']} worker(s)"
+            + (f", {failed} failed" if failed else "")
+        ))
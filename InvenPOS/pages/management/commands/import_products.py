@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from pages.spreadsheets import SpreadsheetError, import_products, read_product_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Create and update products from a CSV or XLSX price list (columns: id, sku, name, "
+        "category, price, quantity). Rows are matched by id, then by SKU."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or XLSX file')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would change')
+        parser.add_argument('--chunk-size', type=int, default=None,
+                            help='Rows written per transaction (default: PRODUCT_IMPORT_CHUNK_SIZE)')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], 'rb') as file:
+                result = import_products(
+                    read_product_rows(file, options['path']),
+                    dry_run=options['dry_run'],
+                    chunk_size=options['chunk_size'],
+                )
+        except (OSError, SpreadsheetError) as e:
+            raise CommandError(str(e))
+
+        for change in result['changes']:
+            fields = ', '.join(f'{field}: {old} -> {new}' for field, (old, new) in change['fields'].items())
+            self.stdout.write(f"line {change['line']}: {change['action']} {change['product']} ({fields})")
+        for line, message in result['errors']:
+            self.stderr.write(f"line {line}: {message}")
+
+        verb = 'Would create' if result['dry_run'] else 'Created'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {result['created']}, {'update' if result['dry_run'] else 'updated'} {result['updated']}, "
+            f"{result['unchanged']} unchanged, {len(result['errors'])} skipped"
+        ))
@@ -0,0 +1,110 @@
+import random
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+from django.urls import reverse
+
+from pages.loadtest import checkout_load, client_checkout, format_checkout_summary, http_checkout, make_cart
+
+
+class Command(BaseCommand):
+    help = (
+        "Simulate cashiers checking out at the same time and report throughput, latency "
+        "percentiles, 'database is locked' errors and queries per sale. By default the sales "
+        "go through the test client into a throwaway test database; with --url they are "
+        "posted to a running server and really recorded there."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cashiers', type=int, default=8, help='Simultaneous cashiers')
+        parser.add_argument('--sales', type=int, default=50, help='Sales per cashier')
+        parser.add_argument('--cart-size', default='1-8', help='Lines per cart, e.g. 3 or 1-8')
+        parser.add_argument('--products', type=int, default=200, help='Products in the test catalog')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed, so runs are comparable')
+        parser.add_argument('--url', default='',
+                            help='Base URL of a running server, e.g. http://127.0.0.1:8000 (needs --sessionid)')
+        parser.add_argument('--sessionid', default='', help='Session cookie of a logged-in user, for --url')
+
+    def handle(self, *args, **options):
+        try:
+            low, _, high = options['cart_size'].partition('-')
+            min_lines, max_lines = int(low), int(high or low)
+        except ValueError:
+            raise CommandError('--cart-size must look like 5 or 1-8')
+        if not 0 < min_lines <= max_lines:
+            raise CommandError('--cart-size must be at least 1')
+
+        if options['url']:
+            self.run_live(options, min_lines, max_lines)
+        else:
+            self.run_local(options, min_lines, max_lines)
+
+    def make_carts(self, options, products, min_lines, max_lines):
+        rng = random.Random(options['seed'])
+        return [
+            [make_cart(rng, products, min_lines, max_lines) for _ in range(options['sales'])]
+            for _ in range(options['cashiers'])
+        ]
+
+    def run_local(self, options, min_lines, max_lines):
+        from django.contrib.auth.models import User
+        from pages.caches import invalidate_tax_rate
+        from pages.models import Category, Product, TaxRate
+
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            invalidate_tax_rate()
+            TaxRate.objects.create(name='VAT', percentage=Decimal('12.00'))
+            category = Category.objects.create(name='Load test')
+            # Enough stock that every sale can succeed; stock errors mean a bug
+            stock = options['cashiers'] * options['sales'] * 3
+            Product.objects.bulk_create([
+                Product(
+                    product_name=f'Load test product {i}',
+                    product_price=Decimal(random.Random(i).randint(100, 5000)) / 100,
+                    product_quantity=stock,
+                    product_category=category,
+                )
+                for i in range(options['products'])
+            ])
+            products = list(Product.objects.values_list('id', 'product_name', 'product_price'))
+
+            checkouts = []
+            for i in range(options['cashiers']):
+                client = Client()
+                client.force_login(User.objects.create_user(f'loadtest-cashier-{i}'))
+                checkouts.append(client_checkout(client, reverse('pages:create_invoice')))
+
+            summary = checkout_load(checkouts, self.make_carts(options, products, min_lines, max_lines))
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+            invalidate_tax_rate()
+
+        self.report(options, summary)
+
+    def run_live(self, options, min_lines, max_lines):
+        from pages.models import Product
+
+        if not options['sessionid']:
+            raise CommandError('--url needs --sessionid of a logged-in user')
+
+        # Assumes this settings module points at the server's database
+        products = list(
+            Product.objects.filter(product_quantity__gt=0).values_list('id', 'product_name', 'product_price')
+        )
+        if not products:
+            raise CommandError('No products with stock to sell')
+
+        url = options['url'].rstrip('/') + reverse('pages:create_invoice')
+        headers = {'Cookie': f"sessionid={options['sessionid']}"}
+        checkouts = [http_checkout(url, headers) for _ in range(options['cashiers'])]
+
+        self.report(options, checkout_load(checkouts, self.make_carts(options, products, min_lines, max_lines)))
+
+    def report(self, options, summary):
+        label = f"{options['cashiers']} cashiers x {options['sales']} sales, {options['cart_size']} lines"
+        self.stdout.write(format_checkout_summary(label, summary))
@@ -0,0 +1,23 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pages.rollups import rebuild_sales_summary
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily sales rollup from the invoices, e.g. to backfill it or after editing data by hand."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', default='', help='Only rebuild days from this date on (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = datetime.strptime(options['since'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError(f"Invalid date: {options['since']}")
+
+        rows = rebuild_sales_summary(since)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {rows} summary rows'))
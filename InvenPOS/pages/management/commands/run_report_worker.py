@@ -0,0 +1,47 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from pages.report_jobs import (
+    check_in, check_out, clear_old_jobs, report_pool, requeue_stale_jobs, run_jobs, worker_name,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Render queued report PDFs (see pages/report_jobs.py) until stopped, or once with --once. "
+        "Keep one running next to the web server; without one, reports are rendered in the request."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=getattr(settings, 'REPORT_WORKER_PROCESSES', 2),
+                            help='Rendering processes; 0 renders in this process')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds between checks of an empty queue')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        processes = options['processes']
+        pool = report_pool(processes)
+        # Check in well within REPORT_WORKER_TIMEOUT
+        beat = getattr(settings, 'REPORT_WORKER_TIMEOUT', 30) / 3
+        checked_in = 0
+        try:
+            while True:
+                if time.monotonic() - checked_in > beat:
+                    check_in()
+                    checked_in = time.monotonic()
+                requeue_stale_jobs()
+                rendered = run_jobs(pool, limit=max(processes, 1), worker=worker_name())
+                if rendered:
+                    self.stdout.write(f"Processed {rendered} report job(s)")
+                    continue
+                clear_old_jobs()
+                if options['once']:
+                    return
+                time.sleep(options['interval'])
+        finally:
+            check_out()
+            if pool is not None:
+                pool.shutdown()
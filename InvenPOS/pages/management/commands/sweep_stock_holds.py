@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from pages.reservations import sweep_expired_holds
+
+
+class Command(BaseCommand):
+    help = "Return the stock of cart holds that have passed their expiry (see STOCK_HOLD_TTL)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, default=0,
+                            help='Keep running and sweep every N seconds')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Holds returned per transaction')
+
+    def handle(self, *args, **options):
+        while True:
+            swept = sweep_expired_holds(batch_size=options['batch_size'])
+            if swept or not options['interval']:
+                self.stdout.write(f"Returned {swept} expired hold(s)")
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
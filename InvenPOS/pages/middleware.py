@@ -0,0 +1,89 @@
+# middleware.py
+import mimetypes
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+from .staticfiles import ENCODINGS, RECOMPRESSIBLE, WEBP_SUFFIX
+
+# A year; fingerprinted names change whenever their content does
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+class PrecompressedStaticMiddleware:
+    """Serve files collected into STATIC_ROOT before the rest of the stack runs.
+
+    Sends the smallest variant the client accepts: the .br or .gz sibling
+    written at build time (see staticfiles.py), or the .webp sibling of an
+    image. Content-hashed names get a year-long immutable Cache-Control, so
+    repeat visits don't even revalidate them; other names must revalidate.
+    Anything not found in STATIC_ROOT, and everything while DEBUG is on,
+    falls through to the normal handling, e.g. runserver's own static serving.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.root = settings.STATIC_ROOT
+        self.prefix = '/' + settings.STATIC_URL.lstrip('/')
+        self._immutable = None
+
+    def __call__(self, request):
+        # With DEBUG on, runserver serves the files as they are being edited
+        if not settings.DEBUG and self.root and request.method in ('GET', 'HEAD') and request.path.startswith(self.prefix):
+            response = self.serve(request, request.path[len(self.prefix):])
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    def immutable_names(self):
+        if self._immutable is None:
+            self._immutable = set(getattr(staticfiles_storage, 'hashed_files', {}).values())
+        return self._immutable
+
+    def serve(self, request, name):
+        try:
+            path = safe_join(self.root, name)
+        except SuspiciousFileOperation:
+            return None
+        if not os.path.isfile(path):
+            return None
+
+        chosen, encoding, vary = path, None, ['Accept-Encoding']
+        if name.lower().endswith(RECOMPRESSIBLE):
+            vary.append('Accept')
+            webp = path + WEBP_SUFFIX
+            if 'image/webp' in request.headers.get('Accept', '') and os.path.isfile(webp) and os.path.getsize(webp):
+                chosen = webp
+        else:
+            accepted = request.headers.get('Accept-Encoding', '')
+            for candidate, suffix in ENCODINGS:
+                if candidate in accepted and os.path.isfile(path + suffix):
+                    chosen, encoding = path + suffix, candidate
+                    break
+
+        stat = os.stat(chosen)
+        if not was_modified_since(request.headers.get('If-Modified-Since'), stat.st_mtime):
+            response = HttpResponseNotModified()
+        else:
+            if chosen.endswith(WEBP_SUFFIX):
+                content_type = 'image/webp'
+            else:
+                content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+            response = FileResponse(open(chosen, 'rb'), content_type=content_type)
+            if encoding:
+                response['Content-Encoding'] = encoding
+
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        patch_vary_headers(response, vary)
+        if name in self.immutable_names():
+            response['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+        else:
+            response['Cache-Control'] = 'no-cache'
+        return response
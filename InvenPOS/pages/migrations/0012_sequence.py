@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:28
+
+from django.db import migrations, models
+
+
+def last_number(values):
+    numbers = [0]
+    for value in values:
+        try:
+            numbers.append(int(value.split('-')[-1]))
+        except (AttributeError, ValueError):
+            pass
+    return max(numbers)
+
+
+def seed_sequences(apps, schema_editor):
+    Invoice = apps.get_model('pages', 'Invoice')
+    Sequence = apps.get_model('pages', 'Sequence')
+
+    invoices = Invoice.objects.all()
+    Sequence.objects.create(
+        name='invoice_number',
+        value=last_number(invoices.values_list('invoice_number', flat=True)),
+    )
+    Sequence.objects.create(
+        name='customer_id',
+        value=last_number(invoices.exclude(customer_id='CUST-000').values_list('customer_id', flat=True)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pages', '0011_purchaseorder_purchaseitem'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Sequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(seed_sequences, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pages', '0013_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='reserved_quantity',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='StockHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('terminal', models.CharField(max_length=100)),
+                ('quantity', models.PositiveIntegerField(default=0)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to='pages.product')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('terminal', 'product'), name='unique_hold_per_terminal_product')],
+            },
+        ),
+    ]
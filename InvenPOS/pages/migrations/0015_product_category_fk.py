@@ -0,0 +1,58 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def names_to_categories(apps, schema_editor):
+    Category = apps.get_model('pages', 'Category')
+    Product = apps.get_model('pages', 'Product')
+
+    names = (
+        Product.objects.exclude(product_category='')
+        .values_list('product_category', flat=True).distinct()
+    )
+    for name in names:
+        # Products may name a category that was renamed or deleted since
+        category, _ = Category.objects.get_or_create(name=name)
+        Product.objects.filter(product_category=name).update(category=category)
+
+
+def categories_to_names(apps, schema_editor):
+    Category = apps.get_model('pages', 'Category')
+    Product = apps.get_model('pages', 'Product')
+
+    for category in Category.objects.all():
+        Product.objects.filter(category=category).update(product_category=category.name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pages', '0014_stockhold'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='category',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='products', to='pages.category'),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='product_category',
+            field=models.CharField(blank=True, default='', max_length=50),
+        ),
+        migrations.RunPython(names_to_categories, categories_to_names),
+        migrations.RemoveField(
+            model_name='product',
+            name='product_category',
+        ),
+        migrations.RenameField(
+            model_name='product',
+            old_name='category',
+            new_name='product_category',
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['product_category', 'id'], name='product_category_id_idx'),
+        ),
+    ]
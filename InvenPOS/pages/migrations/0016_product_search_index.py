@@ -0,0 +1,74 @@
+from django.db import migrations
+
+# Full-text index over what a cashier types to find a product. rowid is the
+# product id. The triggers only fire on the searchable columns, so stock
+# updates at checkout never touch the index.
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE pages_product_fts USING fts5(
+        product_name, category,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '1 2 3'
+    )
+    """,
+    """
+    INSERT INTO pages_product_fts (rowid, product_name, category)
+    SELECT p.id, p.product_name, COALESCE(c.name, '')
+    FROM pages_product p LEFT JOIN pages_category c ON c.id = p.product_category_id
+    """,
+    """
+    CREATE TRIGGER pages_product_fts_insert AFTER INSERT ON pages_product BEGIN
+        INSERT INTO pages_product_fts (rowid, product_name, category)
+        VALUES (new.id, new.product_name,
+                COALESCE((SELECT name FROM pages_category WHERE id = new.product_category_id), ''));
+    END
+    """,
+    """
+    CREATE TRIGGER pages_product_fts_update AFTER UPDATE OF product_name, product_category_id ON pages_product BEGIN
+        DELETE FROM pages_product_fts WHERE rowid = old.id;
+        INSERT INTO pages_product_fts (rowid, product_name, category)
+        VALUES (new.id, new.product_name,
+                COALESCE((SELECT name FROM pages_category WHERE id = new.product_category_id), ''));
+    END
+    """,
+    """
+    CREATE TRIGGER pages_product_fts_delete AFTER DELETE ON pages_product BEGIN
+        DELETE FROM pages_product_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER pages_category_fts_rename AFTER UPDATE OF name ON pages_category BEGIN
+        UPDATE pages_product_fts SET category = new.name
+        WHERE rowid IN (SELECT id FROM pages_product WHERE product_category_id = new.id);
+    END
+    """,
+]
+
+DROP_SQL = [
+    'DROP TRIGGER IF EXISTS pages_category_fts_rename',
+    'DROP TRIGGER IF EXISTS pages_product_fts_delete',
+    'DROP TRIGGER IF EXISTS pages_product_fts_update',
+    'DROP TRIGGER IF EXISTS pages_product_fts_insert',
+    'DROP TABLE IF EXISTS pages_product_fts',
+]
+
+
+def run_sql(statements):
+    def run(apps, schema_editor):
+        # FTS5 is SQLite only; other backends fall back to icontains (search.py)
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pages', '0015_product_category_fk'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_sql(CREATE_SQL), run_sql(DROP_SQL)),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pages', '0016_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='product_img_variants',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,71 @@
+from importlib import import_module
+
+from django.db import migrations, models
+
+# SQLite adds a unique column by rebuilding pages_product, which would drop
+# the search triggers on it and break the one on pages_category. The index
+# is dropped first and rebuilt afterwards, now with the SKU searchable too.
+search_index_0016 = import_module('pages.migrations.0016_product_search_index')
+
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE pages_product_fts USING fts5(
+        product_name, category, sku,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '1 2 3'
+    )
+    """,
+    """
+    INSERT INTO pages_product_fts (rowid, product_name, category, sku)
+    SELECT p.id, p.product_name, COALESCE(c.name, ''), COALESCE(p.sku, '')
+    FROM pages_product p LEFT JOIN pages_category c ON c.id = p.product_category_id
+    """,
+    """
+    CREATE TRIGGER pages_product_fts_insert AFTER INSERT ON pages_product BEGIN
+        INSERT INTO pages_product_fts (rowid, product_name, category, sku)
+        VALUES (new.id, new.product_name,
+                COALESCE((SELECT name FROM pages_category WHERE id = new.product_category_id), ''),
+                COALESCE(new.sku, ''));
+    END
+    """,
+    """
+    CREATE TRIGGER pages_product_fts_update AFTER UPDATE OF product_name, product_category_id, sku ON pages_product BEGIN
+        DELETE FROM pages_product_fts WHERE rowid = old.id;
+        INSERT INTO pages_product_fts (rowid, product_name, category, sku)
+        VALUES (new.id, new.product_name,
+                COALESCE((SELECT name FROM pages_category WHERE id = new.product_category_id), ''),
+                COALESCE(new.sku, ''));
+    END
+    """,
+    """
+    CREATE TRIGGER pages_product_fts_delete AFTER DELETE ON pages_product BEGIN
+        DELETE FROM pages_product_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER pages_category_fts_rename AFTER UPDATE OF name ON pages_category BEGIN
+        UPDATE pages_product_fts SET category = new.name
+        WHERE rowid IN (SELECT id FROM pages_product WHERE product_category_id = new.id);
+    END
+    """,
+]
+
+DROP_SQL = search_index_0016.DROP_SQL
+run_sql = search_index_0016.run_sql
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pages', '0017_product_img_variants'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_sql(DROP_SQL), run_sql(search_index_0016.CREATE_SQL)),
+        migrations.AddField(
+            model_name='product',
+            name='sku',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+        migrations.RunPython(run_sql(CREATE_SQL), run_sql(DROP_SQL)),
+    ]
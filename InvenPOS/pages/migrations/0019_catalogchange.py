@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pages', '0018_product_sku'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('product', 'Product'), ('category', 'Category')], max_length=10)),
+                ('object_id', models.IntegerField()),
+                ('version', models.BigIntegerField(db_index=True)),
+                ('deleted', models.BooleanField(default=False)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('kind', 'object_id'), name='unique_catalog_change_per_object')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pages', '0019_catalogchange'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySalesSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('cashier', models.CharField(max_length=100)),
+                ('category', models.CharField(blank=True, max_length=100)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('tax', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('transactions', models.IntegerField(default=0)),
+                ('units', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'cashier', 'category'), name='unique_daily_sales_summary')],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pages', '0021_reportjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportWorker',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('seen_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pages', '0022_reportworker'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reportjob',
+            name='worker',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+    ]
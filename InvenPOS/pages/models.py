@@ -1,17 +1,65 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
+from .sequences import invoice_numbers, customer_numbers
 
+def normalize_sku(code):
+    """How SKUs and scanned barcodes are stored and compared"""
+    return (code or '').strip().upper()
+
+
+# On SQLite, products are full-text indexed by triggers on this table and
+# on Category (migrations 0016 and 0018). A migration that makes SQLite
+# rebuild pages_product (most AlterField/RemoveField operations, or adding a
+# unique column) drops them: recreate them in that migration, as 0018 does.
 class Product(models.Model):
     product_name = models.CharField(max_length=100)
+    # Barcode or SKU; NULL for products without one (the unique index allows many)
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True)
     product_price = models.DecimalField(max_digits=10, decimal_places=2)
     product_quantity = models.IntegerField(default=0)
-    product_category = models.CharField(max_length=50)
+    # Units held by open carts (StockHold), kept in step by reservations.py
+    reserved_quantity = models.IntegerField(default=0)
+    # Indexed together with id below, which also serves category lookups
+    product_category = models.ForeignKey(
+        'Category', on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='products', db_index=False,
+    )
     product_img = models.ImageField(upload_to='products/', blank=True, null=True)
+    # Resized copies of product_img by 'size.format', written by images.py
+    product_img_variants = models.JSONField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product_category', 'id'], name='product_category_id_idx'),
+        ]
+
+    @property
+    def available_quantity(self):
+        return max(self.product_quantity - self.reserved_quantity, 0)
+
+    def save(self, *args, **kwargs):
+        self.sku = normalize_sku(self.sku) or None
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.product_name
 
+class StockHold(models.Model):
+    """Units set aside for the cart on one terminal until expires_at"""
+    terminal = models.CharField(max_length=100)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='holds')
+    quantity = models.PositiveIntegerField(default=0)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['terminal', 'product'], name='unique_hold_per_terminal_product'),
+        ]
+
+    def __str__(self):
+        return f"{self.terminal}: {self.product_id} x{self.quantity}"
+
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
 
@@ -51,6 +99,40 @@ class TaxRate(models.Model):
 
 
 
+class Sequence(models.Model):
+    """Named counter used to allocate invoice numbers and customer IDs"""
+    name = models.CharField(max_length=50, unique=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} = {self.value}"
+
+
+class CatalogChange(models.Model):
+    """The catalog version in which a product or category last changed.
+
+    One row per object, overwritten on every change, so the table never grows
+    past the size of the catalog. Deleted objects keep their row as a
+    tombstone so terminals hear about the deletion too.
+    """
+    PRODUCT = 'product'
+    CATEGORY = 'category'
+    KIND_CHOICES = [(PRODUCT, 'Product'), (CATEGORY, 'Category')]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.IntegerField()
+    version = models.BigIntegerField(db_index=True)
+    deleted = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='unique_catalog_change_per_object'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id} @ {self.version}"
+
+
 # models.py - Add this to your existing models
 class Invoice(models.Model):
     invoice_number = models.CharField(max_length=20, unique=True)
@@ -68,48 +150,53 @@ class Invoice(models.Model):
     staff_name = models.CharField(max_length=100, default='Cashier')
     is_active = models.BooleanField(default=True)  # For soft delete
 
-    def save(self, *args, **kwargs):
-        if not self.invoice_number:
-            last_invoice = Invoice.objects.order_by('-id').first()
-            if last_invoice:
-                try:
-                    last_number = int(last_invoice.invoice_number.split('-')[-1])
-                    new_number = last_number + 1
-                except:
-                    new_number = 1
-            else:
-                new_number = 1
-            self.invoice_number = f"INV-{new_number:06d}"
-        
-        if self.customer_id == 'CUST-000':
-            last_customer = Invoice.objects.exclude(customer_id='CUST-000').order_by('-id').first()
-            if last_customer:
-                try:
-                    last_cust_number = int(last_customer.customer_id.split('-')[-1])
-                    new_cust_number = last_cust_number + 1
-                except:
-                    new_cust_number = 1
-            else:
-                new_cust_number = 1
-            self.customer_id = f"CUST-{new_cust_number:03d}"
+    def assign_numbers(self):
+        """Give the invoice its INV-/CUST- numbers from the block allocators.
+
+        Call this before opening a transaction when possible, so the worker
+        can serve the number from its reserved block.
+        """
+        Invoice.assign_numbers_in_bulk([self])
+
+    @classmethod
+    def assign_numbers_in_bulk(cls, invoices):
+        """Same as assign_numbers() for many invoices, reserving all numbers at once"""
+        need_number = [invoice for invoice in invoices if not invoice.invoice_number]
+        for invoice, number in zip(need_number, invoice_numbers.take(len(need_number))):
+            invoice.invoice_number = f"INV-{number:06d}"
         
+        need_customer = [invoice for invoice in invoices if invoice.customer_id == 'CUST-000']
+        for invoice, number in zip(need_customer, customer_numbers.take(len(need_customer))):
+            invoice.customer_id = f"CUST-{number:03d}"
+
+    def compute_totals(self):
+        """Fill tax_amount and total_amount from the subtotal and tax rate"""
         if self.tax_rate and self.subtotal > 0:
             self.tax_amount = self.subtotal * (self.tax_rate.percentage / 100)
             self.total_amount = self.subtotal + self.tax_amount
         else:
             self.tax_amount = 0
             self.total_amount = self.subtotal
-        
+
+    def save(self, *args, **kwargs):
+        self.assign_numbers()
+        self.compute_totals()
         super().save(*args, **kwargs)
 
     def delete(self, *args, **kwargs):
         """Soft delete - mark as inactive instead of actually deleting"""
-        self.is_active = False
-        self.save()
+        from .rollups import updating_sales
+
+        with updating_sales(self):
+            self.is_active = False
+            self.save()
 
     def hard_delete(self, *args, **kwargs):
         """Actual delete from database"""
-        super().delete(*args, **kwargs)
+        from .rollups import updating_sales
+
+        with updating_sales(self):
+            super().delete(*args, **kwargs)
 
     def __str__(self):
         return f"Invoice #{self.invoice_number} - {self.customer_id}"
@@ -141,6 +228,93 @@ class SoldItem(models.Model):
 
 
 
+class DailySalesSummary(models.Model):
+    """Sales of one day by one cashier in one product category.
+
+    Kept up to date as invoices are created, edited and soft-deleted (see
+    rollups.py), so dashboards read these rows instead of every invoice.
+    ``category`` is the category name at the time of sale; the row with an
+    empty category holds whole invoices (subtotal, tax, one transaction each).
+    """
+    day = models.DateField()
+    cashier = models.CharField(max_length=100)
+    category = models.CharField(max_length=100, blank=True)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    tax = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    transactions = models.IntegerField(default=0)
+    units = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'cashier', 'category'], name='unique_daily_sales_summary'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.cashier} {self.category or 'all'}: {self.revenue}"
+
+
+class ReportJob(models.Model):
+    """A report PDF to be rendered by `manage.py run_report_worker` (see report_jobs.py).
+
+    ``key`` hashes the kind and normalized filters, so asking again for the
+    same report reuses a queued job or a recently finished file.
+    """
+    SALES = 'sales'
+    PURCHASES = 'purchases'
+    KIND_CHOICES = [(SALES, 'Sales'), (PURCHASES, 'Purchases')]
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    filters = models.JSONField(default=dict)
+    key = models.CharField(max_length=64, db_index=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING, db_index=True)
+    file = models.FileField(upload_to='reports/', blank=True)
+    error = models.TextField(blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # ReportWorker.name of the worker rendering it; blank when a request does
+    worker = models.CharField(max_length=100, blank=True)
+
+    def __str__(self):
+        return f"{self.kind} report #{self.pk} ({self.status})"
+
+
+class ReportWorker(models.Model):
+    """A running `manage.py run_report_worker` and when it last checked in.
+
+    Without a recent one nothing would render queued reports, so they are
+    rendered in the request instead (see report_jobs.worker_running()).
+    """
+    name = models.CharField(max_length=100, unique=True)
+    seen_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.name} (seen {self.seen_at})"
+
+
+class IdempotencyKey(models.Model):
+    """Response of a create_invoice call, replayed when the client retries with the same key"""
+    key = models.CharField(max_length=100)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+    response = models.JSONField()
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_key_per_user'),
+        ]
+
+    def __str__(self):
+        return self.key
+
+
 class PurchaseOrder(models.Model):
     supplier_name = models.CharField(max_length=100)
     expected_date = models.DateField()
@@ -0,0 +1,199 @@
+# receipts.py
+import hashlib
+import json
+import logging
+import socket
+import threading
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from .utils import generate_invoice_pdf
+
+# Bump when generate_invoice_pdf() changes how receipts look, so receipts
+# cached by the old layout are rendered again
+RECEIPT_LAYOUT_VERSION = 1
+
+RECEIPT_DIR = 'receipts'
+
+# ESC/POS commands (Epson's, which most thermal printers understand)
+ESC_INIT = b'\x1b@'
+ESC_ALIGN = b'\x1ba'        # + 0 left, 1 centre
+ESC_BOLD = b'\x1bE'         # + 0 off, 1 on
+GS_SIZE = b'\x1d!'          # + 0 normal, 0x01 double height
+GS_FEED_AND_CUT = b'\x1dVB\x03'  # feed 3 lines, then partial cut
+
+# Line styles of receipt_lines()
+TITLE = 'title'
+CENTER = 'center'
+
+logger = logging.getLogger(__name__)
+
+
+def receipt_key(invoice, sold_items):
+    """Hash of everything printed on the receipt of ``invoice``.
+
+    Any change to the invoice or its items gives a new key, so a cached
+    receipt can never be served for content it doesn't show.
+    """
+    content = [
+        RECEIPT_LAYOUT_VERSION,
+        invoice.invoice_number,
+        invoice.date_issued.isoformat(),
+        invoice.staff_name,
+        invoice.customer_id,
+        str(invoice.tax_rate.percentage) if invoice.tax_rate else None,
+        *(str(value) for value in (
+            invoice.subtotal, invoice.tax_amount, invoice.total_amount, invoice.cash_received, invoice.change,
+        )),
+        [[item.product_name, item.quantity, str(item.unit_price), str(item.total_price)] for item in sold_items],
+    ]
+    return hashlib.sha256(json.dumps(content).encode()).hexdigest()
+
+
+def receipt_name(invoice_id, key):
+    return f'{RECEIPT_DIR}/{invoice_id}/{key}.pdf'
+
+
+def cached_receipt(invoice, sold_items, key=None, storage=None):
+    """Storage name of the receipt PDF of ``invoice``, rendering it only if it isn't stored yet"""
+    storage = storage or default_storage
+    name = receipt_name(invoice.pk, key or receipt_key(invoice, sold_items))
+    if not storage.exists(name):
+        stored = storage.save(name, ContentFile(generate_invoice_pdf(invoice, sold_items)))
+        if stored != name:
+            # Another request stored it first
+            storage.delete(stored)
+    return name
+
+
+def clear_receipts(invoice_id, storage=None):
+    """Delete the stored receipts of an invoice, e.g. after it was edited"""
+    storage = storage or default_storage
+    directory = f'{RECEIPT_DIR}/{invoice_id}'
+    try:
+        _, files = storage.listdir(directory)
+    except FileNotFoundError:
+        return
+    for filename in files:
+        storage.delete(f'{directory}/{filename}')
+
+
+# ---------------- THERMAL PRINTERS ----------------
+
+def _amount_line(label, amount, columns):
+    amount = f'{amount:.2f}'
+    return label + amount.rjust(columns - len(label))
+
+
+def receipt_lines(invoice, sold_items, columns=None):
+    """The receipt of ``invoice`` as (text, style) lines for a ``columns``-wide printer.
+
+    The same content as generate_invoice_pdf(), laid out in characters
+    rather than points; ``style`` is TITLE, CENTER or None for a plain
+    left-aligned line. Shared by the text and ESC/POS renderers.
+    """
+    columns = columns or getattr(settings, 'RECEIPT_COLUMNS', 48)
+    double_rule, rule = '=' * columns, '-' * columns
+    description_width = columns - 3 - 1 - 1 - 10
+
+    lines = [
+        (double_rule, None),
+        ('STOCKSMART', TITLE),
+        ('SCHOOL SUPPLIES', TITLE),
+        (double_rule, None),
+        ('STORE: 01234', None),
+        (f"DATE: {invoice.date_issued.strftime('%m/%d/%Y %I:%M%p')}", None),
+        (f'TRANS#: {invoice.invoice_number}', None),
+        (f'CASHIER: {invoice.staff_name}', None),
+        (f'CUSTOMER: {invoice.customer_id}', None),
+        (rule, None),
+        (f"QTY {'DESCRIPTION'.ljust(description_width)} {'AMOUNT'.rjust(10)}", None),
+        (rule, None),
+    ]
+    for item in sold_items:
+        description = item.product_name[:description_width].ljust(description_width)
+        lines.append((f'{str(item.quantity).rjust(3)} {description} {item.total_price:10.2f}', None))
+        if item.quantity > 1:
+            lines.append((f'    @ {item.unit_price:.2f} each', None))
+
+    lines += [(rule, None), (_amount_line('SUB-TOTAL:', invoice.subtotal, columns), None)]
+    if invoice.tax_rate:
+        lines.append((_amount_line(f'TAX: {invoice.tax_rate.percentage}%', invoice.tax_amount, columns), None))
+    lines += [
+        (_amount_line('TOTAL:', invoice.total_amount, columns), None),
+        (rule, None),
+        (_amount_line('CASH RECEIVED:', invoice.cash_received, columns), None),
+        (_amount_line('CHANGE:', invoice.change, columns), None),
+        (double_rule, None),
+        ('', None),
+        ('THANK YOU FOR SHOPPING AT', CENTER),
+        ('STOCKSMART!', CENTER),
+        ('', None),
+        ('** 7-DAY RETURN POLICY **', CENTER),
+        ('WITH ORIGINAL RECEIPT', CENTER),
+        ('', None),
+        ('VISIT US AGAIN SOON!', CENTER),
+        (double_rule, None),
+        (f'REF#: {invoice.invoice_number}', CENTER),
+        ('TERMINAL: POS001', CENTER),
+        (f"TIME: {invoice.date_issued.strftime('%H:%M:%S')}", CENTER),
+    ]
+    return lines
+
+
+def render_receipt_text(invoice, sold_items, columns=None):
+    """The receipt as plain text, e.g. for printers driven by the OS spooler"""
+    columns = columns or getattr(settings, 'RECEIPT_COLUMNS', 48)
+    return '\n'.join(
+        text.center(columns).rstrip() if style else text
+        for text, style in receipt_lines(invoice, sold_items, columns)
+    ) + '\n'
+
+
+def render_receipt_escpos(invoice, sold_items, columns=None):
+    """The receipt as an ESC/POS byte stream, ready to send to a thermal printer as is.
+
+    The printer does the centring and emphasis; the stream ends with a feed
+    and a partial cut. Text is encoded in code page 437, the printers' default.
+    """
+    output = [ESC_INIT]
+    current = None
+    for text, style in receipt_lines(invoice, sold_items, columns):
+        if style != current:
+            output += [
+                ESC_ALIGN, b'\x01' if style else b'\x00',
+                ESC_BOLD, b'\x01' if style == TITLE else b'\x00',
+                GS_SIZE, b'\x01' if style == TITLE else b'\x00',
+            ]
+            current = style
+        output += [text.encode('cp437', errors='replace'), b'\n']
+    output.append(GS_FEED_AND_CUT)
+    return b''.join(output)
+
+
+def send_to_printer(data, address=None, timeout=None):
+    """Send raw bytes to a network receipt printer (RECEIPT_PRINTER, "host:port", usually port 9100)"""
+    host, _, port = (address or settings.RECEIPT_PRINTER).rpartition(':')
+    timeout = timeout or getattr(settings, 'RECEIPT_PRINTER_TIMEOUT', 3)
+    with socket.create_connection((host, int(port)), timeout=timeout) as connection:
+        connection.sendall(data)
+
+
+def print_receipt(invoice, sold_items):
+    """Print the receipt of a sale just recorded on RECEIPT_PRINTER, without holding up the response.
+
+    Rendering takes well under a millisecond; the bytes are sent from a
+    background thread so a slow or switched-off printer never delays the
+    checkout. Failures are logged.
+    """
+    data = render_receipt_escpos(invoice, sold_items)
+
+    def send():
+        try:
+            send_to_printer(data)
+        except (OSError, ValueError):
+            logger.exception('Could not print the receipt of invoice %s', invoice.invoice_number)
+
+    threading.Thread(target=send, daemon=True).start()
@@ -0,0 +1,261 @@
+# report_jobs.py
+import hashlib
+import json
+import multiprocessing
+import os
+import socket
+import tempfile
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.core.files import File
+from django.db.models import Q
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import ReportJob, ReportWorker
+from .reports import (
+    filter_invoices, filter_purchase_orders, parse_day, purchase_report_data, sales_filters, sales_report_data,
+)
+from .utils import render_detailed_sales_report_pdf, render_purchase_report_pdf, render_sales_report_pdf
+
+SALES = ReportJob.SALES
+PURCHASES = ReportJob.PURCHASES
+
+# Filters each kind of report takes, by their request.GET names; "detailed"
+# asks for every invoice rather than the latest ten
+FILTER_NAMES = {
+    SALES: ('date_from', 'date_to', 'cashier', 'customer_id', 'invoice_number', 'detailed'),
+    PURCHASES: ('search', 'date_from', 'date_to', 'supplier'),
+}
+
+
+def normalize_filters(kind, params):
+    """The filters in ``params`` that change a ``kind`` report, normalized so
+    equal reports get equal keys: stripped, dates as YYYY-MM-DD, and blank
+    values ("None" included, as old links have it) and invalid dates dropped.
+    """
+    filters = {}
+    for name in FILTER_NAMES[kind]:
+        value = (params.get(name) or '').strip()
+        if name.startswith('date_'):
+            day = parse_day(value)
+            value = day.isoformat() if day else ''
+        if value and value != 'None':
+            filters[name] = value
+    return filters
+
+
+def job_key(kind, filters):
+    return hashlib.sha256(json.dumps([kind, filters], sort_keys=True).encode()).hexdigest()
+
+
+def enqueue_report(kind, params, user=None):
+    """The job that will render (or has just rendered) the ``kind`` report for ``params``.
+
+    A queued or running job for the same report is shared, and a finished
+    one is reused for REPORT_CACHE_TTL seconds; otherwise a new job is queued.
+    """
+    filters = normalize_filters(kind, params)
+    key = job_key(kind, filters)
+    fresh = timezone.now() - timedelta(seconds=getattr(settings, 'REPORT_CACHE_TTL', 600))
+    job = (
+        ReportJob.objects.filter(key=key)
+        .filter(Q(status__in=[ReportJob.PENDING, ReportJob.RUNNING]) | Q(status=ReportJob.DONE, finished_at__gte=fresh))
+        .order_by('-id')
+        .first()
+    )
+    if job is None:
+        job = ReportJob.objects.create(kind=kind, filters=filters, key=key, created_by=user)
+    return job
+
+
+def job_status(job):
+    """What the polling endpoint reports about ``job``"""
+    return {
+        'success': job.status != ReportJob.FAILED,
+        'job_id': job.pk,
+        'status': job.status,
+        'error': job.error,
+        'url': reverse('pages:report_job', args=[job.pk]),
+    }
+
+
+# ---------------- WORKER ----------------
+
+def report_pool(processes):
+    """A process pool for rendering, or None to render in this process.
+
+    Children are spawned, not forked: they are only started at the first
+    submit, by when this process has database connections open again, and
+    a forked child would inherit them. Each sets Django up afresh instead.
+    """
+    if not processes:
+        return None
+    return ProcessPoolExecutor(
+        max_workers=processes, mp_context=multiprocessing.get_context('spawn'), initializer=django.setup
+    )
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def check_in(name=None):
+    """Record that the worker ``name`` (this process by default) is running"""
+    ReportWorker.objects.update_or_create(name=name or worker_name(), defaults={'seen_at': timezone.now()})
+
+
+def check_out(name=None):
+    ReportWorker.objects.filter(name=name or worker_name()).delete()
+
+
+def worker_running():
+    """Whether a worker checked in within REPORT_WORKER_TIMEOUT seconds, or is rendering a job now.
+
+    A worker busy with a long report doesn't check in until it is done, so
+    a job it claimed counts too, until REPORT_JOB_TIMEOUT gives up on it.
+    Jobs a request is rendering itself (no worker) don't: nothing would
+    pick up the next report while that request is busy.
+    """
+    now = timezone.now()
+    seen = now - timedelta(seconds=getattr(settings, 'REPORT_WORKER_TIMEOUT', 30))
+    started = now - timedelta(seconds=getattr(settings, 'REPORT_JOB_TIMEOUT', 600))
+    return (
+        ReportWorker.objects.filter(seen_at__gte=seen).exists()
+        or ReportJob.objects.filter(
+            status=ReportJob.RUNNING, started_at__gte=started,
+            worker__in=ReportWorker.objects.values('name'),
+        ).exists()
+    )
+
+
+def claim(job, worker=''):
+    """Mark ``job`` as running for ``worker`` if it is still pending, with a
+    conditional UPDATE so several workers can share the queue without
+    rendering a job twice"""
+    now = timezone.now()
+    claimed = ReportJob.objects.filter(pk=job.pk, status=ReportJob.PENDING).update(
+        status=ReportJob.RUNNING, started_at=now, worker=worker
+    )
+    if claimed:
+        job.status, job.started_at, job.worker = ReportJob.RUNNING, now, worker
+        return True
+    return False
+
+
+def claim_jobs(limit, worker=''):
+    """Mark up to ``limit`` pending jobs as running for ``worker``, oldest first, and return them"""
+    return [
+        job for job in ReportJob.objects.filter(status=ReportJob.PENDING).order_by('id')[:limit]
+        if claim(job, worker)
+    ]
+
+
+def requeue_stale_jobs():
+    """Put jobs back in the queue whose worker stopped before finishing them"""
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings, 'REPORT_JOB_TIMEOUT', 600))
+    return ReportJob.objects.filter(status=ReportJob.RUNNING, started_at__lt=cutoff).update(
+        status=ReportJob.PENDING, started_at=None, worker=''
+    )
+
+
+def gather(job):
+    """The renderer for ``job`` and the data it needs, read from the database here.
+
+    Renderers take plain data, so the layout (the slow part) runs in the
+    pool without a database connection; only the detailed sales report
+    reads its invoices there, as it lays them out.
+    """
+    if job.kind == SALES:
+        render = render_detailed_sales_report_pdf if job.filters.get('detailed') else render_sales_report_pdf
+        return render, sales_report_data(filter_invoices(sales_filters(job.filters)))
+    return render_purchase_report_pdf, purchase_report_data(filter_purchase_orders(job.filters))
+
+
+def render_to_file(render, data, filters):
+    """Run ``render`` into a temporary file and return its path, for the caller to move and delete.
+
+    Only the path comes back from the pool, not the PDF, so the worker
+    never holds a copy of it.
+    """
+    descriptor, path = tempfile.mkstemp(prefix='report-', suffix='.pdf')
+    os.close(descriptor)
+    try:
+        return render(data, filters, output=path)
+    except BaseException:
+        os.remove(path)
+        raise
+
+
+def _submit(pool, function, *args):
+    if pool is not None:
+        return pool.submit(function, *args)
+    future = Future()
+    try:
+        future.set_result(function(*args))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+def run_jobs(pool=None, limit=1, worker=''):
+    """Render up to ``limit`` queued jobs for ``worker``, in ``pool`` if given,
+    and return how many were taken"""
+    jobs = claim_jobs(limit, worker)
+    render_jobs(jobs, pool)
+    return len(jobs)
+
+
+def render_now(job):
+    """Render ``job`` in this request, unless something else already took it"""
+    if claim(job):
+        render_jobs([job])
+    job.refresh_from_db()
+    return job
+
+
+def render_jobs(jobs, pool=None):
+    """Render claimed ``jobs``, in ``pool`` if given, and store their files or errors"""
+    rendering = []
+    for job in jobs:
+        try:
+            render, data = gather(job)
+        except Exception as e:
+            fail_job(job, e)
+            continue
+        rendering.append((job, _submit(pool, render_to_file, render, data, job.filters)))
+
+    for job, future in rendering:
+        try:
+            path = future.result()
+        except Exception as e:
+            fail_job(job, e)
+            continue
+        try:
+            # Storage copies it over in chunks
+            with open(path, 'rb') as pdf:
+                job.file.save(f'{job.kind}-report-{job.pk}.pdf', File(pdf), save=False)
+        finally:
+            os.remove(path)
+        job.status = ReportJob.DONE
+        job.finished_at = timezone.now()
+        job.save(update_fields=['file', 'status', 'finished_at'])
+
+
+def fail_job(job, error):
+    job.status = ReportJob.FAILED
+    job.error = str(error) or error.__class__.__name__
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'finished_at'])
+
+
+def clear_old_jobs():
+    """Delete jobs finished more than REPORT_JOB_RETENTION seconds ago, with their files"""
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings, 'REPORT_JOB_RETENTION', 24 * 60 * 60))
+    old = ReportJob.objects.filter(finished_at__lt=cutoff)
+    for job in old.exclude(file=''):
+        job.file.delete(save=False)
+    return old.delete()[0]
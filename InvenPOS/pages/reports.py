@@ -0,0 +1,288 @@
+# reports.py
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db.models import Count, F, Max, Min, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Invoice, PurchaseItem, PurchaseOrder, SoldItem
+
+# How much of each ranking the sales report lists
+RECENT_INVOICES = 10
+TOP_DAYS = 5
+TOP_PRODUCTS = 5
+
+# Rows fetched per round trip by the exports
+EXPORT_CHUNK_SIZE = 2000
+
+INVOICE_COLUMNS = (
+    'invoice_number', 'date_issued', 'customer_id', 'cashier', 'subtotal', 'tax',
+    'total', 'cash_received', 'change', 'active',
+)
+SOLD_ITEM_COLUMNS = (
+    'invoice_number', 'date_issued', 'cashier', 'product_id', 'sku', 'product',
+    'category', 'quantity', 'unit_price', 'total_price',
+)
+PURCHASE_ITEM_COLUMNS = (
+    'purchase_order', 'supplier', 'date_created', 'expected_date', 'product',
+    'quantity', 'cost_per_unit', 'total_cost',
+)
+
+
+# ---------------- FILTERS ----------------
+
+def parse_day(value):
+    """A YYYY-MM-DD filter value as a date, or None if it isn't one"""
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return None
+
+
+def _start_of(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def sales_filters(params):
+    """The sales report filters in ``params`` (request.GET), stripped; "None" left by old links counts as blank"""
+    filters = {}
+    for name in ('date_from', 'date_to', 'cashier', 'customer_id', 'invoice_number'):
+        value = (params.get(name) or '').strip()
+        filters[name] = '' if value == 'None' else value
+    return filters
+
+
+def filter_invoices(filters):
+    """Invoices matching sales_filters(), newest first. Invalid dates are ignored."""
+    invoices = Invoice.objects.all().order_by('-date_issued')
+    day_from = parse_day(filters['date_from'])
+    day_to = parse_day(filters['date_to'])
+    if day_from:
+        invoices = invoices.filter(date_issued__date__gte=day_from)
+    if day_to:
+        invoices = invoices.filter(date_issued__date__lte=day_to)
+    if filters['cashier']:
+        invoices = invoices.filter(staff_name__iexact=filters['cashier'])
+    if filters['customer_id']:
+        invoices = invoices.filter(customer_id__icontains=filters['customer_id'])
+    if filters['invoice_number']:
+        invoices = invoices.filter(invoice_number__icontains=filters['invoice_number'])
+    return invoices
+
+
+def filter_purchase_orders(params):
+    """Received purchase orders matching the purchase report filters in ``params``"""
+    purchase_orders = PurchaseOrder.objects.filter(status='Received')
+
+    search = params.get('search')
+    if search:
+        purchase_orders = purchase_orders.filter(Q(id__icontains=search) | Q(supplier_name__icontains=search))
+
+    # The end date is inclusive, so compare against the start of the next day
+    start_date = parse_day(params.get('date_from'))
+    end_date = parse_day(params.get('date_to'))
+    if start_date:
+        purchase_orders = purchase_orders.filter(date_created__gte=_start_of(start_date))
+    if end_date:
+        purchase_orders = purchase_orders.filter(date_created__lte=_start_of(end_date + timedelta(days=1)))
+
+    supplier = params.get('supplier')
+    if supplier:
+        purchase_orders = purchase_orders.filter(supplier_name=supplier)
+    return purchase_orders
+
+
+def sales_report_data(invoices):
+    """Everything the sales report PDF shows about ``invoices``, computed by the database.
+
+    A fixed handful of queries however many invoices match, and only the
+    rows the report lists (a few days, cashiers and products, the latest
+    invoices) are ever loaded.
+    """
+    # Orderings would end up in the GROUP BY of the grouped queries
+    invoices = invoices.order_by()
+
+    totals = invoices.aggregate(
+        total_sales=Sum('total_amount'),
+        total_transactions=Count('id'),
+        max_sale=Max('total_amount'),
+        min_sale=Min('total_amount'),
+        days=Count(TruncDate('date_issued'), distinct=True),
+    )
+    total_sales = totals['total_sales'] or Decimal(0)
+    total_transactions = totals['total_transactions']
+
+    by_day = (
+        invoices.annotate(day=TruncDate('date_issued'))
+        .values('day')
+        .annotate(sales=Sum('total_amount'), transactions=Count('id'))
+        .order_by('-sales', 'day')
+    )
+    by_cashier = (
+        invoices.values('staff_name')
+        .annotate(sales=Sum('total_amount'), transactions=Count('id'))
+        .order_by('-sales', 'staff_name')
+    )
+    recent = (
+        invoices.order_by('-date_issued')
+        .annotate(item_count=Count('sold_items'))
+        .values('invoice_number', 'date_issued', 'customer_id', 'staff_name', 'total_amount', 'item_count')
+    )
+
+    sold_items = SoldItem.objects.filter(invoice__in=invoices)
+    top_products = (
+        sold_items.values('product_name')
+        .annotate(quantity=Sum('quantity'))
+        .order_by('-quantity', 'product_name')
+    )
+
+    return {
+        'total_sales': total_sales,
+        'total_transactions': total_transactions,
+        'average_sale': total_sales / total_transactions if total_transactions else Decimal(0),
+        'max_sale': totals['max_sale'],
+        'min_sale': totals['min_sale'],
+        'days': totals['days'],
+        'top_days': list(by_day[:TOP_DAYS]),
+        'cashiers': list(by_cashier),
+        'recent': list(recent[:RECENT_INVOICES]),
+        'top_products': list(top_products[:TOP_PRODUCTS]),
+        'product_count': sold_items.aggregate(count=Count('product_name', distinct=True))['count'],
+    }
+
+
+
+def purchase_report_data(purchase_orders):
+    """Everything the purchase report PDF shows about ``purchase_orders``; like sales_report_data()"""
+    purchase_orders = purchase_orders.order_by()
+
+    totals = purchase_orders.aggregate(
+        total_purchases=Sum('total_cost'),
+        total_orders=Count('id'),
+        max_order=Max('total_cost'),
+        min_order=Min('total_cost'),
+        days=Count(TruncDate('date_created'), distinct=True),
+        small_orders=Count('id', filter=Q(total_cost__lt=1000)),
+        medium_orders=Count('id', filter=Q(total_cost__gte=1000, total_cost__lt=5000)),
+        large_orders=Count('id', filter=Q(total_cost__gte=5000)),
+    )
+    total_purchases = totals.pop('total_purchases') or 0
+    total_orders = totals['total_orders']
+
+    items = PurchaseItem.objects.filter(purchase_order__in=purchase_orders.values('id'))
+    by_day = (
+        purchase_orders.annotate(day=TruncDate('date_created'))
+        .values('day')
+        .annotate(purchases=Sum('total_cost'))
+        .order_by('-purchases', 'day')
+    )
+    # Summed separately: joining the items would count each order's cost once per item
+    suppliers = list(
+        purchase_orders.values('supplier_name')
+        .annotate(purchases=Sum('total_cost'), orders=Count('id'))
+        .order_by('-purchases', 'supplier_name')
+    )
+    supplier_items = dict(
+        items.values('purchase_order__supplier_name').annotate(count=Count('id'))
+        .values_list('purchase_order__supplier_name', 'count')
+    )
+    for supplier in suppliers:
+        supplier['items'] = supplier_items.get(supplier['supplier_name'], 0)
+
+    recent = list(
+        purchase_orders.order_by('-date_created', '-id')
+        .annotate(item_count=Count('purchaseitem'))
+        .values('id', 'date_created', 'supplier_name', 'total_cost', 'item_count')[:RECENT_INVOICES]
+    )
+    first_items = defaultdict(list)
+    recent_items = (
+        PurchaseItem.objects.filter(purchase_order_id__in=[order['id'] for order in recent])
+        .order_by('purchase_order_id', 'id')
+        .values_list('purchase_order_id', 'product_name', 'quantity')
+    )
+    for order_id, product_name, quantity in recent_items:
+        if len(first_items[order_id]) < 3:
+            first_items[order_id].append((product_name, quantity))
+    for order in recent:
+        order['items'] = first_items[order['id']]
+
+    top_products = (
+        items.values('product_name')
+        # total_cost first: once annotated, 'quantity' names the sum
+        .annotate(total_cost=Sum(F('quantity') * F('cost_per_unit')), quantity=Sum('quantity'))
+        .order_by('-quantity', 'product_name')
+    )
+
+    return {
+        **totals,
+        'total_purchases': total_purchases,
+        'average_purchase': total_purchases / total_orders if total_orders else 0,
+        'total_items': items.count(),
+        'top_days': list(by_day[:TOP_DAYS]),
+        'suppliers': suppliers,
+        'recent': recent,
+        'top_products': list(top_products[:TOP_PRODUCTS]),
+        'product_count': items.aggregate(count=Count('product_name', distinct=True))['count'],
+    }
+
+
+# ---------------- EXPORTS ----------------
+
+def _local(value):
+    # Spreadsheets have no time zones; write the local wall-clock time
+    return timezone.localtime(value).replace(tzinfo=None, microsecond=0) if value else value
+
+
+def export_invoice_rows(invoices):
+    """The header and then one row per invoice, streamed in chunks with .iterator()"""
+    yield INVOICE_COLUMNS
+    rows = invoices.values_list(
+        'invoice_number', 'date_issued', 'customer_id', 'staff_name', 'subtotal', 'tax_amount',
+        'total_amount', 'cash_received', 'change', 'is_active',
+    )
+    for number, date_issued, customer_id, cashier, *amounts, is_active in rows.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield (number, _local(date_issued), customer_id, cashier, *amounts, 'yes' if is_active else 'no')
+
+
+def sales_detail_rows(invoices):
+    """Every invoice for the detailed sales report, oldest first, streamed in chunks with .iterator()"""
+    rows = invoices.order_by('date_issued', 'id').values_list(
+        'invoice_number', 'date_issued', 'customer_id', 'staff_name', 'subtotal', 'tax_amount',
+        'total_amount', 'is_active',
+    )
+    for number, date_issued, *rest in rows.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield (number, timezone.localtime(date_issued), *rest)
+
+
+def export_sold_item_rows(invoices):
+    """The header and then every line item of ``invoices``, invoice by invoice"""
+    yield SOLD_ITEM_COLUMNS
+    rows = (
+        SoldItem.objects.filter(invoice__in=invoices.order_by().values('id'))
+        .order_by('invoice_id', 'id')
+        .values_list(
+            'invoice__invoice_number', 'invoice__date_issued', 'invoice__staff_name', 'product_id',
+            'product__sku', 'product_name', 'product__product_category__name', 'quantity',
+            'unit_price', 'total_price',
+        )
+    )
+    for number, date_issued, cashier, product_id, sku, *rest in rows.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        product, category, *amounts = rest
+        yield (number, _local(date_issued), cashier, product_id, sku or '', product, category or '', *amounts)
+
+
+def export_purchase_item_rows(purchase_orders):
+    """The header and then every item of ``purchase_orders``, order by order"""
+    yield PURCHASE_ITEM_COLUMNS
+    rows = (
+        PurchaseItem.objects.filter(purchase_order__in=purchase_orders.order_by().values('id'))
+        .order_by('purchase_order_id', 'id')
+        .values_list(
+            'purchase_order_id', 'purchase_order__supplier_name', 'purchase_order__date_created',
+            'purchase_order__expected_date', 'product_name', 'quantity', 'cost_per_unit',
+        )
+    )
+    for order_id, supplier, date_created, *rest, quantity, cost in rows.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield (order_id, supplier, _local(date_created), *rest, quantity, cost, round(quantity * cost, 2))
@@ -0,0 +1,131 @@
+# reservations.py
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, When
+from django.utils import timezone
+
+from .catalog import PRODUCT, record_changes
+from .models import Product, StockHold
+
+
+class ReservationError(Exception):
+    """Raised when a hold can't be placed. Nothing is written to the database."""
+
+
+def hold_expiry():
+    ttl = getattr(settings, 'STOCK_HOLD_TTL', 15 * 60)
+    return timezone.now() + timedelta(seconds=ttl)
+
+
+def set_hold(terminal, product_id, quantity):
+    """Hold ``quantity`` units of a product for the cart on ``terminal``.
+
+    Replaces whatever the terminal held for that product before and pushes the
+    expiry forward; a quantity of 0 drops the hold. Only the difference from
+    the previous hold touches ``Product.reserved_quantity``, with a conditional
+    UPDATE that fails if the extra units aren't available. Every query is a
+    lookup on a unique index, so the cost does not depend on how many holds
+    exist. Returns the product's available quantity after the change.
+    """
+    if quantity < 0:
+        raise ReservationError('Quantity cannot be negative')
+
+    with transaction.atomic():
+        hold = StockHold.objects.filter(terminal=terminal, product_id=product_id).first()
+        # An expired hold the sweeper hasn't reached is still counted in
+        # reserved_quantity, so it is simply taken over
+        delta = quantity - (hold.quantity if hold else 0)
+
+        if delta > 0:
+            updated = Product.objects.filter(
+                id=product_id,
+                product_quantity__gte=F('reserved_quantity') + delta,
+            ).update(reserved_quantity=F('reserved_quantity') + delta)
+            if not updated:
+                product = Product.objects.filter(id=product_id).first()
+                if product is None:
+                    raise ReservationError(f'Product with ID {product_id} does not exist')
+                raise ReservationError(
+                    f'Not enough stock for {product.product_name}. '
+                    f'Available: {product.available_quantity + (hold.quantity if hold else 0)}, '
+                    f'Requested: {quantity}'
+                )
+        elif delta < 0:
+            Product.objects.filter(id=product_id).update(reserved_quantity=F('reserved_quantity') + delta)
+        if delta:
+            record_changes(PRODUCT, [product_id])
+
+        if quantity == 0:
+            if hold:
+                hold.delete()
+        elif hold:
+            hold.quantity = quantity
+            hold.expires_at = hold_expiry()
+            hold.save(update_fields=['quantity', 'expires_at'])
+        else:
+            StockHold.objects.create(
+                terminal=terminal, product_id=product_id, quantity=quantity, expires_at=hold_expiry()
+            )
+
+        product = Product.objects.only('product_quantity', 'reserved_quantity').get(id=product_id)
+
+    return product.available_quantity
+
+
+def return_holds(holds):
+    """Give the units of ``holds`` back to their products and delete them.
+
+    One UPDATE for all the affected products and one DELETE, whatever the
+    number of holds. Expects to run inside a transaction.
+    """
+    held = {}
+    ids = []
+    for hold_id, product_id, quantity in holds.values_list('id', 'product_id', 'quantity'):
+        held[product_id] = held.get(product_id, 0) + quantity
+        ids.append(hold_id)
+
+    if not ids:
+        return 0
+
+    Product.objects.filter(id__in=list(held)).update(
+        reserved_quantity=Case(
+            *[When(id=product_id, then=F('reserved_quantity') - quantity) for product_id, quantity in held.items()],
+            default=F('reserved_quantity'),
+        )
+    )
+    StockHold.objects.filter(id__in=ids).delete()
+    record_changes(PRODUCT, held)
+    return len(ids)
+
+
+def release_holds(terminal):
+    """Drop every hold of ``terminal``, e.g. when its cart is cleared"""
+    with transaction.atomic():
+        return return_holds(StockHold.objects.filter(terminal=terminal))
+
+
+def sweep_expired_holds(now=None, batch_size=1000):
+    """Return the stock of expired holds, ``batch_size`` holds per transaction.
+
+    Uses the index on ``expires_at``; returns the number of holds removed.
+    """
+    now = now or timezone.now()
+    swept = 0
+    while True:
+        with transaction.atomic():
+            expired = StockHold.objects.filter(expires_at__lte=now).order_by('expires_at')
+            ids = list(expired.values_list('id', flat=True)[:batch_size])
+            if not ids:
+                return swept
+            swept += return_holds(StockHold.objects.filter(id__in=ids))
+
+
+def held_by(terminal, product_ids):
+    """Units ``terminal`` holds per product, for the products in ``product_ids``"""
+    return dict(
+        StockHold.objects
+        .filter(terminal=terminal, product_id__in=product_ids)
+        .values_list('product_id', 'quantity')
+    )
@@ -0,0 +1,203 @@
+# rollups.py
+from collections import defaultdict
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import Category, DailySalesSummary, Invoice, SoldItem
+
+# Category of the row that holds whole invoices
+ALL_CATEGORIES = ''
+# Category of lines whose product has none
+UNCATEGORIZED = 'Uncategorized'
+
+CENT = Decimal('0.01')
+
+
+def _money(value):
+    return Decimal(str(value or 0)).quantize(CENT)
+
+
+def invoice_rows(invoice, lines):
+    """What ``invoice`` adds to the rollup, as {(day, cashier, category): [revenue, tax, transactions, units]}.
+
+    ``lines`` are (category name or None, quantity, line total) for its sold
+    items. The ALL_CATEGORIES row gets the invoice's subtotal and tax; the
+    tax is split across its categories in proportion to their sales, with
+    the rounding left on the largest one so the split adds up. Soft-deleted
+    invoices add nothing.
+    """
+    if not invoice.is_active:
+        return {}
+
+    day = timezone.localdate(invoice.date_issued)
+    cashier = invoice.staff_name or ''
+    tax = _money(invoice.tax_amount)
+
+    by_category = {}
+    for category, quantity, total in lines:
+        row = by_category.setdefault(category or UNCATEGORIZED, [Decimal(0), Decimal(0), 1, 0])
+        row[0] += _money(total)
+        row[3] += quantity
+
+    lines_total = sum(row[0] for row in by_category.values())
+    if by_category and lines_total:
+        for row in by_category.values():
+            row[1] = (tax * row[0] / lines_total).quantize(CENT)
+        largest = max(by_category.values(), key=lambda row: row[0])
+        largest[1] += tax - sum(row[1] for row in by_category.values())
+
+    rows = {(day, cashier, category): row for category, row in by_category.items()}
+    rows[(day, cashier, ALL_CATEGORIES)] = [
+        _money(invoice.subtotal), tax, 1, sum(row[3] for row in by_category.values()),
+    ]
+    return rows
+
+
+def merge_rows(total, rows, sign=1):
+    """Add ``rows`` (as returned by invoice_rows) into ``total``, or subtract them with ``sign=-1``"""
+    for key, values in rows.items():
+        current = total.setdefault(key, [Decimal(0), Decimal(0), 0, 0])
+        for position, value in enumerate(values):
+            current[position] += sign * value
+    return total
+
+
+def apply_rows(rows):
+    """Add ``rows`` to DailySalesSummary with a single upsert.
+
+    Run inside the transaction that writes the invoices, so the rollup
+    never disagrees with them.
+    """
+    rows = {key: values for key, values in rows.items() if any(values)}
+    if not rows:
+        return
+
+    table = connection.ops.quote_name(DailySalesSummary._meta.db_table)
+    placeholders = ', '.join(['(%s, %s, %s, %s, %s, %s, %s)'] * len(rows))
+    params = []
+    for (day, cashier, category), (revenue, tax, transactions, units) in sorted(rows.items()):
+        params += [day.isoformat(), cashier, category, str(revenue), str(tax), transactions, units]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} (day, cashier, category, revenue, tax, transactions, units) '
+            f'VALUES {placeholders} '
+            f'ON CONFLICT (day, cashier, category) DO UPDATE SET '
+            f'revenue = {table}.revenue + excluded.revenue, '
+            f'tax = {table}.tax + excluded.tax, '
+            f'transactions = {table}.transactions + excluded.transactions, '
+            f'units = {table}.units + excluded.units',
+            params,
+        )
+
+
+def add_sales(invoices, sold_items, products):
+    """Add newly written invoices and their sold items to the rollup.
+
+    ``products`` maps product id to the Product of each line, as checkout
+    already has it loaded; category names take one more query.
+    """
+    category_ids = {product.product_category_id for product in products.values()} - {None}
+    names = dict(Category.objects.filter(id__in=category_ids).values_list('id', 'name')) if category_ids else {}
+
+    lines = defaultdict(list)
+    for sold_item in sold_items:
+        category_id = products[sold_item.product_id].product_category_id
+        lines[sold_item.invoice_id].append((names.get(category_id), sold_item.quantity, sold_item.total_price))
+
+    total = {}
+    for invoice in invoices:
+        merge_rows(total, invoice_rows(invoice, lines[invoice.pk]))
+    apply_rows(total)
+
+
+def stored_rows(invoice_ids):
+    """invoice_rows() for invoices as they are stored now, merged together"""
+    lines = defaultdict(list)
+    sold_items = SoldItem.objects.filter(invoice_id__in=invoice_ids).values_list(
+        'invoice_id', 'product__product_category__name', 'quantity', 'total_price'
+    )
+    for invoice_id, category, quantity, total in sold_items:
+        lines[invoice_id].append((category, quantity, total))
+
+    total = {}
+    for invoice in Invoice.objects.filter(id__in=invoice_ids).only(
+        'id', 'date_issued', 'staff_name', 'subtotal', 'tax_amount', 'is_active'
+    ):
+        merge_rows(total, invoice_rows(invoice, lines[invoice.pk]))
+    return total
+
+
+@contextmanager
+def updating_sales(invoice):
+    """Keep the rollup in step with whatever the block does to a saved ``invoice``.
+
+    The invoice's contribution is read before the block and again after it,
+    and the difference applied, all in one transaction. Works for edits of
+    the invoice or its sold items, soft deletes and hard deletes alike.
+    """
+    if invoice.pk is None:
+        yield
+        return
+    with transaction.atomic():
+        before = stored_rows([invoice.pk])
+        yield
+        apply_rows(merge_rows(stored_rows([invoice.pk]), before, sign=-1))
+
+
+def rebuild_sales_summary(since=None, chunk_size=2000):
+    """Recompute the rollup from the invoices, for days from ``since`` on (all days by default).
+
+    Invoices are read ``chunk_size`` at a time in id order, so memory depends
+    on the number of summary rows, not of invoices. Returns the number of rows
+    written.
+    """
+    invoices = Invoice.objects.filter(is_active=True).order_by('id')
+    summaries = DailySalesSummary.objects.all()
+    if since is not None:
+        invoices = invoices.filter(date_issued__date__gte=since)
+        summaries = summaries.filter(day__gte=since)
+
+    total = {}
+    with transaction.atomic():
+        summaries.delete()
+        last_id = 0
+        while True:
+            ids = list(invoices.filter(id__gt=last_id).values_list('id', flat=True)[:chunk_size])
+            if not ids:
+                break
+            merge_rows(total, stored_rows(ids))
+            last_id = ids[-1]
+
+        DailySalesSummary.objects.bulk_create(
+            [
+                DailySalesSummary(day=day, cashier=cashier, category=category,
+                                  revenue=revenue, tax=tax, transactions=transactions, units=units)
+                for (day, cashier, category), (revenue, tax, transactions, units) in sorted(total.items())
+            ],
+            batch_size=500,
+        )
+    return len(total)
+
+
+def sales_totals(day_from=None, day_to=None, cashier=None):
+    """Revenue (subtotal plus tax), tax and number of sales over a range of days, from the rollup"""
+    rows = DailySalesSummary.objects.filter(category=ALL_CATEGORIES)
+    if day_from:
+        rows = rows.filter(day__gte=day_from)
+    if day_to:
+        rows = rows.filter(day__lte=day_to)
+    if cashier:
+        rows = rows.filter(cashier__iexact=cashier)
+    totals = rows.aggregate(revenue=Sum('revenue'), tax=Sum('tax'), transactions=Sum('transactions'))
+    # SQLite sums these as floats
+    revenue = _money(totals['revenue'])
+    tax = _money(totals['tax'])
+    return {
+        'total': revenue + tax,
+        'tax': tax,
+        'transactions': totals['transactions'] or 0,
+    }
@@ -0,0 +1,95 @@
+# search.py
+import json
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from .images import variant_url
+from .models import Product
+
+# Matches product ids in the FTS5 index (name, category, sku; migration 0018)
+MATCH_SQL = 'SELECT rowid FROM pages_product_fts WHERE pages_product_fts MATCH %s'
+
+SEARCH_SQL = """
+    SELECT p.id, p.product_name, p.product_price, p.product_quantity,
+           p.reserved_quantity, p.product_img, p.product_img_variants, COALESCE(c.name, '')
+    FROM pages_product_fts f
+    JOIN pages_product p ON p.id = f.rowid
+    LEFT JOIN pages_category c ON c.id = p.product_category_id
+    WHERE pages_product_fts MATCH %s
+    ORDER BY bm25(pages_product_fts, 10.0, 1.0, 10.0), p.id
+    LIMIT %s
+"""
+
+
+def has_search_index():
+    return connection.vendor == 'sqlite'
+
+
+def fts_query(text):
+    """FTS5 query for what the cashier typed: every word, as a prefix.
+
+    Each word is quoted so characters like '-' or '"' can't form FTS syntax.
+    Returns '' if there is nothing to search for.
+    """
+    words = re.findall(r'\w+', text or '')
+    return ' '.join('"%s"*' % word for word in words)
+
+
+def filter_products(queryset, text):
+    """Narrow a Product queryset to the products matching ``text``"""
+    if not has_search_index():
+        return queryset.filter(product_name__icontains=text)
+
+    query = fts_query(text)
+    if not query:
+        return queryset.none()
+    return queryset.filter(id__in=RawSQL(MATCH_SQL, [query]))
+
+
+def search_products(text, limit=20):
+    """Best matches for ``text``, best first, as dicts ready for JSON.
+
+    Name and SKU matches weigh more than category matches. One query, driven by
+    the FTS index.
+    """
+    if not has_search_index():
+        rows = (
+            Product.objects.filter(product_name__icontains=text)
+            .order_by('product_name', 'id')
+            .values_list(*GRID_FIELDS)[:limit]
+        )
+    else:
+        query = fts_query(text)
+        if not query:
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(SEARCH_SQL, [query, limit])
+            rows = cursor.fetchall()
+
+    return [grid_product(*row) for row in rows]
+
+
+# Columns grid_product() expects, in order, for values_list()
+GRID_FIELDS = (
+    'id', 'product_name', 'product_price', 'product_quantity',
+    'reserved_quantity', 'product_img', 'product_img_variants', 'product_category__name',
+)
+
+
+def grid_product(product_id, name, price, quantity, reserved, image, variants, category):
+    """What the cashier grid shows for one product, with grid-sized images"""
+    if isinstance(variants, str):
+        # Raw SQL hands the JSON column back undecoded
+        variants = json.loads(variants or '{}')
+    return {
+        'id': product_id,
+        'product_name': name,
+        'product_price': float(price),
+        'product_quantity': quantity,
+        'available_quantity': max(quantity - reserved, 0),
+        'product_img': variant_url(image, variants, 'grid', 'jpg'),
+        'product_img_webp': variant_url(image, variants, 'grid', 'webp') if variants else '',
+        'category': category or '',
+    }
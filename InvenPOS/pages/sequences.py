@@ -0,0 +1,133 @@
+# sequences.py
+import os
+import threading
+import weakref
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+
+
+def reserve_block(name, size):
+    """Atomically take ``size`` numbers from the named counter.
+
+    Returns the first and last number of the reserved range. The counter row
+    is created on first use.
+    """
+    from .models import Sequence
+
+    with transaction.atomic():
+        updated = Sequence.objects.filter(name=name).update(value=F('value') + size)
+        if not updated:
+            Sequence.objects.get_or_create(name=name)
+            Sequence.objects.filter(name=name).update(value=F('value') + size)
+        last = Sequence.objects.values_list('value', flat=True).get(name=name)
+
+    return last - size + 1, last
+
+
+def bump(name):
+    """Add one to the named counter, creating it on first use"""
+    from .models import Sequence
+
+    if not Sequence.objects.filter(name=name).update(value=F('value') + 1):
+        reserve_block(name, 1)
+
+
+def current_value(name):
+    from .models import Sequence
+
+    return Sequence.objects.filter(name=name).values_list('value', flat=True).first() or 0
+
+
+# Bumped whenever a product or category changes (name, price, stock, holds),
+# so clients can tell with one primary-key lookup whether their copy is still
+# current. See catalog.record_changes(), which also logs what changed.
+CATALOG_VERSION = 'catalog_version'
+
+
+def catalog_version():
+    return current_value(CATALOG_VERSION)
+
+
+def bump_catalog_version():
+    """Advance the catalog version and return the new value"""
+    return reserve_block(CATALOG_VERSION, 1)[1]
+
+
+# Every allocator, so a forked child can drop the blocks it inherited
+_allocators = weakref.WeakSet()
+
+
+def _forget_blocks_after_fork():
+    for allocator in list(_allocators):
+        # The parent may have held the lock when it forked
+        allocator._lock = threading.Lock()
+        allocator._next = 1
+        allocator._last = 0
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_blocks_after_fork)
+
+
+class BlockAllocator:
+    """Hands out numbers from a Sequence counter, one block at a time.
+
+    Each worker process reserves ``block_size`` numbers with a single UPDATE
+    and serves them from memory, so the sale path only hits the database when
+    the block runs out. Numbers are unique across workers, including workers
+    forked from a process that already held a block: the child starts without
+    one. They are not gapless: numbers are only contiguous within a block, the
+    unused tail of a block is lost when the process exits, and a number taken
+    for a sale that then fails (e.g. out of stock) is not handed out again.
+    """
+
+    def __init__(self, name, block_size=None):
+        self.name = name
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._next = 1
+        self._last = 0
+        _allocators.add(self)
+
+    def reset(self):
+        """Forget the cached block; the next number reserves a new one"""
+        with self._lock:
+            self._next = 1
+            self._last = 0
+
+    def next(self):
+        return self.take(1)[0]
+
+    def take(self, count):
+        """Return ``count`` unique numbers, reserving at most one new block"""
+        if count <= 0:
+            return []
+
+        block_size = self.block_size or getattr(settings, 'SEQUENCE_BLOCK_SIZE', 20)
+
+        if connection.in_atomic_block:
+            # The reservation would be undone if the surrounding transaction
+            # rolls back, and another worker could then get the same block.
+            # Take only what is needed instead of caching numbers we may not own.
+            first, last = reserve_block(self.name, count)
+            return list(range(first, last + 1))
+
+        with self._lock:
+            numbers = list(range(self._next, min(self._last, self._next + count - 1) + 1))
+            self._next += len(numbers)
+
+            shortfall = count - len(numbers)
+            if shortfall:
+                # Whole blocks only, so a single reservation covers the request
+                blocks = -(-shortfall // block_size)
+                first, self._last = reserve_block(self.name, blocks * block_size)
+                numbers.extend(range(first, first + shortfall))
+                self._next = first + shortfall
+
+            return numbers
+
+
+invoice_numbers = BlockAllocator('invoice_number')
+customer_numbers = BlockAllocator('customer_id')
@@ -0,0 +1,44 @@
+# signals.py
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .caches import invalidate_tax_rate
+from .catalog import CATEGORY, PRODUCT, record_changes
+from .models import Category, Product, TaxRate
+
+
+@receiver(post_save, sender=TaxRate)
+@receiver(post_delete, sender=TaxRate)
+def tax_rate_changed(sender, **kwargs):
+    invalidate_tax_rate()
+    # Again after commit, in case another request reloaded the old row meanwhile
+    transaction.on_commit(invalidate_tax_rate)
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, **kwargs):
+    record_changes(PRODUCT, [instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    record_changes(PRODUCT, [instance.pk], deleted=True)
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, **kwargs):
+    record_changes(CATEGORY, [instance.pk])
+
+
+@receiver(pre_delete, sender=Category)
+def category_deleting(sender, instance, **kwargs):
+    # Its products lose their category by a bulk UPDATE that sends no signals
+    product_ids = list(instance.products.values_list('id', flat=True))
+    if product_ids:
+        record_changes(PRODUCT, product_ids)
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    record_changes(CATEGORY, [instance.pk], deleted=True)
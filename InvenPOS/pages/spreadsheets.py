@@ -0,0 +1,359 @@
+# spreadsheets.py
+import csv
+import io
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from .catalog import PRODUCT, record_changes
+from .models import Category, Product, normalize_sku
+
+try:
+    import openpyxl
+except ImportError:  # XLSX files need openpyxl (requirements-optional.txt); CSV always works
+    openpyxl = None
+
+# Columns of an exported product list, which can be imported again as is
+COLUMNS = ('id', 'sku', 'name', 'category', 'price', 'quantity')
+
+# Other headings suppliers' price lists use for the same columns
+COLUMN_ALIASES = {
+    'product_id': 'id',
+    'barcode': 'sku',
+    'code': 'sku',
+    'product_name': 'name',
+    'product_category': 'category',
+    'product_price': 'price',
+    'product_quantity': 'quantity',
+    'stock': 'quantity',
+}
+
+# Product field set from each column, compared for the diff
+FIELDS = {
+    'sku': 'sku',
+    'name': 'product_name',
+    'category': 'product_category',
+    'price': 'product_price',
+    'quantity': 'product_quantity',
+}
+
+
+class SpreadsheetError(Exception):
+    """The file can't be read as a product list at all"""
+
+
+class RowError(Exception):
+    """One row of the file is invalid; the rest of the import goes on"""
+
+
+# ---------------- READING ----------------
+
+def read_product_rows(file, filename):
+    """Yield (line number, {column: cell}) for each row of an uploaded CSV or XLSX file.
+
+    Rows are read one at a time, so memory doesn't grow with the file.
+    Headings are matched case-insensitively, with COLUMN_ALIASES; unknown
+    columns are ignored.
+    """
+    if filename.lower().endswith('.xlsx'):
+        rows = _xlsx_rows(file)
+    else:
+        rows = _csv_rows(file)
+
+    header = next(rows, None)
+    if header is None:
+        raise SpreadsheetError('The file is empty')
+
+    columns = []
+    for heading in header:
+        heading = str(heading or '').strip().lower().replace(' ', '_')
+        heading = COLUMN_ALIASES.get(heading, heading)
+        columns.append(heading if heading in COLUMNS else None)
+    if not {'id', 'sku', 'name'} & set(columns):
+        raise SpreadsheetError('The first row must name the columns, including id, sku or name')
+
+    for line, cells in enumerate(rows, start=2):
+        row = {column: cell for column, cell in zip(columns, cells) if column}
+        if any(cell not in (None, '') for cell in row.values()):
+            yield line, row
+
+
+def _csv_rows(file):
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    try:
+        yield from csv.reader(text)
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise SpreadsheetError(f'Not a readable CSV file: {e}')
+    finally:
+        # Don't let the wrapper close the uploaded file under Django
+        text.detach()
+
+
+def _xlsx_rows(file):
+    if openpyxl is None:
+        raise SpreadsheetError('XLSX files need the openpyxl package; upload a CSV file instead')
+    try:
+        workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    except Exception as e:  # openpyxl raises a variety of zip/XML errors
+        raise SpreadsheetError(f'Not a readable XLSX file: {e}')
+    try:
+        yield from workbook.active.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def _text(value):
+    return str(value).strip() if value is not None else ''
+
+
+# Largest values Product.product_price (10 digits, 2 decimals) and
+# product_quantity can hold
+MAX_PRICE = Decimal('100000000')
+MAX_QUANTITY = 2 ** 31 - 1
+
+
+def clean_row(row):
+    """Parsed values of the non-blank cells of ``row``.
+
+    A blank cell means "leave as it is", so a price list with only sku and
+    price columns just updates prices.
+    """
+    values = {}
+    for column, cell in row.items():
+        text = _text(cell)
+        if not text:
+            continue
+        if column == 'id':
+            try:
+                values['id'] = int(float(text))
+            except (ValueError, OverflowError):
+                raise RowError(f'Invalid id: {text}')
+        elif column == 'sku':
+            values['sku'] = normalize_sku(text)
+        elif column == 'name':
+            values['name'] = text[:100]
+        elif column == 'category':
+            values['category'] = text[:100]
+        elif column == 'price':
+            try:
+                price = Decimal(text.replace(',', ''))
+            except InvalidOperation:
+                raise RowError(f'Invalid price: {text}')
+            if not price.is_finite():
+                raise RowError(f'Invalid price: {text}')
+            if price < 0:
+                raise RowError(f'Price cannot be negative: {text}')
+            if price >= MAX_PRICE:
+                raise RowError(f'Price is too large: {text}')
+            values['price'] = price.quantize(Decimal('0.01'))
+        elif column == 'quantity':
+            try:
+                quantity = int(float(text))
+            except (ValueError, OverflowError):
+                raise RowError(f'Invalid quantity: {text}')
+            if quantity < 0:
+                raise RowError(f'Quantity cannot be negative: {text}')
+            if quantity > MAX_QUANTITY:
+                raise RowError(f'Quantity is too large: {text}')
+            values['quantity'] = quantity
+    return values
+
+
+# ---------------- IMPORT ----------------
+
+def new_import_result(dry_run):
+    return {
+        'dry_run': dry_run,
+        'created': 0,
+        'updated': 0,
+        'unchanged': 0,
+        'new_categories': [],
+        'errors': [],   # (line, message)
+        'changes': [],  # the first PRODUCT_IMPORT_DIFF_LIMIT creates and updates
+    }
+
+
+def import_products(rows, dry_run=False, chunk_size=None):
+    """Create and update products from ``rows`` (as yielded by read_product_rows).
+
+    Rows are matched to products by id, then by SKU; anything else is a new
+    product. Work is done ``chunk_size`` rows at a time: two lookups, one
+    bulk_create, one bulk_update and one change-log write per chunk, each
+    chunk in its own transaction. Invalid rows are reported and skipped. With
+    ``dry_run`` nothing is written and the result only describes what would
+    change.
+    """
+    chunk_size = chunk_size or getattr(settings, 'PRODUCT_IMPORT_CHUNK_SIZE', 500)
+    result = new_import_result(dry_run)
+    categories = dict(Category.objects.values_list('name', 'id'))
+    seen = set()
+
+    chunk = []
+    for line, row in rows:
+        try:
+            values = clean_row(row)
+        except RowError as e:
+            result['errors'].append((line, str(e)))
+            continue
+
+        keys = {('id', values.get('id')), ('sku', values.get('sku'))} - {('id', None), ('sku', None)}
+        if keys & seen:
+            result['errors'].append((line, 'Same product as an earlier row'))
+            continue
+        seen |= keys
+
+        chunk.append((line, values))
+        if len(chunk) >= chunk_size:
+            import_chunk(chunk, categories, result)
+            chunk = []
+    if chunk:
+        import_chunk(chunk, categories, result)
+
+    return result
+
+
+def import_chunk(chunk, categories, result):
+    dry_run = result['dry_run']
+    by_id = Product.objects.in_bulk([values['id'] for _, values in chunk if 'id' in values])
+    by_sku = Product.objects.in_bulk([values['sku'] for _, values in chunk if 'sku' in values], field_name='sku')
+    category_names = {category_id: name for name, category_id in categories.items()}
+
+    to_create = []
+    to_update = []
+    update_fields = set()
+    new_category = []  # (product, name of a category to create first)
+    changes = []
+    for line, values in chunk:
+        try:
+            product, changed, category_name = plan_row(values, by_id, by_sku, categories, category_names, result)
+        except RowError as e:
+            result['errors'].append((line, str(e)))
+            continue
+        if category_name:
+            new_category.append((product, category_name))
+        if product.pk is None:
+            to_create.append(product)
+            changes.append({'line': line, 'action': 'create', 'product': product.product_name, 'fields': changed})
+        elif changed:
+            to_update.append(product)
+            update_fields.update(FIELDS[column] for column in changed)
+            changes.append({'line': line, 'action': 'update', 'product': product.product_name, 'fields': changed})
+        else:
+            result['unchanged'] += 1
+
+    if not dry_run and (to_create or to_update):
+        created_categories = {}
+        try:
+            with transaction.atomic():
+                for name in sorted({name for _, name in new_category}):
+                    created_categories[name] = Category.objects.create(name=name).id
+                for product, name in new_category:
+                    product.product_category_id = created_categories[name]
+                Product.objects.bulk_create(to_create)
+                if to_update:
+                    Product.objects.bulk_update(to_update, sorted(update_fields))
+                record_changes(PRODUCT, [product.pk for product in to_create + to_update])
+        except IntegrityError as e:
+            first, last = chunk[0][0], chunk[-1][0]
+            result['errors'].append((first, f'Lines {first}-{last} were not imported: {e}'))
+            return
+        categories.update(created_categories)
+
+    result['created'] += len(to_create)
+    result['updated'] += len(to_update)
+    room = getattr(settings, 'PRODUCT_IMPORT_DIFF_LIMIT', 200) - len(result['changes'])
+    result['changes'].extend(changes[:max(room, 0)])
+
+
+def plan_row(values, by_id, by_sku, categories, category_names, result):
+    """The product ``values`` describe (unsaved), its changed columns as
+    {column: (old, new)}, and the name of a category to create for it, if any.
+
+    Categories that don't exist yet are remembered in ``categories`` with an
+    id of None until the chunk that creates them is written.
+    """
+    sku = values.get('sku')
+    if 'id' in values:
+        product = by_id.get(values['id'])
+        if product is None:
+            raise RowError(f"No product with id {values['id']}")
+        if sku and sku in by_sku and by_sku[sku].pk != product.pk:
+            raise RowError(f'SKU {sku} belongs to another product (id {by_sku[sku].pk})')
+    elif sku and sku in by_sku:
+        product = by_sku[sku]
+    else:
+        if 'name' not in values or 'price' not in values:
+            raise RowError('New products need a name and a price')
+        product = Product(product_quantity=0)
+
+    changed = {}
+    category_name = None
+    for column, value in values.items():
+        if column == 'id':
+            continue
+        if column == 'category':
+            if value not in categories:
+                categories[value] = None
+                result['new_categories'].append(value)
+            category_id = categories[value]
+            if category_id is None:
+                category_name = value
+            elif category_id == product.product_category_id:
+                continue
+            changed[column] = (category_names.get(product.product_category_id), value)
+            product.product_category_id = category_id
+            continue
+        field = FIELDS[column]
+        old = getattr(product, field)
+        if old != value:
+            setattr(product, field, value)
+            changed[column] = (old, value)
+
+    return product, changed, category_name
+
+
+# ---------------- EXPORT ----------------
+
+def export_product_rows():
+    """The header and then one row per product, in COLUMNS order.
+
+    Products are fetched in chunks with .iterator(), so memory stays flat
+    however large the catalog is.
+    """
+    yield COLUMNS
+    products = Product.objects.order_by('id').values_list(
+        'id', 'sku', 'product_name', 'product_category__name', 'product_price', 'product_quantity'
+    )
+    for product_id, sku, name, category, price, quantity in products.iterator(chunk_size=2000):
+        yield product_id, sku or '', name, category or '', price, quantity
+
+
+class Echo:
+    """File-like object that hands back what is written, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows):
+    """CSV text of ``rows``, one line at a time, for a StreamingHttpResponse"""
+    writer = csv.writer(Echo())
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def write_xlsx(rows, file, title='Products'):
+    """Write ``rows`` to ``file`` as a one-sheet XLSX workbook in openpyxl's write-only mode.
+
+    Write-only workbooks keep memory flat, but an XLSX file is a zip that
+    can't be sent before it is finished, so it goes to ``file`` (a temporary
+    file, usually) first.
+    """
+    if openpyxl is None:
+        raise SpreadsheetError('XLSX export needs the openpyxl package')
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet(title)
+    for row in rows:
+        sheet.append(list(row))
+    workbook.save(file)
@@ -0,0 +1,143 @@
+# staticfiles.py
+import gzip
+import io
+import os
+import re
+import shutil
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from PIL import Image
+
+try:
+    import brotli
+except ImportError:  # .br siblings are only written when brotli is installed
+    brotli = None
+
+# Text files worth sending compressed; images are compressed already
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.txt', '.html', '.xml', '.map')
+# Images that get recompressed and a .webp sibling
+RECOMPRESSIBLE = ('.png', '.jpg', '.jpeg')
+
+# Siblings served in place of a file, smallest first (see middleware.py)
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+WEBP_SUFFIX = '.webp'
+
+
+# Strings, comments and url()s; minify_css() leaves everything inside them alone
+CSS_VERBATIM = re.compile(r"""("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*'|/\*.*?\*/|url\((?:\\.|[^)\\])*\))""", re.S)
+
+
+def minify_css(text):
+    """Drop comments and the whitespace that doesn't change how CSS parses"""
+    # A space, so `.a/**/.b` doesn't become `.a.b`; it goes with the rest below
+    text = CSS_VERBATIM.sub(lambda match: ' ' if match.group().startswith('/*') else match.group(), text)
+    parts = CSS_VERBATIM.split(text)
+    for i in range(0, len(parts), 2):
+        code = re.sub(r'\s+', ' ', parts[i])
+        code = re.sub(r'\s*([{};,>])\s*', r'\1', code)
+        # Not before ':', where a space can mean a descendant (`.menu :hover`)
+        code = re.sub(r':\s+', ':', code)
+        parts[i] = code.replace(';}', '}')
+    return ''.join(parts).strip()
+
+
+def write_compressed(path, data):
+    """Write .gz (and .br) siblings of ``path`` holding ``data``, where they are smaller"""
+    siblings = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        siblings.append(('.br', brotli.compress(data, quality=11)))
+    for suffix, compressed in siblings:
+        if len(compressed) < len(data):
+            with open(path + suffix, 'wb') as file:
+                file.write(compressed)
+
+
+def recompress_image(path):
+    """Re-save an image losslessly smaller where possible, and write a .webp sibling.
+
+    Returns False if there was nothing to do because the sibling is at
+    least as new as the image, i.e. it was processed since it was collected.
+    """
+    webp_path = path + WEBP_SUFFIX
+    if os.path.exists(webp_path) and os.path.getmtime(webp_path) >= os.path.getmtime(path):
+        return False
+
+    with open(path, 'rb') as file:
+        data = file.read()
+    image = Image.open(io.BytesIO(data))
+    image.load()
+
+    buffer = io.BytesIO()
+    if image.format == 'PNG':
+        image.save(buffer, 'PNG', optimize=True)
+    elif image.format == 'JPEG':
+        # Same quantization tables, so no generation loss
+        image.save(buffer, 'JPEG', quality='keep', optimize=True, progressive=True)
+    if 0 < buffer.tell() < len(data):
+        data = buffer.getvalue()
+        with open(path, 'wb') as file:
+            file.write(data)
+
+    webp = io.BytesIO()
+    image.save(webp, 'WEBP', quality=85, method=6)
+    # An empty sibling still marks the image as done; the middleware skips it
+    with open(webp_path, 'wb') as file:
+        if webp.tell() < len(data):
+            file.write(webp.getvalue())
+    return True
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Content-hashed static files, post-processed for the smallest transfer.
+
+    The collected copies are minified (CSS) and recompressed (PNG/JPEG,
+    plus a WebP sibling) before they are hashed, so a name's hash is that
+    of the bytes served under it. Then every text file gets .gz (and .br)
+    siblings of its final content. PrecompressedStaticMiddleware serves the
+    best of these with immutable cache headers.
+
+    Names missing from the manifest fall back to the plain name, so pages
+    still render before the first build (and in tests).
+    """
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        if dry_run:
+            yield from super().post_process(paths, dry_run=dry_run, **options)
+            return
+
+        for name in sorted(paths):
+            self.optimize(name)
+        # Hash the optimized copies rather than the originals
+        yield from super().post_process({name: (self, name) for name in paths}, dry_run=dry_run, **options)
+
+        for name, hashed_name in sorted(self.hashed_files.items()):
+            for stored in {name, hashed_name}:
+                path = self.path(stored)
+                if os.path.isfile(path) and stored.lower().endswith(COMPRESSIBLE):
+                    with open(path, 'rb') as file:
+                        write_compressed(path, file.read())
+            webp = self.path(name) + WEBP_SUFFIX
+            if hashed_name != name and os.path.isfile(webp):
+                shutil.copyfile(webp, self.path(hashed_name) + WEBP_SUFFIX)
+
+    def optimize(self, name):
+        """Minify or recompress the collected copy of ``name`` in place"""
+        path = self.path(name)
+        if not os.path.isfile(path):
+            return
+        extension = os.path.splitext(name)[1].lower()
+        if extension == '.css':
+            with open(path, encoding='utf-8') as file:
+                css = file.read()
+            minified = minify_css(css)
+            if minified != css:
+                with open(path, 'w', encoding='utf-8') as file:
+                    file.write(minified)
+        elif extension in RECOMPRESSIBLE:
+            recompress_image(path)
@@ -0,0 +1,28 @@
+from django import template
+from django.utils.html import format_html
+
+from pages.images import variant_url
+
+register = template.Library()
+
+
+@register.simple_tag
+def product_image_url(product, size='grid', fmt='jpg'):
+    """{% product_image_url product 'thumb' 'webp' %}: URL of one image variant"""
+    image_name = product.product_img.name if product.product_img else ''
+    return variant_url(image_name, product.product_img_variants, size, fmt)
+
+
+@register.simple_tag
+def product_picture(product, size='grid', css_class=''):
+    """{% product_picture product 'grid' 'product-img' %}: WebP with a JPEG fallback"""
+    image_name = product.product_img.name if product.product_img else ''
+    variants = product.product_img_variants
+    return format_html(
+        '<picture><source srcset="{}" type="image/webp">'
+        '<img src="{}" alt="{}" class="{}" loading="lazy"></picture>',
+        variant_url(image_name, variants, size, 'webp'),
+        variant_url(image_name, variants, size, 'jpg'),
+        product.product_name,
+        css_class,
+    )
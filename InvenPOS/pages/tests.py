@@ -1,3 +1,1815 @@
-from django.test import TestCase
+import base64
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import random
+import re
+import shutil
+import socket
+import tempfile
+import threading
+import tracemalloc
+import unittest
+import zlib
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.template import Context, Template
+from django.db import connection
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+try:
+    import openpyxl
+except ImportError:  # Only the XLSX tests need it
+    openpyxl = None
+try:
+    import pypdf
+except ImportError:  # Only the PDF read-back test needs it
+    pypdf = None
+
+from .caches import clear_sku_cache, get_active_tax_rate, invalidate_tax_rate, lookup_sku
+from PIL import Image
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+from .catalog import clear_snapshot_cache
+from .checkout import CheckoutError, process_sale, process_sales_batch
+from .loadtest import checkout_load, client_checkout, make_cart
+from .models import (
+    CatalogChange, Category, DailySalesSummary, IdempotencyKey, Invoice, Product, PurchaseItem, PurchaseOrder,
+    ReportJob, ReportWorker, Sequence, SoldItem, StockHold, TaxRate,
+)
+from .reservations import ReservationError, set_hold, sweep_expired_holds
+from . import report_jobs
+from .report_jobs import check_in, check_out, enqueue_report, run_jobs, worker_running
+from .reports import purchase_report_data, sales_report_data
+from .rollups import ALL_CATEGORIES, sales_totals
+from .images import generate_variants
+from .search import search_products
+from .spreadsheets import import_products, read_product_rows
+from .staticfiles import minify_css
+from .utils import (
+    DETAILED_SALES_REPORT, SALES_REPORT, RowStream, generate_purchase_report_pdf, generate_sales_report_pdf, pdf_styles,
+    render_detailed_sales_report_pdf, render_purchase_report_pdf, render_sales_report_pdf,
+)
+from .sequences import BlockAllocator, catalog_version, customer_numbers, invoice_numbers
+
+
+def reset_caches():
+    # In-process caches outlive the per-test rollback
+    invalidate_tax_rate()
+    # and cached number blocks outlive a TransactionTestCase flush
+    invoice_numbers.reset()
+    customer_numbers.reset()
+    clear_sku_cache()
+    clear_snapshot_cache()
+
+
+def make_products(count, quantity=100, price='10.00', category=None):
+    if category is None:
+        category, _ = Category.objects.get_or_create(name='Supplies')
+    return [
+        Product.objects.create(
+            product_name=f'Product {i}',
+            product_price=Decimal(price),
+            product_quantity=quantity,
+            product_category=category,
+        )
+        for i in range(count)
+    ]
+
+
+def make_sale(products, quantity=1, customer_id='CUST-001'):
+    sold_items = [
+        {
+            'product_id': product.id,
+            'product_name': product.product_name,
+            'quantity': quantity,
+            'unit_price': float(product.product_price),
+            'total_price': float(product.product_price) * quantity,
+        }
+        for product in products
+    ]
+    subtotal = sum(item['total_price'] for item in sold_items)
+    return {
+        'customer_id': customer_id,
+        'subtotal': subtotal,
+        'cash_received': subtotal + 100,
+        'change': 100,
+        'sold_items': sold_items,
+    }
+
+
+class MediaRootMixin:
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+
+
+class CheckoutTests(TestCase):
+    def setUp(self):
+        reset_caches()
+        self.user = User.objects.create_user('cashier', password='secret')
+        self.tax_rate = TaxRate.objects.create(name='VAT', percentage=Decimal('12.00'))
+
+    def test_sale_decrements_stock_and_records_items(self):
+        products = make_products(3, quantity=5)
+
+        invoice, sold_items = process_sale(make_sale(products, quantity=2), self.user, 'Cashier', self.tax_rate)
+
+        self.assertEqual(len(sold_items), 3)
+        self.assertEqual(invoice.sold_items.count(), 3)
+        self.assertEqual(invoice.tax_amount, Decimal('7.20'))
+        for product in products:
+            product.refresh_from_db()
+            self.assertEqual(product.product_quantity, 3)
+
+    def test_insufficient_stock_rolls_back_whole_sale(self):
+        products = make_products(2, quantity=5)
+        products[1].product_quantity = 1
+        products[1].save()
+
+        with self.assertRaisesMessage(CheckoutError, 'Not enough stock for Product 1'):
+            process_sale(make_sale(products, quantity=2), self.user, 'Cashier', self.tax_rate)
+
+        self.assertFalse(Invoice.objects.exists())
+        self.assertFalse(SoldItem.objects.exists())
+        products[0].refresh_from_db()
+        self.assertEqual(products[0].product_quantity, 5)
+
+    def test_unknown_product_is_rejected(self):
+        sale = make_sale(make_products(1))
+        sale['sold_items'][0]['product_id'] = 999999
+
+        with self.assertRaisesMessage(CheckoutError, 'Product with ID 999999 does not exist'):
+            process_sale(sale, self.user, 'Cashier', self.tax_rate)
+        self.assertFalse(Invoice.objects.exists())
+
+    def test_queries_per_sale_do_not_grow_with_cart_size(self):
+        query_counts = {}
+        for cart_size in (1, 10, 50):
+            sale = make_sale(make_products(cart_size))
+            with CaptureQueriesContext(connection) as queries:
+                process_sale(sale, self.user, 'Cashier', self.tax_rate)
+            query_counts[cart_size] = len(queries)
+
+        self.assertEqual(len(set(query_counts.values())), 1, query_counts)
+
+    def test_create_invoice_endpoint(self):
+        products = make_products(2, quantity=5)
+        self.client.force_login(self.user)
+
+        response = self.client.post(
+            reverse('pages:create_invoice'),
+            data=json.dumps(make_sale(products)),
+            content_type='application/json',
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['success'])
+        self.assertEqual(Product.objects.filter(product_quantity=4).count(), 2)
+
+    def test_create_invoice_endpoint_reports_stock_errors(self):
+        products = make_products(1, quantity=1)
+        self.client.force_login(self.user)
+
+        response = self.client.post(
+            reverse('pages:create_invoice'),
+            data=json.dumps(make_sale(products, quantity=3)),
+            content_type='application/json',
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Not enough stock', response.json()['error'])
+        self.assertFalse(Invoice.objects.exists())
+
+
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        reset_caches()
+        self.user = User.objects.create_user('cashier', password='secret')
+        self.client.force_login(self.user)
+        self.products = make_products(2, quantity=5)
+
+    def post_sale(self, key):
+        return self.client.post(
+            reverse('pages:create_invoice'),
+            data=json.dumps(make_sale(self.products)),
+            content_type='application/json',
+            headers={'Idempotency-Key': key},
+        )
+
+    def test_retry_replays_stored_response(self):
+        first = self.post_sale('key-1')
+
+        # session + user + the key lookup; no Product or SoldItem access
+        with self.assertNumQueries(3):
+            second = self.post_sale('key-1')
+
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Invoice.objects.count(), 1)
+        self.assertEqual(SoldItem.objects.count(), 2)
+        self.assertEqual(Product.objects.filter(product_quantity=4).count(), 2)
+
+    def test_different_keys_record_separate_sales(self):
+        self.post_sale('key-1')
+        self.post_sale('key-2')
+
+        self.assertEqual(Invoice.objects.count(), 2)
+        self.assertEqual(Product.objects.filter(product_quantity=3).count(), 2)
+
+    @override_settings(IDEMPOTENCY_KEY_TTL=0)
+    def test_expired_keys_are_purged_and_not_replayed(self):
+        self.post_sale('key-1')
+        self.post_sale('key-1')
+
+        self.assertEqual(Invoice.objects.count(), 2)
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+
+
+class OfflineSyncTests(TestCase):
+    def setUp(self):
+        reset_caches()
+        self.user = User.objects.create_user('cashier', password='secret')
+        self.client.force_login(self.user)
+
+    def sync(self, sales):
+        return self.client.post(
+            reverse('pages:sync_sales'),
+            data=json.dumps({'sales': sales}),
+            content_type='application/json',
+        )
+
+    def test_sales_are_applied_in_order_against_remaining_stock(self):
+        product = make_products(1, quantity=5)[0]
+        sales = [
+            dict(make_sale([product], quantity=2), idempotency_key='a', date_issued='2026-01-02T10:00:00'),
+            dict(make_sale([product], quantity=2), idempotency_key='b'),
+            dict(make_sale([product], quantity=2), idempotency_key='c'),
+            dict(make_sale([product], quantity=1), idempotency_key='a'),
+        ]
+
+        response = self.sync(sales)
+
+        results = response.json()['results']
+        self.assertEqual([r['success'] for r in results], [True, True, False, True])
+        self.assertIn('Available: 1, Requested: 2', results[2]['error'])
+        self.assertEqual(results[3]['invoice_number'], results[0]['invoice_number'])
+        self.assertEqual(response.json()['applied'], 3)
+        product.refresh_from_db()
+        self.assertEqual(product.product_quantity, 1)
+        self.assertEqual(Invoice.objects.count(), 2)
+        self.assertEqual(Invoice.objects.get(invoice_number=results[0]['invoice_number']).date_issued.day, 2)
+
+    def test_replaying_a_backlog_does_not_apply_it_twice(self):
+        product = make_products(1, quantity=5)[0]
+        sales = [dict(make_sale([product]), idempotency_key=f'sale-{i}') for i in range(3)]
+
+        first = self.sync(sales).json()['results']
+        second = self.sync(sales).json()['results']
+
+        self.assertTrue(all(result['replayed'] for result in second))
+        self.assertEqual([r['invoice_id'] for r in first], [r['invoice_id'] for r in second])
+        product.refresh_from_db()
+        self.assertEqual(product.product_quantity, 2)
+
+    def test_sync_needs_the_csrf_token(self):
+        product = make_products(1, quantity=5)[0]
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+
+        response = client.post(
+            reverse('pages:sync_sales'),
+            data=json.dumps({'sales': [dict(make_sale([product]), idempotency_key='a')]}),
+            content_type='application/json',
+        )
+
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Invoice.objects.exists())
+
+    def test_queries_do_not_grow_with_backlog_size(self):
+        products = make_products(3, quantity=1000)
+        query_counts = {}
+        for batch_size in (2, 20):
+            sales = [
+                dict(make_sale(products), idempotency_key=f'{batch_size}-{i}')
+                for i in range(batch_size)
+            ]
+            with CaptureQueriesContext(connection) as queries:
+                results = process_sales_batch(sales, self.user, 'Cashier')
+            self.assertTrue(all(result['success'] for result in results))
+            query_counts[batch_size] = len(queries)
+
+        self.assertEqual(query_counts[2], query_counts[20], query_counts)
+
+
+class SalesSummaryTests(TestCase):
+    def setUp(self):
+        reset_caches()
+        self.user = User.objects.create_superuser('admin', password='secret')
+        self.tax_rate = TaxRate.objects.create(name='VAT', percentage=Decimal('12.00'))
+        self.food = make_products(2, price='10.00', category=Category.objects.create(name='Food'))
+        self.drinks = make_products(1, price='5.00', category=Category.objects.create(name='Drinks'))
+
+    def summary(self):
+        return {
+            row.category: (row.revenue, row.tax, row.transactions, row.units)
+            for row in DailySalesSummary.objects.all()
+        }
+
+    def test_sales_are_rolled_up_by_category(self):
+        process_sale(make_sale(self.food + self.drinks, quantity=2), self.user, 'Cashier', self.tax_rate)
+        process_sale(make_sale(self.drinks), self.user, 'Cashier', self.tax_rate)
+
+        self.assertEqual(self.summary(), {
+            ALL_CATEGORIES: (Decimal('55.00'), Decimal('6.60'), 2, 7),
+            'Food': (Decimal('40.00'), Decimal('4.80'), 1, 4),
+            'Drinks': (Decimal('15.00'), Decimal('1.80'), 2, 3),
+        })
+        totals = sales_totals(timezone.localdate(), timezone.localdate(), 'cashier')
+        self.assertEqual(totals, {'total': Decimal('61.60'), 'tax': Decimal('6.60'), 'transactions': 2})
+
+    def test_offline_batch_is_rolled_up_on_the_day_it_was_rung_up(self):
+        process_sales_batch([
+            dict(make_sale(self.food), date_issued='2026-01-02T10:00:00'),
+            dict(make_sale(self.drinks), date_issued='2026-01-02T11:00:00'),
+        ], self.user, 'Cashier', self.tax_rate)
+
+        row = DailySalesSummary.objects.get(category=ALL_CATEGORIES)
+        self.assertEqual((str(row.day), row.revenue, row.transactions), ('2026-01-02', Decimal('25.00'), 2))
+
+    def test_soft_delete_and_edit_update_the_rollup(self):
+        invoice, sold_items = process_sale(make_sale(self.food), self.user, 'Cashier', self.tax_rate)
+        other, _ = process_sale(make_sale(self.drinks), self.user, 'Cashier', self.tax_rate)
+
+        other.delete()
+        self.assertEqual(self.summary()[ALL_CATEGORIES], (Decimal('20.00'), Decimal('2.40'), 1, 2))
+        self.assertEqual(self.summary()['Drinks'], (Decimal('0.00'), Decimal('0.00'), 0, 0))
+
+        self.client.force_login(self.user)
+        self.client.post(reverse('pages:sales_edit', args=[invoice.id]), {
+            'staff_name': 'Other',
+            'cash_received': '100',
+            'change': '0',
+            f'quantity_{sold_items[0].id}': '3',
+            f'unit_price_{sold_items[0].id}': '10.00',
+        })
+        self.assertEqual(sales_totals(cashier='Cashier')['transactions'], 0)
+        self.assertEqual(
+            DailySalesSummary.objects.get(cashier='Other', category='Food').units, 4
+        )
+
+    def test_rebuild_matches_incremental_rollup(self):
+        process_sale(make_sale(self.food + self.drinks), self.user, 'Cashier', self.tax_rate)
+        process_sale(make_sale(self.drinks, quantity=3), self.user, 'Other', self.tax_rate)
+        deleted, _ = process_sale(make_sale(self.food), self.user, 'Other', self.tax_rate)
+        deleted.delete()
+        incremental = {
+            (row.day, row.cashier, row.category): (row.revenue, row.tax, row.transactions, row.units)
+            for row in DailySalesSummary.objects.exclude(transactions=0)
+        }
+
+        call_command('rebuild_sales_summary', stdout=io.StringIO())
+
+        rebuilt = {
+            (row.day, row.cashier, row.category): (row.revenue, row.tax, row.transactions, row.units)
+            for row in DailySalesSummary.objects.all()
+        }
+        self.assertEqual(rebuilt, incremental)
+
+    def test_dashboard_reads_the_rollup(self):
+        process_sale(make_sale(self.food), self.user, 'Cashier', self.tax_rate)
+        self.client.force_login(self.user)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('pages:admin_dashboard'))
+
+        self.assertEqual(response.context['today_sales'], 22.4)
+        self.assertEqual(response.context['today_orders'], 1)
+        self.assertFalse(any('SUM("pages_invoice"' in query['sql'] for query in queries))
+
+
+def check_pdf_structure(test, pdf):
+    """Check that every object the cross-reference table lists is where it
+    says, and every stream is as long as its /Length says, as readers expect"""
+    xref = int(re.search(rb'startxref\s+(\d+)\s+%%EOF\s*$', pdf).group(1))
+    header = re.compile(rb'xref\s+0 (\d+)\s+').match(pdf, xref)
+    test.assertIsNotNone(header)
+    entries = pdf[header.end():header.end() + 20 * int(header.group(1))]
+    for number, entry in enumerate(re.findall(rb'(\d{10}) \d{5} ([nf])', entries)):
+        offset, kind = entry
+        if kind == b'n':
+            test.assertTrue(pdf.startswith(b'%d 0 obj' % number, int(offset)), f'object {number}')
+    for match in re.finditer(rb'/Length (\d+)[^>]*>>\s*stream\r?\n', pdf):
+        end = match.end() + int(match.group(1))
+        test.assertRegex(pdf[end:end + 12], rb'^\s*endstream')
+
+
+def pdf_streams(pdf):
+    """The decompressed streams of a PDF made by reportlab, to look for drawn text"""
+    streams = []
+    for match in re.finditer(rb'stream\r?\n(.*?)endstream', pdf, re.S):
+        content = match.group(1).strip()
+        if content.endswith(b'~>'):
+            content = base64.a85decode(content, adobe=True)
+        try:
+            streams.append(zlib.decompress(content))
+        except zlib.error:
+            streams.append(content)
+    return streams
+
+
+class SalesReportTests(TestCase):
+    def setUp(self):
+        reset_caches()
+        self.user = User.objects.create_superuser('admin', password='secret')
+        self.products = make_products(3, quantity=1000)
+
+    def make_sales(self, count):
+        process_sales_batch([
+            dict(make_sale(self.products[:1 + i % 3], quantity=1 + i % 2),
+                 date_issued=f'2026-03-{1 + i % 4:02d}T10:00:00')
+            for i in range(count)
+        ], self.user, 'Cashier')
+
+    def test_report_data_is_aggregated_in_the_database(self):
+        self.make_sales(8)
+
+        data = sales_report_data(Invoice.objects.order_by('-date_issued'))
+
+        totals = [invoice.total_amount for invoice in Invoice.objects.all()]
+        self.assertEqual(data['total_sales'], sum(totals))
+        self.assertEqual(data['total_transactions'], 8)
+        self.assertEqual((data['max_sale'], data['min_sale']), (max(totals), min(totals)))
+        self.assertEqual(data['days'], 4)
+        self.assertEqual(data['cashiers'], [{'staff_name': 'Cashier', 'sales': sum(totals), 'transactions': 8}])
+        self.assertEqual(data['top_products'][0], {'product_name': 'Product 0', 'quantity': 12})
+        self.assertEqual(data['product_count'], 3)
+        self.assertEqual(sum(invoice['item_count'] for invoice in data['recent']), 15)
+
+    def test_report_queries_do_not_grow_with_invoices(self):
+        query_counts = {}
+        for count in (1, 30):
+            self.make_sales(count)
+            with CaptureQueriesContext(connection) as queries:
+                sales_report_data(Invoice.objects.order_by('-date_issued'))
+            query_counts[count] = len(queries)
+
+        self.assertEqual(query_counts[1], query_counts[30], query_counts)
+
+    def test_report_pdfs(self):
+        self.make_sales(12)
+        order = PurchaseOrder.objects.create(supplier_name='Acme', expected_date='2026-03-01', status='Received',
+                                             total_cost=1250)
+        for name in ('Paper', 'Ink', 'Tape', 'Glue'):
+            PurchaseItem.objects.create(purchase_order=order, product_name=name, quantity=5, cost_per_unit=62.5)
+
+        with CaptureQueriesContext(connection) as queries:
+            sales_pdf = generate_sales_report_pdf(Invoice.objects.order_by('-date_issued'), {'date_from': '2026-03-02'})
+            purchase_pdf = generate_purchase_report_pdf(PurchaseOrder.objects.filter(status='Received'))
+
+        self.assertTrue(sales_pdf.startswith(b'%PDF'))
+        self.assertTrue(purchase_pdf.startswith(b'%PDF'))
+        self.assertLess(len(queries), 20)
+        data = purchase_report_data(PurchaseOrder.objects.all())
+        self.assertEqual(data['suppliers'], [{'supplier_name': 'Acme', 'purchases': 1250.0, 'orders': 1, 'items': 4}])
+        self.assertEqual(data['recent'][0]['items'], [('Paper', 5), ('Ink', 5), ('Tape', 5)])
+        self.assertEqual(data['medium_orders'], 1)
+
+    def test_report_engine(self):
+        self.make_sales(3)
+        data = sales_report_data(Invoice.objects.all())
+        timings = {}
+        pdf = render_sales_report_pdf(data, {'cashier': 'Cashier'}, timings)
+        self.assertTrue(pdf.startswith(b'%PDF'))
+        self.assertEqual(list(timings), [section['name'] for section in SALES_REPORT['sections']])
+        self.assertTrue(all(part >= 0 for parts in timings.values() for part in parts.values()))
+        # Styles are built once and shared by every render
+        self.assertIs(pdf_styles(), pdf_styles())
+
+        # Sections whose data is missing are left out
+        timings = {}
+        render_purchase_report_pdf(purchase_report_data(PurchaseOrder.objects.none()), None, timings)
+        self.assertEqual(list(timings), ['header', 'summary', 'recent', 'footer'])
+
+    def test_detailed_report_lists_every_invoice_over_numbered_pages(self):
+        self.make_sales(120)
+        data = sales_report_data(Invoice.objects.all())
+
+        pdf = render_detailed_sales_report_pdf(data, {})
+
+        streams = pdf_streams(pdf)
+        pages = len(re.findall(rb'/Type /Page\b', pdf))
+        self.assertGreater(pages, 3)
+        self.assertTrue(all(b'(Page %d of ) Tj' % page in b''.join(streams) for page in range(1, pages + 1)))
+        # The count every page refers to
+        self.assertIn(b'(%d) Tj' % pages, b''.join(streams))
+        # Pages are compressed by ReportCanvas itself, with reportlab's internals
+        check_pdf_structure(self, pdf)
+        self.assertEqual(len(re.findall(rb'/Contents \d+ 0 R', pdf)), pages)
+        for invoice in Invoice.objects.all():
+            self.assertIn(b'(%s) Tj' % invoice.invoice_number.encode(), b''.join(streams))
+
+    def test_detailed_report_memory_grows_only_with_the_pdf(self):
+        # reportlab keeps the finished pages and builds the whole file in
+        # memory at the end, so memory can't be flat; but it must be the
+        # PDF that grows, not rows or flowables held for every invoice
+        section = next(section for section in DETAILED_SALES_REPORT['sections'] if section['name'] == 'transactions')
+        day = timezone.now()
+
+        def render(count):
+            rows = ((f'INV-{i:06d}', day, 'CUST-001', 'Cashier', Decimal('100.00'), Decimal('12.00'),
+                     Decimal('112.00'), True) for i in range(count))
+            data = dict(sales_report_data(Invoice.objects.none()), total_transactions=count, max_sale=Decimal('112.00'))
+            path = os.path.join(self.directory, f'{count}.pdf')
+            with mock.patch.dict(section, rows=lambda filters: rows):
+                tracemalloc.start()
+                try:
+                    render_detailed_sales_report_pdf(data, {}, output=path)
+                    peak = tracemalloc.get_traced_memory()[1]
+                finally:
+                    tracemalloc.stop()
+            return peak, os.path.getsize(path)
+
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        small_peak, small_size = render(500)
+        large_peak, large_size = render(2500)
+
+        self.assertLess(large_peak - small_peak, 6 * (large_size - small_size))
+
+    @unittest.skipUnless(pypdf, 'needs pypdf')
+    def test_detailed_report_reads_back(self):
+        self.make_sales(120)
+        pdf = render_detailed_sales_report_pdf(sales_report_data(Invoice.objects.all()), {})
+
+        reader = pypdf.PdfReader(io.BytesIO(pdf), strict=True)
+        pages = len(reader.pages)
+        text = ''.join(page.extract_text() for page in reader.pages)
+        for number, page in enumerate(reader.pages, 1):
+            # The count is drawn from a form, so may be read as a separate line
+            self.assertRegex(page.extract_text(), rf'Page {number} of\s*{pages}\b')
+        self.assertEqual(text.count('INV-'), 120)
+
+    def test_row_stream_reads_a_page_of_rows_at_a_time(self):
+        read = []
+
+        def rows():
+            for i in range(1000):
+                read.append(i)
+                yield (f'INV-{i}', i)
+
+        stream = RowStream(['Invoice', 'Amount'], rows(), [100, 100], numeric_from=1)
+        page, rest = stream.split(200, 14 * 11)
+
+        self.assertIs(rest, stream)
+        # Ten rows under the header, and one read ahead
+        self.assertEqual(len(page.rows), 10)
+        self.assertEqual(len(read), 11)
+        self.assertEqual(len(stream.split(200, 14 * 2000)), 1)
+        self.assertEqual(len(read), 1000)
+
+    def test_row_stream_cuts_long_text(self):
+        text, width = RowStream.fit('Notebook ' * 40, 100)
+        self.assertTrue(text.endswith('…'))
+        self.assertLessEqual(width, 100 - 12)
+        self.assertGreater(stringWidth(text[:-1] + 'N…', 'Helvetica', 8), 100 - 12)
+        self.assertEqual(RowStream.fit('INV-1', 100), ('INV-1', stringWidth('INV-1', 'Helvetica', 8)))
+
+
+class ReportJobTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        reset_caches()
+        self.user = User.objects.create_superuser('admin', password='secret')
+        self.client.force_login(self.user)
+        process_sale(make_sale(make_products(2)), self.user, 'Cashier')
+        check_in('test-worker')
+
+    def test_report_is_queued_rendered_and_served(self):
+        response = self.client.get(reverse('pages:print_sales_report'), {'date_from': '2026-03-02', 'cashier': 'None'})
+        job = ReportJob.objects.get()
+        self.assertRedirects(response, reverse('pages:report_job', args=[job.id]), fetch_redirect_response=False)
+        self.assertEqual(job.filters, {'date_from': '2026-03-02'})
+
+        status = self.client.get(reverse('pages:report_job', args=[job.id]), {'format': 'json'}).json()
+        self.assertEqual(status['status'], ReportJob.PENDING)
+        self.assertContains(self.client.get(status['url']), 'Preparing the report')
+
+        self.assertEqual(run_jobs(), 1)
+
+        response = self.client.get(status['url'])
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+
+    def test_report_is_rendered_in_the_request_without_a_worker(self):
+        ReportWorker.objects.update(seen_at=timezone.now() - timedelta(minutes=5))
+        response = self.client.get(reverse('pages:print_sales_report'), {'format': 'json'})
+        self.assertEqual(response.json()['status'], ReportJob.DONE)
+
+        check_out('test-worker')
+        response = self.client.get(reverse('pages:print_purchase_report'), {'format': 'json'})
+        self.assertEqual(response.json()['status'], ReportJob.DONE)
+        self.assertFalse(worker_running())
+
+    def test_reports_asked_for_while_a_request_renders_are_rendered_too(self):
+        check_out('test-worker')
+        render = report_jobs.render_sales_report_pdf
+        during = []
+
+        def render_and_ask_again(*args, **kwargs):
+            # Another manager prints a report while this one is rendering
+            during.append(self.client.get(reverse('pages:print_purchase_report'), {'format': 'json'}).json())
+            return render(*args, **kwargs)
+
+        with mock.patch.object(report_jobs, 'render_sales_report_pdf', render_and_ask_again):
+            response = self.client.get(reverse('pages:print_sales_report'), {'format': 'json'})
+
+        self.assertEqual(response.json()['status'], ReportJob.DONE)
+        self.assertEqual(during[0]['status'], ReportJob.DONE)
+
+    def test_job_left_running_by_a_dead_request_is_rendered_again(self):
+        check_out('test-worker')
+        job = enqueue_report(ReportJob.SALES, {})
+        ReportJob.objects.filter(pk=job.pk).update(
+            status=ReportJob.RUNNING, started_at=timezone.now() - timedelta(hours=1))
+
+        response = self.client.get(reverse('pages:print_sales_report'), {'format': 'json'})
+
+        self.assertEqual(response.json(), dict(response.json(), job_id=job.pk, status=ReportJob.DONE))
+
+    def test_same_filters_share_a_job_until_it_goes_stale(self):
+        first = enqueue_report(ReportJob.SALES, {'date_from': '2026-3-2', 'cashier': ' Ana '})
+        self.assertEqual(enqueue_report(ReportJob.SALES, {'cashier': 'Ana', 'date_from': '2026-03-02'}), first)
+        self.assertNotEqual(enqueue_report(ReportJob.PURCHASES, {'date_from': '2026-03-02'}).key, first.key)
+
+        run_jobs(limit=5)
+        self.assertEqual(enqueue_report(ReportJob.SALES, {'cashier': 'Ana', 'date_from': '2026-03-02'}), first)
+        ReportJob.objects.filter(pk=first.pk).update(finished_at=timezone.now() - timedelta(hours=1))
+        self.assertNotEqual(enqueue_report(ReportJob.SALES, {'cashier': 'Ana', 'date_from': '2026-03-02'}), first)
+
+    def test_failed_render_is_reported(self):
+        job = enqueue_report(ReportJob.SALES, {})
+        # Filters saved by an older version, that this one can't read
+        ReportJob.objects.filter(pk=job.pk).update(filters=['2026-03-02'])
+
+        run_jobs()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ReportJob.FAILED)
+        self.assertFalse(self.client.get(reverse('pages:report_job', args=[job.id]), {'format': 'json'}).json()['success'])
+
+    def test_detailed_report_is_a_separate_job(self):
+        summary = enqueue_report(ReportJob.SALES, {})
+        detailed = enqueue_report(ReportJob.SALES, {'detailed': '1'})
+        self.assertNotEqual(detailed, summary)
+        self.assertEqual(detailed.filters, {'detailed': '1'})
+
+        run_jobs(limit=2)
+
+        detailed.refresh_from_db()
+        self.assertEqual(detailed.status, ReportJob.DONE)
+        with detailed.file.open('rb') as file:
+            self.assertIn(b'INV-', b''.join(pdf_streams(file.read())))
+
+
+class ReceiptCacheTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        reset_caches()
+        self.user = User.objects.create_superuser('admin', password='secret')
+        self.client.force_login(self.user)
+        tax_rate = TaxRate.objects.create(name='VAT', percentage=Decimal('12.00'))
+        self.invoice, self.sold_items = process_sale(make_sale(make_products(2), quantity=2), self.user, 'Cashier', tax_rate)
+        self.url = reverse('pages:print_invoice_pdf', args=[self.invoice.id])
+
+    def receipts(self):
+        return os.listdir(os.path.join(self.media_root, 'receipts', str(self.invoice.id)))
+
+    def test_reprint_reads_the_cached_file(self):
+        first = self.client.get(self.url)
+        self.assertEqual(b''.join(first.streaming_content)[:4], b'%PDF')
+        self.assertEqual(self.receipts(), [first['ETag'].strip('"') + '.pdf'])
+
+        with mock.patch('pages.receipts.generate_invoice_pdf') as render:
+            again = self.client.get(reverse('pages:download_invoice_pdf', args=[self.invoice.id]))
+            not_modified = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        render.assert_not_called()
+        self.assertEqual(again['ETag'], first['ETag'])
+        self.assertIn('attachment', again['Content-Disposition'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_edit_invalidates_the_receipt(self):
+        etag = self.client.get(self.url)['ETag']
+
+        self.client.post(reverse('pages:sales_edit', args=[self.invoice.id]), {
+            'staff_name': 'Cashier',
+            'cash_received': '100',
+            'change': '0',
+            f'quantity_{self.sold_items[0].id}': '3',
+            f'unit_price_{self.sold_items[0].id}': '10.00',
+        })
+        self.assertEqual(self.receipts(), [])
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class ThermalReceiptTests(TestCase):
+    def setUp(self):
+        reset_caches()
+        self.user = User.objects.create_user('cashier', password='secret')
+        self.client.force_login(self.user)
+        TaxRate.objects.create(name='VAT', percentage=Decimal('12.00'))
+        self.products = make_products(2)
+
+    def test_escpos_and_text_receipts(self):
+        invoice, _ = process_sale(make_sale(self.products, quantity=2), self.user, 'Cashier', get_active_tax_rate())
+        url = reverse('pages:invoice_receipt', args=[invoice.id])
+
+        text = self.client.get(url, {'format': 'text'}).content.decode()
+        self.assertIn(f'TRANS#: {invoice.invoice_number}', text)
+        self.assertIn('TOTAL:' + '44.80'.rjust(42), text)
+        self.assertTrue(all(len(line) <= 48 for line in text.splitlines()))
+
+        escpos = self.client.get(url).content
+        self.assertTrue(escpos.startswith(b'\x1b@'))
+        self.assertTrue(escpos.endswith(b'\x1dVB\x03'))
+        self.assertIn(b'\x1ba\x01\x1bE\x01\x1d!\x01STOCKSMART\n', escpos)
+
+    def test_sale_is_printed_on_the_network_printer(self):
+        printer = socket.create_server(('127.0.0.1', 0))
+        printer.settimeout(5)
+        self.addCleanup(printer.close)
+
+        for name in ('pages:create_invoice', 'pages:acreate_invoice'):
+            with self.subTest(name), override_settings(RECEIPT_PRINTER='127.0.0.1:%d' % printer.getsockname()[1]):
+                response = self.client.post(
+                    reverse(name), data=json.dumps(make_sale(self.products)), content_type='application/json',
+                )
+                self.assertTrue(response.json()['success'])
+
+                connection, _ = printer.accept()
+                with connection:
+                    connection.settimeout(5)
+                    received = b''
+                    while chunk := connection.recv(4096):
+                        received += chunk
+                self.assertIn(response.json()['invoice_number'].encode(), received)
+                self.assertTrue(received.endswith(b'\x1dVB\x03'))
+
+
+class ReportWorkerTests(MediaRootMixin, TransactionTestCase):
+    def test_worker_renders_in_a_process_pool(self):
+        reset_caches()
+        user = User.objects.create_user('cashier', password='secret')
+        process_sale(make_sale(make_products(2)), user, 'Cashier')
+        sales = enqueue_report(ReportJob.SALES, {})
+        purchases = enqueue_report(ReportJob.PURCHASES, {})
+
+        call_command('run_report_worker', processes=2, once=True, stdout=io.StringIO())
+        # It checks out when it stops
+        self.assertFalse(ReportWorker.objects.exists())
+
+        for job in (sales, purchases):
+            job.refresh_from_db()
+            self.assertEqual(job.status, ReportJob.DONE, job.error)
+            with job.file.open('rb') as file:
+                self.assertTrue(file.read().startswith(b'%PDF'))
+
+
+class ReportExportTests(TestCase):
+    def setUp(self):
+        reset_caches()
+        self.user = User.objects.create_superuser('admin', password='secret')
+        self.client.force_login(self.user)
+        self.products = make_products(2, quantity=1000)
+
+    def export(self, name, **params):
+        response = self.client.get(reverse(f'pages:{name}'), params)
+        self.assertTrue(response.streaming)
+        return list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+
+    def test_invoice_and_line_item_exports_use_the_report_filters(self):
+        process_sales_batch([
+            dict(make_sale(self.products), date_issued=f'2026-03-{day:02d}T10:00:00') for day in (1, 2, 3)
+        ], self.user, 'Cashier')
+
+        invoices = self.export('export_sales_report', date_from='2026-03-02')
+        self.assertEqual([row['invoice_number'] for row in invoices],
+                         list(Invoice.objects.filter(date_issued__day__gte=2)
+                              .order_by('-date_issued').values_list('invoice_number', flat=True)))
+        self.assertEqual(invoices[0]['date_issued'], '2026-03-03 10:00:00')
+
+        with CaptureQueriesContext(connection) as queries:
+            items = self.export('export_sales_report', rows='items', date_to='2026-03-01')
+        self.assertEqual([row['product'] for row in items], ['Product 0', 'Product 1'])
+        self.assertEqual(items[0]['category'], 'Supplies')
+        self.assertLessEqual(len(queries), 3)
+
+    def test_purchase_item_export(self):
+        received = PurchaseOrder.objects.create(supplier_name='Acme', expected_date='2026-03-01', status='Received')
+        pending = PurchaseOrder.objects.create(supplier_name='Acme', expected_date='2026-03-01')
+        PurchaseItem.objects.create(purchase_order=received, product_name='Paper', quantity=3, cost_per_unit=2.5)
+        PurchaseItem.objects.create(purchase_order=pending, product_name='Ink', quantity=1, cost_per_unit=9)
+
+        rows = self.export('export_purchase_report', supplier='Acme')
+
+        self.assertEqual([(row['product'], row['total_cost']) for row in rows], [('Paper', '7.5')])
+
+    @unittest.skipUnless(openpyxl, 'needs openpyxl')
+    def test_xlsx_export(self):
+        process_sale(make_sale(self.products), self.user, 'Cashier')
+
+        response = self.client.get(reverse('pages:export_sales_report'), {'rows': 'items', 'format': 'xlsx'})
+
+        self.assertIn('.xlsx', response['Content-Disposition'])
+        workbook = openpyxl.load_workbook(io.BytesIO(b''.join(response.streaming_content)), read_only=True)
+        rows = list(workbook.active.values)
+        # Same columns as the CSV export
+        self.assertEqual(list(rows[0]), list(self.export('export_sales_report', rows='items')[0]))
+        self.assertEqual([row[rows[0].index('product')] for row in rows[1:]], ['Product 0', 'Product 1'])
+
+
+class StockHoldTests(TestCase):
+    def setUp(self):
+        reset_caches()
+        self.user = User.objects.create_user('cashier', password='secret')
+        self.product = make_products(1, quantity=5)[0]
+
+    def test_holds_reduce_available_quantity(self):
+        set_hold('terminal-a', self.product.id, 3)
+        available = set_hold('terminal-b', self.product.id, 2)
+
+        self.assertEqual(available, 0)
+        with self.assertRaisesMessage(ReservationError, 'Available: 0, Requested: 1'):
+            set_hold('terminal-c', self.product.id, 1)
+
+        # Changing a hold only moves the difference
+        self.assertEqual(set_hold('terminal-a', self.product.id, 1), 2)
+        self.assertEqual(set_hold('terminal-a', self.product.id, 0), 3)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reserved_quantity, 2)
+        self.assertEqual(StockHold.objects.count(), 1)
+
+    def test_checkout_uses_own_holds_and_respects_others(self):
+        set_hold('terminal-a', self.product.id, 3)
+        set_hold('terminal-b', self.product.id, 2)
+
+        with self.assertRaisesMessage(CheckoutError, 'Available: 3, Requested: 4'):
+            process_sale(make_sale([self.product], quantity=4), self.user, 'Cashier', terminal='terminal-a')
+        with self.assertRaisesMessage(CheckoutError, 'Available: 0, Requested: 1'):
+            process_sale(make_sale([self.product]), self.user, 'Cashier')
+
+        process_sale(make_sale([self.product], quantity=3), self.user, 'Cashier', terminal='terminal-a')
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.product_quantity, 2)
+        self.assertEqual(self.product.reserved_quantity, 2)
+        self.assertFalse(StockHold.objects.filter(terminal='terminal-a').exists())
+
+    def test_sweeper_returns_expired_holds_in_bulk(self):
+        other = make_products(1, quantity=5)[0]
+        for terminal in ('terminal-a', 'terminal-b', 'terminal-c'):
+            set_hold(terminal, self.product.id, 1)
+            set_hold(terminal, other.id, 1)
+        StockHold.objects.filter(terminal='terminal-c').update(expires_at=timezone.now() + timedelta(hours=1))
+
+        with CaptureQueriesContext(connection) as queries:
+            swept = sweep_expired_holds(now=timezone.now() + timedelta(minutes=30), batch_size=10)
+
+        self.assertEqual(swept, 4)
+        # select, fetch, one UPDATE, one DELETE, version bump and read, change
+        # log upsert, then the empty select
+        self.assertEqual(len([q for q in queries if not q['sql'].startswith(('SAVEPOINT', 'RELEASE'))]), 8)
+        self.assertEqual(list(Product.objects.values_list('reserved_quantity', flat=True)), [1, 1])
+
+    def test_hold_endpoint(self):
+        self.client.force_login(self.user)
+        url = reverse('pages:hold_stock')
+
+        response = self.client.post(url, json.dumps({'product_id': self.product.id, 'quantity': 4}),
+                                    content_type='application/json')
+        self.assertEqual(response.json()['available_quantity'], 1)
+
+        set_hold('terminal-b', self.product.id, 1)
+        response = self.client.post(url, json.dumps({'product_id': self.product.id, 'quantity': 5}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['available_quantity'], 4)
+
+        response = self.client.post(reverse('pages:release_stock_holds'))
+        self.assertEqual(response.json()['released'], 1)
+
+    def test_hold_endpoints_need_the_csrf_token(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        body = json.dumps({'product_id': self.product.id, 'quantity': 4})
+
+        response = client.post(reverse('pages:hold_stock'), body, content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+        response = client.post(reverse('pages:release_stock_holds'))
+        self.assertEqual(response.status_code, 403)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reserved_quantity, 0)
+
+        client.get(reverse('pages:cashier_dashboard'))
+        response = client.post(reverse('pages:hold_stock'), body, content_type='application/json',
+                               headers={'X-CSRFToken': client.cookies['csrftoken'].value})
+        self.assertEqual(response.json()['available_quantity'], 1)
+
+    def test_editing_and_restocking_keep_holds_made_meanwhile(self):
+        self.client.force_login(self.user)
+
+        def read_then_hold(*args, **kwargs):
+            product = Product.objects.get(id=self.product.id)
+            set_hold('terminal-b', self.product.id, 2)
+            return product
+
+        with mock.patch('pages.views.get_object_or_404', side_effect=read_then_hold):
+            self.client.post(reverse('pages:edit_product', args=[self.product.id]), {
+                'sku': '', 'name': 'Renamed', 'price': '2.50', 'quantity': '5',
+            })
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.product_name, 'Renamed')
+        self.assertEqual(self.product.reserved_quantity, 2)
+
+        def read_then_sell(*args, **kwargs):
+            product = Product.objects.get(id=self.product.id)
+            process_sale(make_sale([self.product]), self.user, 'Cashier')
+            return product
+
+        with mock.patch('pages.views.get_object_or_404', side_effect=read_then_sell):
+            self.client.post(reverse('pages:restock_product', args=[self.product.id]), {'restock_qty': '10'})
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.product_quantity, 14)
+        self.assertEqual(self.product.reserved_quantity, 2)
+
+
+def csv_rows(text):
+    return read_product_rows(io.BytesIO(text.encode()), 'products.csv')
+
+
+class ProductSpreadsheetTests(TestCase):
+    def setUp(self):
+        reset_caches()
+        self.user = User.objects.create_user('admin', password='secret')
+        self.pens = Category.objects.create(name='Pens')
+        self.ballpen = Product.objects.create(
+            product_name='Ballpen', product_price=Decimal('12.00'), product_quantity=5,
+            product_category=self.pens, sku='BP-1')
+
+    def test_import_upserts_in_chunks(self):
+        lines = ['SKU,Product Name,Category,Price,Stock', 'bp-1,,,13.50,']
+        lines += [f'N-{i},Notebook {i},Paper,{i}.25,{i}' for i in range(25)]
+
+        with CaptureQueriesContext(connection) as queries:
+            result = import_products(csv_rows('\n'.join(lines)), chunk_size=10)
+
+        self.assertEqual((result['created'], result['updated'], result['errors']), (25, 1, []))
+        self.ballpen.refresh_from_db()
+        self.assertEqual((self.ballpen.product_price, self.ballpen.product_quantity), (Decimal('13.50'), 5))
+        notebook = Product.objects.get(sku='N-7')
+        self.assertEqual((notebook.product_name, notebook.product_category.name), ('Notebook 7', 'Paper'))
+        self.assertEqual(Category.objects.filter(name='Paper').count(), 1)
+        self.assertEqual(search_products('notebook 7')[0]['id'], notebook.id)
+        # Per chunk, not per row
+        self.assertLess(len(queries), 40)
+
+    def test_dry_run_reports_the_diff_without_writing(self):
+        result = import_products(csv_rows('sku,name,category,price\nBP-1,Ballpen Blue,Pens,12.00\nX-1,Eraser,Misc,5'), dry_run=True)
+
+        self.assertEqual((result['created'], result['updated'], result['new_categories']), (1, 1, ['Misc']))
+        self.assertEqual(result['changes'][0]['fields'], {'name': ('Ballpen', 'Ballpen Blue')})
+        self.assertEqual(result['changes'][1]['action'], 'create')
+        self.assertFalse(Product.objects.filter(sku='X-1').exists())
+        self.assertFalse(Category.objects.filter(name='Misc').exists())
+        self.assertEqual(Product.objects.get(sku='BP-1').product_name, 'Ballpen')
+
+    def test_bad_rows_are_skipped(self):
+        other = Product.objects.create(product_name='Marker', product_price=Decimal('30.00'), sku='MK-1')
+        text = '\n'.join([
+            'id,sku,name,price',
+            ',A-1,Good,1.00',
+            ',A-2,Bad price,abc',
+            '999999,,Ghost,1.00',
+            ',A-1,Again,2.00',
+            f'{other.id},BP-1,Marker,30.00',
+            ',,No price,',
+            ',A-3,Not a number,NaN',
+            ',A-4,Signalling,sNaN',
+            ',A-5,Endless,Infinity',
+            ',A-6,Pricey,1e30',
+            '1e400,,Huge id,1.00',
+        ])
+
+        result = import_products(csv_rows(text))
+
+        self.assertEqual(result['created'], 1)
+        self.assertEqual(sorted(line for line, _ in result['errors']), list(range(3, 13)))
+        self.assertEqual(Product.objects.get(id=other.id).sku, 'MK-1')
+
+    def test_bad_quantities_are_skipped(self):
+        text = 'sku,name,price,quantity\nQ-1,Many,1.00,1e400\nQ-2,Not a number,1.00,nan\nQ-3,Lots,1.00,1e12\n'
+
+        result = import_products(csv_rows(text))
+
+        self.assertEqual((result['created'], [line for line, _ in result['errors']]), (0, [2, 3, 4]))
+
+    def test_export_streams_a_file_that_imports_unchanged(self):
+        make_products(3, category=self.pens)
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse('pages:product_export'))
+
+        self.assertTrue(response.streaming)
+        content = b''.join(response.streaming_content).decode()
+        self.assertTrue(content.startswith('id,sku,name,category,price,quantity'))
+        result = import_products(csv_rows(content))
+        self.assertEqual((result['created'], result['updated'], result['unchanged']), (0, 0, 4))
+
+    @unittest.skipUnless(openpyxl, 'needs openpyxl')
+    def test_xlsx_import(self):
+        workbook = openpyxl.Workbook()
+        workbook.active.append(['SKU', 'Product Name', 'Price', 'Stock'])
+        workbook.active.append(['bp-1', None, 13.5, None])
+        workbook.active.append(['N-1', 'Notebook', 25, 7])
+        upload = io.BytesIO()
+        workbook.save(upload)
+        upload.seek(0)
+
+        result = import_products(read_product_rows(upload, 'Prices.XLSX'))
+
+        self.assertEqual((result['created'], result['updated'], result['errors']), (1, 1, []))
+        self.assertEqual(Product.objects.get(sku='BP-1').product_price, Decimal('13.50'))
+        notebook = Product.objects.get(sku='N-1')
+        self.assertEqual((notebook.product_price, notebook.product_quantity), (Decimal('25.00'), 7))
+
+        # And the XLSX export reads back unchanged
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('pages:product_export'), {'format': 'xlsx'})
+        exported = io.BytesIO(b''.join(response.streaming_content))
+        result = import_products(read_product_rows(exported, 'products.xlsx'))
+        self.assertEqual((result['created'], result['updated'], result['unchanged']), (0, 0, 2))
+
+    def test_import_page_previews(self):
+        self.client.force_login(self.user)
+        upload = SimpleUploadedFile('prices.csv', b'sku,price\nBP-1,15.00\n', content_type='text/csv')
+
+        response = self.client.post(reverse('pages:product_import'), {'file': upload, 'dry_run': '1'})
+
+        self.assertContains(response, 'Import Preview')
+        self.assertContains(response, '15.00')
+        self.assertEqual(Product.objects.get(sku='BP-1').product_price, Decimal('12.00'))
+
+
+class StaticBuildTests(TestCase):
+    def setUp(self):
+        self.source = tempfile.mkdtemp()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.source)
+        self.addCleanup(shutil.rmtree, self.root)
+        os.makedirs(os.path.join(self.source, 'css'))
+        with open(os.path.join(self.source, 'css', 'site.css'), 'w') as file:
+            file.write('/* layout */\nbody {\n    margin: 0;\n    color: #333;\n}\n' * 20)
+        os.makedirs(os.path.join(self.source, 'images'))
+        Image.new('RGB', (200, 200), 'teal').save(os.path.join(self.source, 'images', 'logo.png'))
+
+        settings = override_settings(
+            STATIC_ROOT=self.root,
+            STATICFILES_DIRS=[self.source],
+            STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder'],
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        call_command('build_static', stdout=io.StringIO())
+
+    def test_build_writes_hashed_minified_and_compressed_copies(self):
+        name = staticfiles_storage.stored_name('css/site.css')
+        self.assertRegex(name, r'^css/site\.[0-9a-f]{12}\.css$')
+        with open(os.path.join(self.root, name)) as file:
+            self.assertTrue(file.read().startswith('body{margin:0;color:#333}'))
+        self.assertTrue(os.path.exists(os.path.join(self.root, name + '.gz')))
+        logo = staticfiles_storage.stored_name('images/logo.png')
+        self.assertTrue(os.path.exists(os.path.join(self.root, logo + '.webp')))
+        # Unknown names still render, e.g. before the first build
+        self.assertEqual(staticfiles_storage.stored_name('css/missing.css'), 'css/missing.css')
+
+    def test_middleware_serves_precompressed_with_immutable_caching(self):
+        name = staticfiles_storage.stored_name('css/site.css')
+
+        response = self.client.get('/static/' + name, headers={'accept-encoding': 'gzip, br'})
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertIn('immutable', response['Cache-Control'])
+        body = gzip.decompress(b''.join(response.streaming_content)).decode()
+        self.assertTrue(body.startswith('body{'))
+
+        plain = self.client.get('/static/css/site.css')
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertEqual(plain['Cache-Control'], 'no-cache')
+
+        logo = staticfiles_storage.stored_name('images/logo.png')
+        webp = self.client.get('/static/' + logo, headers={'accept': 'image/webp,*/*'})
+        self.assertEqual(webp['Content-Type'], 'image/webp')
+
+        with override_settings(DEBUG=True):
+            response = self.client.get('/static/' + name, headers={'accept-encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', response)
+
+    def test_hashes_and_compressed_copies_match_what_is_served(self):
+        for source in ('css/site.css', 'images/logo.png'):
+            path = os.path.join(self.root, staticfiles_storage.stored_name(source))
+            with open(path, 'rb') as file:
+                content = file.read()
+            self.assertIn(hashlib.md5(content).hexdigest()[:12], path)
+        css = os.path.join(self.root, staticfiles_storage.stored_name('css/site.css'))
+        with open(css, 'rb') as file, open(css + '.gz', 'rb') as compressed:
+            self.assertEqual(gzip.decompress(compressed.read()), file.read())
+
+    def test_minify_leaves_strings_alone(self):
+        self.assertEqual(
+            minify_css('a::before {\n    content: "a  b, c: d /* e */" ;\n}\n/* x */ .a/**/.b > p { color : red; }'),
+            'a::before{content:"a  b, c: d /* e */"}.a .b>p{color :red}',
+        )
+
+
+class CategoryTests(TestCase):
+    def setUp(self):
+        reset_caches()
+        self.user = User.objects.create_user('cashier', password='secret')
+        self.pens = Category.objects.create(name='Pens')
+        self.paper = Category.objects.create(name='Paper')
+        make_products(2, category=self.pens)
+        make_products(3, category=self.paper)
+        self.client.force_login(self.user)
+
+    def test_cashier_grid_filters_by_category_id(self):
+        response = self.client.get(reverse('pages:product_feed'), {'category': self.paper.id})
+
+        ids = [product['id'] for product in response.json()['products']]
+        self.assertEqual(ids, list(Product.objects.filter(product_category=self.paper).values_list('id', flat=True)))
+
+    def test_category_filter_uses_index(self):
+        plan = Product.objects.filter(product_category=self.pens).order_by('id').explain()
+
+        self.assertIn('product_category_id_idx', plan)
+
+    def test_rename_does_not_touch_products(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('pages:edit_category', args=[self.pens.id]), {'name': 'Ballpens'})
+
+        self.assertFalse([q for q in queries if 'pages_product' in q['sql']])
+        self.assertEqual(Product.objects.filter(product_category__name='Ballpens').count(), 2)
+
+    def test_delete_category_deletes_its_products(self):
+        self.client.post(reverse('pages:delete_category', args=[self.pens.id]))
+
+        self.assertEqual(Product.objects.count(), 3)
+
+
+class ProductFeedTests(TestCase):
+    def setUp(self):
+        reset_caches()
+        self.user = User.objects.create_user('cashier', password='secret')
+        self.pens = Category.objects.create(name='Pens')
+        self.products = make_products(25, quantity=5, category=self.pens) + make_products(5)
+        self.client.force_login(self.user)
+
+    def walk(self, **params):
+        pages = []
+        after = 0
+        while after is not None:
+            data = self.client.get(reverse('pages:product_feed'), dict(params, after=after, limit=10)).json()
+            pages.append([product['id'] for product in data['products']])
+            after = data['next']
+        return pages
+
+    def test_keyset_pages_cover_the_catalog_once(self):
+        pages = self.walk()
+        self.assertEqual([len(page) for page in pages], [10, 10, 10])
+        self.assertEqual(sum(pages, []), sorted(product.id for product in self.products))
+
+        pages = self.walk(category=self.pens.id)
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+
+    def test_deep_pages_cost_the_same_as_the_first(self):
+        plans = []
+        for after in (0, self.products[20].id):
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(reverse('pages:product_feed'), {'category': self.pens.id, 'after': after, 'limit': 5})
+            feed_query = [q['sql'] for q in queries if 'pages_product' in q['sql']]
+            self.assertEqual(len(feed_query), 1)
+            self.assertNotIn('OFFSET', feed_query[0])
+            plans.append(len(queries))
+        self.assertEqual(plans[0], plans[1])
+
+    def test_dashboard_does_not_load_products(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('pages:cashier_dashboard'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([q for q in queries if 'pages_product' in q['sql']])
+
+    def test_feed_reports_available_stock(self):
+        set_hold('terminal-b', self.products[0].id, 2)
+
+        data = self.client.get(reverse('pages:product_feed'), {'limit': 1}).json()
+
+        self.assertEqual(data['products'][0]['available_quantity'], 3)
+        self.assertEqual(data['products'][0]['category'], 'Pens')
+
+
+def make_image(size=(1200, 900), mode='RGB', fmt='PNG'):
+    buffer = io.BytesIO()
+    Image.new(mode, size, 'red').save(buffer, fmt)
+    return SimpleUploadedFile(f'poster.{fmt.lower()}', buffer.getvalue(), content_type=f'image/{fmt.lower()}')
+
+
+class ImageVariantTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        reset_caches()
+        self.user = User.objects.create_user('admin', password='secret')
+        self.client.force_login(self.user)
+
+    def test_upload_generates_sized_webp_and_jpeg_variants(self):
+        self.client.post(reverse('pages:add_product'), {
+            'name': 'Poster', 'price': '20.00', 'quantity': '3', 'image': make_image(mode='RGBA'),
+        })
+
+        product = Product.objects.get()
+        self.assertEqual(set(product.product_img_variants), {'thumb.webp', 'thumb.jpg', 'grid.webp', 'grid.jpg'})
+        with Image.open(f"{self.media_root}/{product.product_img_variants['grid.webp']}") as grid:
+            self.assertEqual((grid.format, grid.size), ('WEBP', (320, 192)))
+        with Image.open(f"{self.media_root}/{product.product_img_variants['thumb.jpg']}") as thumb:
+            self.assertEqual((thumb.format, thumb.size), ('JPEG', (96, 96)))
+
+        feed = self.client.get(reverse('pages:product_feed')).json()['products'][0]
+        self.assertTrue(feed['product_img'].endswith('-grid.jpg'))
+        self.assertTrue(feed['product_img_webp'].endswith('-grid.webp'))
+
+    def test_unreadable_image_is_stored_without_variants(self):
+        truncated = make_image()
+        truncated = SimpleUploadedFile('truncated.png', truncated.read()[:-200], content_type='image/png')
+        self.client.post(reverse('pages:add_product'), {
+            'name': 'Truncated', 'price': '20.00', 'quantity': '3', 'image': truncated,
+        })
+        # Over twice the pixel limit is refused as a decompression bomb
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 1000):
+            response = self.client.post(reverse('pages:add_product'), {
+                'name': 'Bomb', 'price': '20.00', 'quantity': '3', 'image': make_image(),
+            })
+
+        self.assertRedirects(response, reverse('pages:products'), fetch_redirect_response=False)
+        for product in Product.objects.all():
+            self.assertTrue(product.product_img)
+            self.assertEqual(product.product_img_variants, {})
+        self.assertEqual(Product.objects.count(), 2)
+
+    def test_variant_names_follow_the_image_content(self):
+        product = Product.objects.create(product_name='Poster', product_price=Decimal('1.00'), product_img=make_image())
+        again = Product.objects.create(product_name='Copy', product_price=Decimal('1.00'), product_img=make_image())
+        other = Product.objects.create(
+            product_name='Other', product_price=Decimal('1.00'), product_img=make_image(size=(10, 10)))
+
+        variants = generate_variants(product.product_img.name)
+        self.assertEqual(generate_variants(again.product_img.name), variants)
+        self.assertNotEqual(generate_variants(other.product_img.name)['grid.jpg'], variants['grid.jpg'])
+        self.assertEqual(generate_variants('products/missing.png'), {})
+
+    def test_template_tags(self):
+        product = Product.objects.create(product_name='Poster', product_price=Decimal('1.00'), product_img=make_image())
+        plain = Product.objects.create(product_name='Plain', product_price=Decimal('1.00'), product_img=make_image())
+        product.product_img_variants = generate_variants(product.product_img.name)
+
+        template = Template(
+            "{% load product_images %}{% product_image_url product 'thumb' 'webp' %}|"
+            "{% product_image_url plain 'thumb' %}|{% product_picture product 'grid' 'product-img' %}"
+        )
+        thumb, fallback, picture = template.render(Context({'product': product, 'plain': plain})).split('|')
+
+        self.assertTrue(thumb.endswith('-thumb.webp'))
+        self.assertEqual(fallback, plain.product_img.url)
+        self.assertIn('type="image/webp"', picture)
+        self.assertIn('-grid.jpg" alt="Poster" class="product-img"', picture)
+
+
+class ImageBackfillTests(MediaRootMixin, TransactionTestCase):
+    def test_backfill_uses_worker_processes(self):
+        for i in range(3):
+            Product.objects.create(product_name=f'Poster {i}', product_price=Decimal('1.00'),
+                                   product_img=make_image(size=(100 + i, 100)))
+        Product.objects.create(product_name='No image', product_price=Decimal('1.00'))
+
+        out = io.StringIO()
+        call_command('generate_image_variants', workers=2, stdout=out)
+
+        self.assertIn('Generated variants for 3 image(s) with 2 worker(s)', out.getvalue())
+        self.assertEqual(Product.objects.filter(product_img_variants__has_key='grid.webp').count(), 3)
+
+
+class ProductScanTests(TestCase):
+    def setUp(self):
+        reset_caches()
+        self.user = User.objects.create_user('cashier', password='secret')
+        self.client.force_login(self.user)
+        self.product = Product.objects.create(
+            product_name='Ballpen Blue', product_price=Decimal('12.00'), product_quantity=10,
+            sku=' 4800016644290 ')
+
+    def scan(self, code):
+        return self.client.get(reverse('pages:product_scan'), {'code': code})
+
+    def test_scan_returns_price_and_available_stock(self):
+        self.assertEqual(self.product.sku, '4800016644290')
+        Product.objects.filter(pk=self.product.pk).update(reserved_quantity=3)
+
+        data = self.scan('4800016644290').json()
+
+        self.assertEqual(data['product']['id'], self.product.id)
+        self.assertEqual(data['product']['product_price'], 12.0)
+        self.assertEqual(data['product']['available_quantity'], 7)
+        self.assertEqual(self.scan('nope').status_code, 404)
+        self.assertEqual(self.scan('').status_code, 404)
+
+    def test_codes_are_case_and_whitespace_insensitive(self):
+        Product.objects.create(product_name='Marker', product_price=Decimal('30.00'), sku='mk-01')
+        self.assertEqual(self.scan('  MK-01').json()['product']['product_name'], 'Marker')
+        self.assertEqual(lookup_sku('Mk-01 ')['sku'], 'MK-01')
+
+    def test_repeat_scan_reads_only_the_catalog_version(self):
+        lookup_sku('4800016644290')
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(lookup_sku('4800016644290')['id'], self.product.id)
+
+        self.assertEqual(len(queries), 1)
+        self.assertIn('"pages_sequence"', queries[0]['sql'])
+
+    def test_changed_product_is_read_again(self):
+        other = Product.objects.create(
+            product_name='Marker', product_price=Decimal('30.00'), product_quantity=5, sku='MK-01')
+        lookup_sku('4800016644290')
+        lookup_sku('MK-01')
+        process_sale(make_sale([other]), self.user, 'Cashier')
+
+        with CaptureQueriesContext(connection) as queries:
+            # Only the marker sold; the ballpen is still current
+            self.assertEqual(lookup_sku('4800016644290')['available_quantity'], 10)
+            self.assertEqual(lookup_sku('MK-01')['available_quantity'], 4)
+
+        # Version and change log, then version and the marker's row
+        self.assertEqual(len(queries), 4)
+
+    def test_reassigned_code_is_looked_up_again(self):
+        lookup_sku('4800016644290')
+        # Moved to another product, as another worker would
+        self.product.sku = None
+        self.product.save()
+        other = Product.objects.create(
+            product_name='Ballpen Red', product_price=Decimal('12.00'), sku='4800016644290')
+
+        self.assertEqual(lookup_sku('4800016644290')['id'], other.id)
+        other.delete()
+        self.assertIsNone(lookup_sku('4800016644290'))
+
+    def test_duplicate_sku_is_rejected_by_the_form(self):
+        self.client.post(reverse('pages:add_product'), {
+            'name': 'Copy', 'price': '1.00', 'quantity': '1', 'sku': '4800016644290'})
+        self.assertFalse(Product.objects.filter(product_name='Copy').exists())
+
+    def test_sku_is_searchable(self):
+        self.assertEqual([r['id'] for r in search_products('48000166')], [self.product.id])
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        reset_caches()
+        self.user = User.objects.create_user('cashier', password='secret')
+        self.pens = Category.objects.create(name='Pens')
+        self.paper = Category.objects.create(name='Paper')
+        self.ballpen = Product.objects.create(
+            product_name='Ballpen Blue', product_price=Decimal('12.00'), product_category=self.pens)
+        self.notebook = Product.objects.create(
+            product_name='Notebook Pentech', product_price=Decimal('45.00'), product_category=self.paper)
+        self.marker = Product.objects.create(
+            product_name='Marker', product_price=Decimal('30.00'), product_category=self.pens)
+
+    def names(self, text):
+        return [result['product_name'] for result in search_products(text)]
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', 'search triggers are SQLite only')
+    def test_search_triggers_survive_the_migrations(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name, tbl_name FROM sqlite_master WHERE type = 'trigger'")
+            triggers = dict(cursor.fetchall())
+
+        self.assertEqual(triggers, {
+            'pages_product_fts_insert': 'pages_product',
+            'pages_product_fts_update': 'pages_product',
+            'pages_product_fts_delete': 'pages_product',
+            'pages_category_fts_rename': 'pages_category',
+        })
+
+    def test_prefix_search_ranks_name_matches_first(self):
+        # 'Pentech' matches on its name, the other two only on their category
+        names = self.names('pen')
+        self.assertEqual(names[0], 'Notebook Pentech')
+        self.assertEqual(sorted(names[1:]), ['Ballpen Blue', 'Marker'])
+        self.assertEqual(self.names('ball bl'), ['Ballpen Blue'])
+        self.assertEqual(self.names('"pen-'), self.names('pen'))
+        self.assertEqual(self.names('!!'), [])
+
+    def test_index_follows_product_and_category_changes(self):
+        self.marker.product_name = 'Highlighter'
+        self.marker.save()
+        self.paper.name = 'Stationery'
+        self.paper.save()
+        self.ballpen.delete()
+
+        self.assertEqual(self.names('mark'), [])
+        self.assertEqual(self.names('high'), ['Highlighter'])
+        self.assertEqual(self.names('station'), ['Notebook Pentech'])
+        self.assertEqual(self.names('ballpen'), [])
+
+    def test_search_endpoint_is_one_query(self):
+        self.client.force_login(self.user)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('pages:product_search'), {'q': 'note'})
+
+        self.assertEqual([r['id'] for r in response.json()['results']], [self.notebook.id])
+        self.assertEqual(len([q for q in queries if 'pages_product' in q['sql']]), 1)
+
+    def test_admin_product_list_uses_the_index(self):
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse('pages:products'), {'q': 'mark'})
+
+        self.assertEqual([p.id for p in response.context['products']], [self.marker.id])
+
+
+class CatalogSyncTests(TestCase):
+    def setUp(self):
+        reset_caches()
+        self.user = User.objects.create_user('cashier', password='secret')
+        self.products = make_products(3, quantity=5)
+        self.client.force_login(self.user)
+
+    def sync(self, since=None, **headers):
+        params = {} if since is None else {'since': since}
+        return self.client.get(reverse('pages:catalog_sync'), params, headers=headers)
+
+    def test_snapshot_is_gzipped_and_complete(self):
+        response = self.sync(accept_encoding='gzip, deflate')
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        data = json.loads(gzip.decompress(response.content))
+        self.assertTrue(data['full'])
+        self.assertEqual(data['version'], catalog_version())
+        self.assertEqual([p['id'] for p in data['products']], [p.id for p in self.products])
+        self.assertEqual(data['products'][0]['category_id'], self.products[0].product_category_id)
+        self.assertEqual([c['name'] for c in data['categories']], ['Supplies'])
+        # Unknown versions fall back to the snapshot
+        self.assertTrue(self.sync(since=catalog_version() + 5).json()['full'])
+
+    def test_delta_has_only_changed_and_deleted_rows(self):
+        version = catalog_version()
+        product = self.products[0]
+        product.product_price = Decimal('12.50')
+        product.save()
+        product.save()
+        deleted_id = self.products[1].id
+        self.products[1].delete()
+
+        data = self.sync(since=version).json()
+
+        self.assertFalse(data['full'])
+        self.assertEqual(data['version'], catalog_version())
+        self.assertEqual([(p['id'], p['product_price']) for p in data['products']], [(product.id, 12.5)])
+        self.assertEqual(data['deleted'], {'products': [deleted_id], 'categories': []})
+        # One log row per object, whatever the number of changes
+        self.assertEqual(CatalogChange.objects.filter(object_id=product.id, kind='product').count(), 1)
+
+    def test_stock_changes_are_logged(self):
+        version = catalog_version()
+        set_hold('terminal-1', self.products[2].id, 2)
+
+        data = self.sync(since=version).json()
+
+        self.assertEqual([(p['id'], p['available_quantity']) for p in data['products']], [(self.products[2].id, 3)])
+
+    def test_deleting_a_category_resends_its_products(self):
+        category = self.products[0].product_category
+        category_id = category.id
+        version = catalog_version()
+        category.delete()
+
+        data = self.sync(since=version).json()
+
+        self.assertEqual(data['deleted']['categories'], [category_id])
+        self.assertEqual({p['category_id'] for p in data['products']}, {None})
+        self.assertEqual(len(data['products']), 3)
+
+    def test_idle_terminal_gets_204_from_one_query(self):
+        version = catalog_version()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.sync(since=version)
+
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(len([q for q in queries if 'pages_' in q['sql']]), 1)
+
+
+class ProductStockApiTests(TestCase):
+    def setUp(self):
+        reset_caches()
+        self.user = User.objects.create_user('cashier', password='secret')
+        self.products = make_products(3, quantity=5)
+        self.client.force_login(self.user)
+
+    def get_stock(self, ids, **headers):
+        url = reverse('pages:product_stock') + '?ids=' + ','.join(map(str, ids))
+        return self.client.get(url, headers=headers)
+
+    def test_returns_all_products_in_one_query(self):
+        ids = [product.id for product in self.products] + [999999]
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get_stock(ids)
+
+        data = response.json()
+        self.assertEqual(len(data['products']), 3)
+        self.assertEqual(data['products'][str(ids[0])]['available_quantity'], 5)
+        self.assertEqual(data['missing'], [999999])
+        self.assertEqual(len([q for q in queries if 'pages_product' in q['sql']]), 1)
+
+    def test_unchanged_catalog_answers_304_without_loading_products(self):
+        ids = [product.id for product in self.products]
+        etag = self.get_stock(ids)['ETag']
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get_stock(ids, if_none_match=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse([q for q in queries if 'pages_product' in q['sql']])
+
+    def test_sales_and_holds_change_the_etag(self):
+        ids = [product.id for product in self.products]
+        etag = self.get_stock(ids)['ETag']
+
+        process_sale(make_sale(self.products[:1]), self.user, 'Cashier')
+        response = self.get_stock(ids, if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['products'][str(ids[0])]['product_quantity'], 4)
+
+        set_hold('terminal-b', ids[1], 2)
+        response = self.get_stock(ids, if_none_match=response['ETag'])
+        self.assertEqual(response.json()['products'][str(ids[1])]['available_quantity'], 3)
+
+    def test_rejects_bad_ids(self):
+        self.assertEqual(self.get_stock(['abc']).status_code, 400)
+        self.assertEqual(self.client.get(reverse('pages:product_stock')).status_code, 400)
+
+
+class AsyncApiTests(TestCase):
+    def setUp(self):
+        reset_caches()
+        self.user = User.objects.create_user('cashier', password='secret')
+        self.tax_rate = TaxRate.objects.create(name='VAT', percentage=Decimal('12.00'))
+        self.products = make_products(2, quantity=5)
+
+    async def test_async_create_invoice(self):
+        await self.async_client.aforce_login(self.user)
+
+        response = await self.async_client.post(
+            reverse('pages:acreate_invoice'),
+            data=json.dumps(make_sale(self.products)),
+            content_type='application/json',
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['tax_rate_name'], 'VAT')
+        self.assertEqual(await Product.objects.filter(product_quantity=4).acount(), 2)
+
+    async def test_async_create_invoice_replays_a_retry(self):
+        await self.async_client.aforce_login(self.user)
+
+        responses = [
+            await self.async_client.post(
+                reverse('pages:acreate_invoice'),
+                data=json.dumps(make_sale(self.products)),
+                content_type='application/json',
+                headers={'Idempotency-Key': 'retry-1'},
+            )
+            for _ in range(2)
+        ]
+
+        self.assertEqual(responses[0].json(), responses[1].json())
+        self.assertEqual(responses[1]['Idempotent-Replayed'], 'true')
+        self.assertEqual(await Invoice.objects.acount(), 1)
+
+    async def test_async_default_tax_rate(self):
+        response = await self.async_client.get(reverse('pages:aget_default_tax_rate'))
+
+        self.assertEqual(response.json()['tax_rate']['display_name'], 'VAT (12.00%)')
+
+    async def test_product_detail(self):
+        await self.async_client.aforce_login(self.user)
+
+        response = await self.async_client.get(reverse('pages:product_detail', args=[self.products[0].id]))
+        missing = await self.async_client.get(reverse('pages:product_detail', args=[999999]))
+
+        self.assertEqual(response.json()['product_quantity'], 5)
+        self.assertEqual(missing.status_code, 404)
+
+
+class TaxRateCacheTests(TestCase):
+    def setUp(self):
+        reset_caches()
+        self.user = User.objects.create_superuser('admin', password='secret')
+        self.tax_rate = TaxRate.objects.create(name='VAT', percentage=Decimal('12.00'))
+
+    def test_active_rate_is_read_once(self):
+        with self.assertNumQueries(1):
+            get_active_tax_rate()
+            get_active_tax_rate()
+
+    def test_updating_a_rate_invalidates_the_cache(self):
+        self.client.force_login(self.user)
+        get_active_tax_rate()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse('pages:tax_update_inline', args=[self.tax_rate.pk]),
+                {'name': 'VAT', 'percentage': '10.00'},
+            )
+
+        self.assertEqual(get_active_tax_rate().percentage, Decimal('10.00'))
+
+    def test_unchanged_rate_is_answered_with_304(self):
+        url = reverse('pages:get_default_tax_rate')
+        first = self.client.get(url)
+
+        with self.assertNumQueries(0):
+            second = self.client.get(url, headers={'If-None-Match': first['ETag']})
+
+        self.assertEqual(second.status_code, 304)
+        # Only the ETag says whether the rate changed
+        self.assertNotIn('Last-Modified', first)
+        future = self.client.get(url, headers={'If-Modified-Since': 'Fri, 01 Jan 2100 00:00:00 GMT'})
+        self.assertEqual(future.status_code, 200)
+
+        self.tax_rate.percentage = Decimal('5.00')
+        self.tax_rate.save()
+        third = self.client.get(url, headers={'If-None-Match': first['ETag']})
+        self.assertEqual(third.status_code, 200)
+        self.assertEqual(third.json()['tax_rate']['percentage'], 5.0)
+
+
+def run_in_threads(target, count):
+    errors = []
+
+    def worker(index):
+        try:
+            target(index)
+        except Exception as e:  # surfaced by the assertion below
+            errors.append(e)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+
+class SequenceTests(TransactionTestCase):
+    def setUp(self):
+        reset_caches()
+
+    def test_parallel_allocators_hand_out_whole_blocks_without_duplicates(self):
+        block_size = 10
+        workers = [BlockAllocator('stress', block_size=block_size) for _ in range(4)]
+        allocated = [[] for _ in workers]
+
+        def allocate(index):
+            for _ in range(35):
+                allocated[index].append(workers[index].next())
+
+        errors = run_in_threads(allocate, len(workers))
+        self.assertEqual(errors, [])
+
+        everything = [number for numbers in allocated for number in numbers]
+        self.assertEqual(len(everything), len(set(everything)))
+
+        for numbers in allocated:
+            # Each worker consumes its blocks in order and without gaps
+            blocks = {}
+            for number in numbers:
+                blocks.setdefault((number - 1) // block_size, []).append(number)
+            for block, values in blocks.items():
+                first = block * block_size + 1
+                self.assertEqual(values, list(range(first, first + len(values))))
+
+        self.assertEqual(Sequence.objects.get(name='stress').value, 4 * 4 * block_size)
+
+    def test_failed_sale_leaves_a_gap(self):
+        user = User.objects.create_user('cashier', password='secret')
+        product = make_products(1, quantity=1)[0]
+
+        first = process_sale(make_sale([product]), user, 'Cashier')[0]
+        with self.assertRaises(CheckoutError):
+            process_sale(make_sale([product]), user, 'Cashier')
+        Product.objects.filter(pk=product.pk).update(product_quantity=1)
+        second = process_sale(make_sale([product]), user, 'Cashier')[0]
+
+        # The failed sale's number is not handed out again
+        first, second = (int(invoice.invoice_number.removeprefix('INV-')) for invoice in (first, second))
+        self.assertEqual(second, first + 2)
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'needs fork')
+    def test_forked_child_does_not_reuse_the_parents_block(self):
+        allocator = BlockAllocator('forked', block_size=10)
+        self.assertEqual(allocator.next(), 1)
+
+        read, write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                os.write(write, str(allocator._last).encode())
+            finally:
+                os._exit(0)
+        os.close(write)
+        with os.fdopen(read) as pipe:
+            child_block_end = int(pipe.read())
+        os.waitpid(pid, 0)
+
+        # The child holds no block, so its next number would reserve one
+        self.assertEqual(child_block_end, 0)
+        self.assertEqual(allocator.next(), 2)
+
+    def test_parallel_checkouts_get_unique_invoice_numbers(self):
+        user = User.objects.create_user('cashier', password='secret')
+        products = make_products(3, quantity=1000)
+
+        def checkout(index):
+            for _ in range(10):
+                process_sale(make_sale(products, customer_id='CUST-000'), user, 'Cashier')
+
+        errors = run_in_threads(checkout, 4)
+        self.assertEqual(errors, [])
+
+        invoice_numbers = list(Invoice.objects.values_list('invoice_number', flat=True))
+        customer_ids = list(Invoice.objects.values_list('customer_id', flat=True))
+        self.assertEqual(len(invoice_numbers), 40)
+        self.assertEqual(len(set(invoice_numbers)), 40)
+        self.assertEqual(len(set(customer_ids)), 40)
+        self.assertEqual(Product.objects.filter(product_quantity=1000 - 40).count(), 3)
+
+
+class CheckoutLoadHarnessTests(TransactionTestCase):
+    def setUp(self):
+        reset_caches()
+
+    def test_simulated_cashiers_report_every_sale(self):
+        products = list(
+            Product.objects.filter(id__in=[p.id for p in make_products(10, quantity=1000)])
+            .values_list('id', 'product_name', 'product_price')
+        )
+        rng = random.Random(1)
+        carts = [[make_cart(rng, products, 1, 5) for _ in range(5)] for _ in range(3)]
+        checkouts = []
+        for i in range(3):
+            client = Client()
+            client.force_login(User.objects.create_user(f'cashier-{i}'))
+            checkouts.append(client_checkout(client, reverse('pages:create_invoice')))
+
+        summary = checkout_load(checkouts, carts)
+
+        self.assertEqual(summary['requests'], 15)
+        self.assertEqual(summary['errors'], 0, summary)
+        self.assertEqual(Invoice.objects.count(), 15)
+        self.assertGreater(summary['queries_per_sale'], 0)
+        self.assertLessEqual(summary['p50'], summary['p99'])
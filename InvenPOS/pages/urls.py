@@ -20,11 +20,26 @@ urlpatterns = [
     path("products/add/", views.add_product, name="add_product"),
     path("products/edit/<int:id>/", views.edit_product, name="edit_product"),
     path("products/delete/<int:id>/", views.delete_product, name="delete_product"),
+    path("products/import/", views.product_import, name="product_import"),
+    path("products/export/", views.product_export, name="product_export"),
       path('users/', views.users, name='users'),
 
 path('products/restock/<int:id>/', views.restock_product, name='restock_product'),
  path('api/create-invoice/', views.create_invoice, name='create_invoice'),
+    path('api/sync-sales/', views.sync_sales, name='sync_sales'),
     path('api/default-tax-rate/', views.get_default_tax_rate, name='get_default_tax_rate'),
+    path('api/product/<int:product_id>/', views.aproduct_detail, name='product_detail'),
+    path('api/products/stock/', views.product_stock, name='product_stock'),
+    path('api/products/search/', views.product_search, name='product_search'),
+    path('api/products/scan/', views.product_scan, name='product_scan'),
+    path('api/catalog/', views.catalog_sync, name='catalog_sync'),
+    path('api/products/feed/', views.product_feed, name='product_feed'),
+    path('api/holds/', views.hold_stock, name='hold_stock'),
+    path('api/holds/release/', views.release_stock_holds, name='release_stock_holds'),
+
+    # Async versions of the checkout endpoints, for ASGI deployments
+    path('api/async/create-invoice/', views.acreate_invoice, name='acreate_invoice'),
+    path('api/async/default-tax-rate/', views.aget_default_tax_rate, name='aget_default_tax_rate'),
 
 
    path('add-category/', views.add_category, name='add_category'),
@@ -45,6 +60,7 @@ path('edit_supplier/<int:supplier_id>/', views.edit_supplier, name='edit_supplie
     path('invoice/form/', views.invoice_form, name='invoice_form'),
       path('invoice/<int:invoice_id>/print/', views.print_invoice_pdf, name='print_invoice_pdf'),
     path('invoice/<int:invoice_id>/download/', views.download_invoice_pdf, name='download_invoice_pdf'),
+    path('invoice/<int:invoice_id>/receipt/', views.invoice_receipt, name='invoice_receipt'),
     
     
     path('tax/add/', views.tax_create_inline, name='tax_create_inline'),
@@ -60,6 +76,8 @@ path('tax/<int:pk>/delete/', views.tax_delete_inline, name='tax_delete_inline'),
     
      path('sales-reports/', views.sales_reports, name='sales_reports'),  # ← ADD THIS LINE
     path('sales-reports/print/', views.print_sales_report, name='print_sales_report'),
+    path('sales-reports/export/', views.export_sales_report, name='export_sales_report'),
+    path('reports/jobs/<int:job_id>/', views.report_job, name='report_job'),
 
 
       path('purchases/', views.purchase_management, name='purchase_management'),
@@ -70,6 +88,7 @@ path('tax/<int:pk>/delete/', views.tax_delete_inline, name='tax_delete_inline'),
 
     path('purchases/reports/', views.purchase_reports, name='purchase_reports'),
     path('purchases/print-report/', views.print_purchase_report, name='print_purchase_report'),
+    path('purchases/export-report/', views.export_purchase_report, name='export_purchase_report'),
 path('deactivate-supplier/<int:pk>/', views.deactivate_supplier, name='deactivate_supplier'),
 path('activate-supplier/<int:pk>/', views.activate_supplier, name='activate_supplier'),
 # urls.py
@@ -1,18 +1,23 @@
 # utils.py
 from reportlab.lib.pagesizes import letter, A4
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+from reportlab.pdfbase.pdfdoc import PDFArray, PDFName, PDFStream
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.platypus import Flowable, PageBreak, SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib import colors
 from reportlab.lib.units import inch, mm
 from reportlab.pdfgen import canvas
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
 import os
+import time
+import zlib
 from django.conf import settings
 from django.http import HttpResponse
 from django.utils import timezone
-from datetime import datetime
 from io import BytesIO
-from collections import defaultdict 
+from functools import lru_cache
+
+from .reports import filter_invoices, purchase_report_data, sales_detail_rows, sales_filters, sales_report_data
 
 # Alternative enhanced receipt version
 def generate_invoice_pdf(invoice, sold_items):
@@ -33,38 +38,10 @@ def generate_invoice_pdf(invoice, sold_items):
     )
     
     elements = []
-    styles = getSampleStyleSheet()
-    
-    # Receipt styles with monospace font
-    header_style = ParagraphStyle(
-        'Header',
-        parent=styles['Normal'],
-        fontSize=11,
-        alignment=TA_CENTER,
-        fontName='Courier-Bold',
-        spaceAfter=4,
-        spaceBefore=4
-    )
-    
-    item_style = ParagraphStyle(
-        'Item',
-        parent=styles['Normal'],
-        fontSize=9,
-        alignment=TA_LEFT,
-        fontName='Courier',
-        leftIndent=0,
-        rightIndent=0
-    )
-    
-    footer_style = ParagraphStyle(
-        'Footer',
-        parent=styles['Normal'],
-        fontSize=8,
-        alignment=TA_CENTER,
-        fontName='Courier',
-        spaceAfter=3,
-        spaceBefore=3
-    )
+    styles = pdf_styles()
+    header_style = styles['receipt_header']
+    item_style = styles['receipt_item']
+    footer_style = styles['receipt_footer']
     
     # Header Section
     elements.append(Paragraph("=" * 29, header_style))
@@ -139,327 +116,444 @@ def generate_invoice_pdf(invoice, sold_items):
 
 def generate_sales_report_pdf(invoices, filters=None):
     """Generate professional PDF sales report"""
-    buffer = BytesIO()
-    
-    # Use A4 size for reports
-    page_width = 210 * mm
-    page_height = 297 * mm
-    
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=A4,
-        rightMargin=25 * mm,
-        leftMargin=25 * mm,
-        topMargin=25 * mm,
-        bottomMargin=25 * mm
-    )
-    
-    elements = []
-    styles = getSampleStyleSheet()
-    
-    # Custom professional styles
-    title_style = ParagraphStyle(
-        'Title',
-        parent=styles['Heading1'],
-        fontSize=20,
-        alignment=TA_CENTER,
-        spaceAfter=20,
-        textColor=colors.HexColor('#2E7D32'),
-        fontName='Helvetica-Bold'
-    )
-    
-    subtitle_style = ParagraphStyle(
-        'Subtitle',
-        parent=styles['Heading2'],
-        fontSize=14,
-        alignment=TA_CENTER,
-        spaceAfter=30,
-        textColor=colors.HexColor('#1B5E20'),
-        fontName='Helvetica-Bold'
-    )
-    
-    section_header_style = ParagraphStyle(
-        'SectionHeader',
-        parent=styles['Heading2'],
-        fontSize=12,
-        spaceAfter=12,
-        spaceBefore=20,
-        textColor=colors.HexColor('#2E7D32'),
-        fontName='Helvetica-Bold',
-        leftIndent=0
-    )
-    
-    normal_style = ParagraphStyle(
-        'Normal',
-        parent=styles['Normal'],
-        fontSize=10,
-        spaceAfter=8,
-        textColor=colors.HexColor('#333333'),
-        fontName='Helvetica'
-    )
-    
-    highlight_style = ParagraphStyle(
-        'Highlight',
-        parent=styles['Normal'],
-        fontSize=11,
-        spaceAfter=6,
-        textColor=colors.HexColor('#1B5E20'),
-        fontName='Helvetica-Bold',
-        backColor=colors.HexColor('#E8F5E8'),
-        borderPadding=8,
-        borderColor=colors.HexColor('#C8E6C9'),
-        borderWidth=1
-    )
-    
-    footer_style = ParagraphStyle(
-        'Footer',
-        parent=styles['Normal'],
-        fontSize=9,
-        alignment=TA_CENTER,
-        spaceBefore=20,
-        textColor=colors.HexColor('#666666'),
-        fontName='Helvetica-Oblique'
-    )
-    
-    # Header Section
-    elements.append(Paragraph("STOCKSMART", title_style))
-    elements.append(Paragraph("SALES PERFORMANCE REPORT", subtitle_style))
-    
-    # Report Metadata
-    elements.append(Paragraph(f"<b>Report Generated:</b> {timezone.now().strftime('%B %d, %Y at %I:%M %p')}", normal_style))
-    
-    # Filter Information
+    return render_sales_report_pdf(sales_report_data(invoices), filters)
+
+
+def generate_purchase_report_pdf(purchase_orders, filters=None):
+    """Generate professional PDF purchase report"""
+    return render_purchase_report_pdf(purchase_report_data(purchase_orders), filters)
+
+
+def render_sales_report_pdf(data, filters=None, timings=None, output=None):
+    """The sales report PDF for sales_report_data(). Needs no database, so it
+    can run in a worker process (see report_jobs.py)."""
+    return render_report(SALES_REPORT, data, filters, timings, output)
+
+
+def render_detailed_sales_report_pdf(data, filters=None, timings=None, output=None):
+    """The sales report for sales_report_data() with every invoice matching
+    ``filters`` listed, page after page, instead of the latest ten.
+
+    The invoices are read here, as layout reaches them (see RowStream), so
+    unlike the other renderers this one needs the database. Long reports
+    should be rendered to a file (``output``); see render_report().
+    """
+    return render_report(DETAILED_SALES_REPORT, data, filters, timings, output)
+
+
+def render_purchase_report_pdf(data, filters=None, timings=None, output=None):
+    """The purchase report PDF for purchase_report_data(); like render_sales_report_pdf()"""
+    return render_report(PURCHASE_REPORT, data, filters, timings, output)
+
+
+# ---------------- REPORT ENGINE ----------------
+#
+# A report is a dict of settings and a list of sections. Each section names
+# its ``kind`` (a builder in SECTION_KINDS) plus that builder's options, and
+# may have a ``when`` test on the data. Text is given as format strings,
+# filled from the data (or the row being listed), or as functions of it.
+
+GREEN = colors.HexColor('#2E7D32')
+DARK_GREEN = colors.HexColor('#1B5E20')
+GREY = colors.HexColor('#666666')
+RULE = colors.HexColor('#E0E0E0')
+
+
+@lru_cache(maxsize=None)
+def pdf_styles():
+    """The paragraph and table styles of the PDFs, built once per process.
+
+    Shared by every render, so never change them in place.
+    """
+    base = getSampleStyleSheet()
+    return {
+        'title': ParagraphStyle(
+            'Title', parent=base['Heading1'], fontSize=20, alignment=TA_CENTER, spaceAfter=20,
+            textColor=GREEN, fontName='Helvetica-Bold',
+        ),
+        'subtitle': ParagraphStyle(
+            'Subtitle', parent=base['Heading2'], fontSize=14, alignment=TA_CENTER, spaceAfter=30,
+            textColor=DARK_GREEN, fontName='Helvetica-Bold',
+        ),
+        'section': ParagraphStyle(
+            'SectionHeader', parent=base['Heading2'], fontSize=12, spaceAfter=12, spaceBefore=20,
+            textColor=GREEN, fontName='Helvetica-Bold', leftIndent=0,
+        ),
+        'normal': ParagraphStyle(
+            'Normal', parent=base['Normal'], fontSize=10, spaceAfter=8,
+            textColor=colors.HexColor('#333333'), fontName='Helvetica',
+        ),
+        'footer': ParagraphStyle(
+            'Footer', parent=base['Normal'], fontSize=9, alignment=TA_CENTER, spaceBefore=20,
+            textColor=GREY, fontName='Helvetica-Oblique',
+        ),
+        'summary': TableStyle([
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+            ('LEFTPADDING', (0, 0), (0, -1), 20),
+            ('RIGHTPADDING', (0, 0), (0, -1), 20),
+            ('LEFTPADDING', (1, 0), (1, -1), 10),
+            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+            ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
+            ('FONTSIZE', (0, 0), (0, -1), 16),
+            ('FONTSIZE', (1, 0), (1, -1), 11),
+            ('TEXTCOLOR', (0, 0), (0, -1), GREEN),
+            ('TEXTCOLOR', (1, 0), (1, -1), GREY),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 15),
+            ('TOPPADDING', (0, 0), (-1, -1), 15),
+            ('LINEBELOW', (0, 0), (-1, -1), 1, RULE),
+        ]),
+        # Boxes of listed records, alternating so rows are easy to follow
+        'boxes': [
+            TableStyle([
+                ('BACKGROUND', (0, 0), (-1, -1), background),
+                ('BOX', (0, 0), (-1, -1), 1, RULE),
+                ('PADDING', (0, 0), (-1, -1), 10),
+                ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+            ])
+            for background in (colors.HexColor('#FFFFFF'), colors.HexColor('#F8F9FA'))
+        ],
+        'receipt_header': ParagraphStyle(
+            'Header', parent=base['Normal'], fontSize=11, alignment=TA_CENTER, fontName='Courier-Bold',
+            spaceAfter=4, spaceBefore=4,
+        ),
+        'receipt_item': ParagraphStyle(
+            'Item', parent=base['Normal'], fontSize=9, alignment=TA_LEFT, fontName='Courier',
+            leftIndent=0, rightIndent=0,
+        ),
+        'receipt_footer': ParagraphStyle(
+            'Footer', parent=base['Normal'], fontSize=8, alignment=TA_CENTER, fontName='Courier',
+            spaceAfter=3, spaceBefore=3,
+        ),
+    }
+
+
+def _text(text, values):
+    return text(values) if callable(text) else text.format(**values)
+
+
+def _lines(lines, values):
+    """The texts of ``lines`` for ``values``; a line may be a (text, when) pair shown only if when(values)"""
+    texts = []
+    for line in lines:
+        text, when = line if isinstance(line, tuple) else (line, None)
+        if when is None or when(values):
+            texts.append(_text(text, values))
+    return texts
+
+
+def _more(section, data, rows, styles):
+    """The "... and N more" note under a list cut short"""
+    total_key, noun = section['more']
+    more = data[total_key] - len(rows)
+    if more <= 0:
+        return []
+    return [Spacer(1, 10), Paragraph(f"<i>... and {more} more {noun}</i>", styles['footer'])]
+
+
+def header_section(section, report, data, filters, styles):
+    elements = [
+        Paragraph("STOCKSMART", styles['title']),
+        Paragraph(report['subtitle'], styles['subtitle']),
+        Paragraph(f"<b>Report Generated:</b> {timezone.now().strftime('%B %d, %Y at %I:%M %p')}", styles['normal']),
+    ]
     if filters:
-        filter_text = "<b>Report Filters:</b> "
         filter_parts = []
-        
         if filters.get('date_from') and filters.get('date_to'):
             filter_parts.append(f"Period: {filters['date_from']} to {filters['date_to']}")
         elif filters.get('date_from'):
             filter_parts.append(f"From: {filters['date_from']}")
         elif filters.get('date_to'):
             filter_parts.append(f"To: {filters['date_to']}")
-        
-        if filters.get('cashier'):
-            filter_parts.append(f"Cashier: {filters['cashier']}")
-        
-        if filters.get('customer_id'):
-            filter_parts.append(f"Customer: {filters['customer_id']}")
-        
-        if filters.get('invoice_number'):
-            filter_parts.append(f"Invoice: {filters['invoice_number']}")
-        
-        filter_text += " • ".join(filter_parts) if filter_parts else "All Records"
-        elements.append(Paragraph(filter_text, normal_style))
-    
+        for name, label in report['filters']:
+            if filters.get(name):
+                filter_parts.append(f"{label}: {filters[name]}")
+        filter_text = " • ".join(filter_parts) if filter_parts else report['unfiltered']
+        elements.append(Paragraph(f"<b>Report Filters:</b> {filter_text}", styles['normal']))
     elements.append(Spacer(1, 25))
-    
-    # Executive Summary Section
-    elements.append(Paragraph("EXECUTIVE SUMMARY", section_header_style))
-    
-    # Calculate key metrics
-    total_sales = sum(invoice.total_amount for invoice in invoices)
-    total_transactions = len(invoices)
-    average_sale = total_sales / total_transactions if total_transactions > 0 else 0
-    
-    # Summary in a professional layout
-    summary_data = [
-        [f"P {total_sales:,.2f}", "Total Revenue"],
-        [f"{total_transactions}", "Transactions Processed"],
-        [f"P {average_sale:,.2f}", "Average Transaction Value"],
-    ]
-    
-    # Create a grid layout for summary
-    summary_table = Table(summary_data, colWidths=[2.5*inch, 3*inch])
-    summary_table.setStyle(TableStyle([
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('LEFTPADDING', (0, 0), (0, -1), 20),
-        ('RIGHTPADDING', (0, 0), (0, -1), 20),
-        ('LEFTPADDING', (1, 0), (1, -1), 10),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (0, -1), 16),
-        ('FONTSIZE', (1, 0), (1, -1), 11),
-        ('TEXTCOLOR', (0, 0), (0, -1), colors.HexColor('#2E7D32')),
-        ('TEXTCOLOR', (1, 0), (1, -1), colors.HexColor('#666666')),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 15),
-        ('TOPPADDING', (0, 0), (-1, -1), 15),
-        ('LINEBELOW', (0, 0), (-1, -1), 1, colors.HexColor('#E0E0E0')),
-    ]))
-    
-    elements.append(summary_table)
+    return elements
+
+
+def summary_section(section, report, data, filters, styles):
+    table = Table([[_text(value, data), label] for value, label in section['rows']], colWidths=[2.5*inch, 3*inch])
+    table.setStyle(styles['summary'])
+    return [Paragraph("EXECUTIVE SUMMARY", styles['section']), table, Spacer(1, 25)]
+
+
+def lists_section(section, report, data, filters, styles):
+    """Labelled lists of rows, e.g. the best days then the cashiers"""
+    elements = [Paragraph(section['heading'], styles['section'])]
+    for position, (label, key, line) in enumerate(section['lists']):
+        if position:
+            elements.append(Spacer(1, 15))
+        if data[key]:
+            elements.append(Paragraph(f"<b>{label}:</b>", styles['normal']))
+            elements += [Paragraph(_text(line, row), styles['normal']) for row in data[key]]
     elements.append(Spacer(1, 25))
-    
-    # Sales Breakdown Section
-    if invoices:
-        elements.append(Paragraph("SALES BREAKDOWN", section_header_style))
-        
-        # Group by date for trend analysis
-        from collections import defaultdict
-        daily_sales = defaultdict(float)
-        cashier_performance = defaultdict(lambda: {'sales': 0, 'transactions': 0})
-        
-        for invoice in invoices:
-            date_str = invoice.date_issued.strftime('%Y-%m-%d')
-            daily_sales[date_str] += float(invoice.total_amount)
-            cashier_performance[invoice.staff_name]['sales'] += float(invoice.total_amount)
-            cashier_performance[invoice.staff_name]['transactions'] += 1
-        
-        # Top performing days
-        if daily_sales:
-            elements.append(Paragraph("<b>Top Performing Days:</b>", normal_style))
-            top_days = sorted(daily_sales.items(), key=lambda x: x[1], reverse=True)[:5]
-            
-            for date, amount in top_days:
-                date_obj = datetime.strptime(date, '%Y-%m-%d')
-                elements.append(Paragraph(
-                    f"• {date_obj.strftime('%B %d, %Y')}: <b>P{amount:,.2f}</b>", 
-                    normal_style
-                ))
-        
-        
-        elements.append(Spacer(1, 15))
-        
-        # Cashier Performance
-        if cashier_performance:
-            elements.append(Paragraph("<b>Cashier Performance:</b>", normal_style))
-            sorted_cashiers = sorted(cashier_performance.items(), key=lambda x: x[1]['sales'], reverse=True)
-            
-            for cashier, data in sorted_cashiers:
-                avg_sale = data['sales'] / data['transactions'] if data['transactions'] > 0 else 0
-                elements.append(Paragraph(
-                    f"• {cashier}: {data['transactions']} transactions, P{data['sales']:,.2f} total (P{avg_sale:,.2f} avg)", 
-                    normal_style
-                ))
-        
-        elements.append(Spacer(1, 25))
-        
-        # Recent Transactions Section
-        elements.append(Paragraph("RECENT TRANSACTIONS", section_header_style))
-        
-        # Show last 10 transactions
-        recent_invoices = invoices[:10]
-        for i, invoice in enumerate(recent_invoices, 1):
-            transaction_text = f"""
-            <b>{invoice.invoice_number}</b> • {invoice.date_issued.strftime('%b %d, %Y %I:%M %p')}<br/>
-            Customer: {invoice.customer_id} • Cashier: {invoice.staff_name}<br/>
-            Amount: <font color="#2E7D32"><b>P {invoice.total_amount:,.2f}</b></font> • Items: {invoice.sold_items.count()}
-            """
-            
-            # Alternate background colors for readability
-            if i % 2 == 0:
-                bg_color = colors.HexColor('#F8F9FA')
-            else:
-                bg_color = colors.HexColor('#FFFFFF')
-            
-            transaction_table = Table([[Paragraph(transaction_text, normal_style)]], 
-                                    colWidths=[6*inch])
-            transaction_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, -1), bg_color),
-                ('BOX', (0, 0), (-1, -1), 1, colors.HexColor('#E0E0E0')),
-                ('PADDING', (0, 0), (-1, -1), 10),
-                ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-            ]))
-            
-            elements.append(transaction_table)
-        
-        # Show "more transactions" note if there are more
-        if len(invoices) > 10:
-            elements.append(Spacer(1, 10))
-            elements.append(Paragraph(
-                f"<i>... and {len(invoices) - 10} more transactions</i>", 
-                footer_style
-            ))
-    
+    return elements
+
+
+def boxes_section(section, report, data, filters, styles):
+    """One box per row, e.g. per recent invoice, or the ``empty`` message if the report has no records"""
+    if not data[report['count']]:
+        elements = [Paragraph(text, styles['normal']) for text in section['empty']]
     else:
-        # No data message
-        elements.append(Paragraph("No sales data available for the selected period.", normal_style))
-        elements.append(Paragraph("Please adjust your filters or check your data.", normal_style))
-    
+        rows = data[section['rows']]
+        elements = [Paragraph(section['heading'], styles['section'])]
+        for position, row in enumerate(rows):
+            table = Table([[Paragraph(_text(section['box'], row), styles['normal'])]], colWidths=[6*inch])
+            table.setStyle(styles['boxes'][position % 2])
+            elements.append(table)
+        elements += _more(section, data, rows, styles)
     elements.append(Spacer(1, 25))
-    
+    return elements
 
-      # Highest Product Sold Section
-    if invoices:
-        from collections import defaultdict
 
-        product_sales = defaultdict(int)
+def bullets_section(section, report, data, filters, styles):
+    """A list of ``lines`` filled from the data, or of one ``line`` per row of data[rows]"""
+    elements = [Spacer(1, section['space_before'])] if section.get('space_before') else []
+    elements.append(Paragraph(section['heading'], styles['section']))
+    if 'rows' in section:
+        rows = data[section['rows']]
+        elements += [Paragraph(_text(section['line'], row), styles['normal']) for row in rows]
+        elements += _more(section, data, rows, styles)
+    else:
+        elements += [Paragraph(text, styles['normal']) for text in _lines(section['lines'], data)]
+    if section.get('space_after'):
+        elements.append(Spacer(1, section['space_after']))
+    return elements
 
-        # Loop through all invoices and count quantities of sold products
-        for invoice in invoices:
-            for item in invoice.sold_items.all():
-                product_sales[item.product_name] += item.quantity
 
-        if product_sales:
-            elements.append(Paragraph("TOP SELLING PRODUCTS", section_header_style))
+def footer_section(section, report, data, filters, styles):
+    return [
+        Spacer(1, 30),
+        Paragraph("Confidential Business Document • Generated by StockSmart POS", styles['footer']),
+        Paragraph(f"Report ID: {report['id_prefix']}-{timezone.now().strftime('%Y%m%d-%H%M')}", styles['footer']),
+    ]
 
-            # Sort products by quantity sold, descending
-            sorted_products = sorted(product_sales.items(), key=lambda x: x[1], reverse=True)
-            top_products = sorted_products[:5]  # Top 5 bestsellers
 
-            for product, qty in top_products:
-                elements.append(Paragraph(f"• {product}: <b>{qty}</b> sold", normal_style))
+def table_section(section, report, data, filters, styles):
+    """A table of every row section['rows'](filters) yields, however many, or the ``empty`` message"""
+    if not data[report['count']]:
+        return [Paragraph(text, styles['normal']) for text in section['empty']]
+    columns = section['columns']
+    rows = (section['row'](row) for row in section['rows'](filters or {}))
+    return [
+        PageBreak(),
+        Paragraph(section['heading'], styles['section']),
+        RowStream([label for label, _ in columns], rows, [width for _, width in columns], section['numeric_from']),
+    ]
 
-            # Add small note if there are many products
-            if len(product_sales) > 5:
-                elements.append(Spacer(1, 10))
-                elements.append(Paragraph(
-                    f"<i>... and {len(product_sales) - 5} more products.</i>",
-                    footer_style
-                ))
 
-        elements.append(Spacer(1, 25))
+SECTION_KINDS = {
+    'header': header_section,
+    'summary': summary_section,
+    'lists': lists_section,
+    'boxes': boxes_section,
+    'bullets': bullets_section,
+    'table': table_section,
+    'footer': footer_section,
+}
 
+# Rows of a RowStream: height and font size in points, and padding of the cells
+ROW_HEIGHT = 14
+ROW_FONT_SIZE = 8
+CELL_PADDING = 6
+ZEBRA = colors.HexColor('#F8F9FA')
 
-    # Performance Insights
-    if invoices and total_transactions > 1:
-        elements.append(Paragraph("PERFORMANCE INSIGHTS", section_header_style))
-        
-        # Calculate some insights
-        max_sale = max(invoice.total_amount for invoice in invoices)
-        min_sale = min(invoice.total_amount for invoice in invoices)
-        
-        insights = [
-            f"• <b>Highest single transaction:</b> P{max_sale:,.2f}",
-            f"• <b>Average transaction value:</b> P{average_sale:,.2f}",
-            f"• <b>Total processing volume:</b> {total_transactions} transactions",
-        ]
-        
-        if len(daily_sales) > 1:
-            best_day = max(daily_sales.items(), key=lambda x: x[1])
-            best_day_date = datetime.strptime(best_day[0], '%Y-%m-%d')
-            insights.append(f"• <b>Best performing day:</b> {best_day_date.strftime('%B %d')} (P{best_day[1]:,.2f})")
-        
-        for insight in insights:
-            elements.append(Paragraph(insight, normal_style))
-    
-    # Footer
-    elements.append(Spacer(1, 30))
-    elements.append(Paragraph("Confidential Business Document • Generated by StockSmart POS", footer_style))
-    elements.append(Paragraph(f"Page 1 of 1 • Report ID: SR-{timezone.now().strftime('%Y%m%d-%H%M')}", footer_style))
-    
-    # Build PDF
-    doc.build(elements)
-    
-    pdf = buffer.getvalue()
-    buffer.close()
-    
-    return pdf
 
+class RowStream(Flowable):
+    """Table rows pulled from an iterator as layout needs them, a page at a time.
 
+    It never fits, so platypus asks split() for what does: a RowPage of as
+    many rows as fill the space left, header repeated, and the stream again
+    for the rest. Only one page of rows and flowables is held at once. Rows
+    are one line each; longer text is cut off with an ellipsis. Columns from
+    ``numeric_from`` on are aligned right.
 
+    That doesn't make the whole render flat: reportlab keeps every finished
+    page until the save, then assembles the whole file in memory before
+    writing it. See ReportCanvas, which keeps that to the compressed pages.
+    """
 
+    def __init__(self, header, rows, col_widths, numeric_from=None, row_height=ROW_HEIGHT):
+        super().__init__()
+        self.header = [self.fit(label, width, 'Helvetica-Bold') for label, width in zip(header, col_widths)]
+        self.rows = iter(rows)
+        self.col_widths = col_widths
+        self.numeric_from = len(col_widths) if numeric_from is None else numeric_from
+        self.row_height = row_height
+        self.next_row = next(self.rows, None)
 
+    def wrap(self, available_width, available_height):
+        return available_width, available_height + self.row_height
 
+    def split(self, available_width, available_height):
+        count = int(available_height // self.row_height) - 1
+        if count < 1:
+            return [PageBreak(), self]
+        rows = []
+        while self.next_row is not None and len(rows) < count:
+            rows.append([self.fit(str(value), width) for value, width in zip(self.next_row, self.col_widths)])
+            self.next_row = next(self.rows, None)
+        page = RowPage(self.header, rows, self.col_widths, self.numeric_from, self.row_height)
+        return [page, self] if self.next_row is not None else [page]
 
-def generate_purchase_report_pdf(purchase_orders, filters=None):
-    """Generate professional PDF purchase report"""
-    buffer = BytesIO()
-    
-    # Use A4 size for reports
-    page_width = 210 * mm
-    page_height = 297 * mm
-    
+    @staticmethod
+    def fit(text, width, font='Helvetica'):
+        """(text, its width) with ``text`` cut to fit a ``width`` column, ellipsis included.
+
+        One stringWidth() for text that fits, as nearly all does, and a
+        binary search over the length for text that doesn't.
+        """
+        room = width - 2 * CELL_PADDING
+        text_width = stringWidth(text, font, ROW_FONT_SIZE)
+        if text_width <= room:
+            return text, text_width
+        room -= stringWidth('…', font, ROW_FONT_SIZE)
+        low, high = 0, len(text)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if stringWidth(text[:middle], font, ROW_FONT_SIZE) <= room:
+                low = middle
+            else:
+                high = middle - 1
+        text = text[:low] + '…'
+        return text, stringWidth(text, font, ROW_FONT_SIZE)
+
+    def draw(self):
+        pass
+
+
+class RowPage(Flowable):
+    """A page of RowStream rows, fitted already as (text, width) cells.
+
+    Drawn straight onto the canvas, with one text object for all the cells:
+    a Table works out styles, spans and alignment cell by cell, which made
+    it most of the time of a long report.
+    """
+
+    def __init__(self, header, rows, col_widths, numeric_from, row_height):
+        super().__init__()
+        self.header = header
+        self.rows = rows
+        self.col_widths = col_widths
+        self.numeric_from = numeric_from
+        self.row_height = row_height
+        self.width = sum(col_widths)
+        self.height = row_height * (len(rows) + 1)
+
+    def wrap(self, available_width, available_height):
+        return self.width, self.height
+
+    def draw(self):
+        canv = self.canv
+        row_height = self.row_height
+        # Baseline of a row's text above the row's bottom, centring it
+        baseline = (row_height - ROW_FONT_SIZE) / 2 + 2
+        lefts, left = [], 0
+        for width in self.col_widths:
+            lefts.append(left)
+            left += width
+
+        canv.saveState()
+        canv.setFillColor(GREEN)
+        canv.rect(0, self.height - row_height, self.width, row_height, stroke=0, fill=1)
+        canv.setFillColor(ZEBRA)
+        for position in range(1, len(self.rows), 2):
+            canv.rect(0, self.height - row_height * (position + 2), self.width, row_height, stroke=0, fill=1)
+        canv.setStrokeColor(RULE)
+        canv.setLineWidth(0.5)
+        canv.lines([(0, y, self.width, y) for y in range(0, int(self.height), row_height)])
+
+        text = canv.beginText()
+        text.setFont('Helvetica-Bold', ROW_FONT_SIZE)
+        text.setFillColor(colors.white)
+        for position, cells in enumerate([self.header, *self.rows]):
+            if position == 1:
+                text.setFont('Helvetica', ROW_FONT_SIZE)
+                text.setFillColor(colors.black)
+            y = self.height - row_height * (position + 1) + baseline
+            for column, (value, width) in enumerate(cells):
+                if column < self.numeric_from:
+                    x = lefts[column] + CELL_PADDING
+                else:
+                    x = lefts[column] + self.col_widths[column] - CELL_PADDING - width
+                text.setTextOrigin(x, y)
+                # Unlike textOut(), doesn't measure the text again
+                text.textLine(value)
+        canv.drawText(text)
+        canv.restoreState()
+
+
+class ReportCanvas(canvas.Canvas):
+    """The canvas of the reports, made for documents of any length.
+
+    Every page shows the page count, unknown until the end, by referring to
+    a form that is only drawn when the document is saved, so no page has to
+    be kept back until the count is known. And pages are compressed as they
+    are finished, rather than all kept as drawing commands until the save.
+    """
+
+    def showPage(self):
+        super().showPage()
+        page = self._doc.Pages.pages[-1]
+        if page.compression and page.stream:
+            # Content with its Filter already set is written as is
+            contents = PDFStream(content=zlib.compress(page.stream.encode('utf8')))
+            contents.dictionary['Filter'] = PDFArray([PDFName('FlateDecode')])
+            page.Contents, page.stream = contents, None
+
+    def save(self):
+        # Saving follows the last page break, so the current page is one past the last
+        self.beginForm('page_count')
+        self.setFont('Helvetica-Oblique', 9)
+        self.setFillColor(GREY)
+        self.drawString(0, 0, str(self.getPageNumber() - 1))
+        self.endForm()
+        super().save()
+
+
+def draw_page_number(canv, doc):
+    """Page callback of the reports: "Page X of Y" at the bottom of the page"""
+    text = f"Page {doc.page} of "
+    # The count is about as wide as the page number
+    width = stringWidth(text + str(doc.page), 'Helvetica-Oblique', 9)
+    x = (doc.pagesize[0] - width) / 2
+    canv.saveState()
+    canv.setFont('Helvetica-Oblique', 9)
+    canv.setFillColor(GREY)
+    canv.drawString(x, 12 * mm, text)
+    canv.translate(x + stringWidth(text, 'Helvetica-Oblique', 9), 12 * mm)
+    canv.doForm('page_count')
+    canv.restoreState()
+
+
+class SectionMark(Flowable):
+    """Takes no space; notes when layout reaches the start of a section"""
+
+    def __init__(self, name, reached):
+        super().__init__()
+        self.name = name
+        self.reached = reached
+
+    def wrap(self, available_width, available_height):
+        return 0, 0
+
+    def draw(self):
+        self.reached.append((self.name, time.perf_counter()))
+
+
+def render_report(report, data, filters=None, timings=None, output=None):
+    """Render the PDF of ``report`` (e.g. SALES_REPORT) for ``data``, and
+    return it, or write it to the path ``output`` and return that instead.
+
+    If ``timings`` is a dict, it is filled with the seconds each shown
+    section took, as {name: {'build': ..., 'layout': ...}}: building is
+    making its flowables, layout is reportlab placing and drawing them
+    (for the last section, writing out the file too).
+    """
+    styles = pdf_styles()
+    buffer = output or BytesIO()
     doc = SimpleDocTemplate(
         buffer,
         pagesize=A4,
@@ -468,322 +562,170 @@ def generate_purchase_report_pdf(purchase_orders, filters=None):
         topMargin=25 * mm,
         bottomMargin=25 * mm
     )
-    
+
     elements = []
-    styles = getSampleStyleSheet()
-    
-    # Custom professional styles
-    title_style = ParagraphStyle(
-        'Title',
-        parent=styles['Heading1'],
-        fontSize=20,
-        alignment=TA_CENTER,
-        spaceAfter=20,
-        textColor=colors.HexColor('#2E7D32'),
-        fontName='Helvetica-Bold'
-    )
-    
-    subtitle_style = ParagraphStyle(
-        'Subtitle',
-        parent=styles['Heading2'],
-        fontSize=14,
-        alignment=TA_CENTER,
-        spaceAfter=30,
-        textColor=colors.HexColor('#1B5E20'),
-        fontName='Helvetica-Bold'
-    )
-    
-    section_header_style = ParagraphStyle(
-        'SectionHeader',
-        parent=styles['Heading2'],
-        fontSize=12,
-        spaceAfter=12,
-        spaceBefore=20,
-        textColor=colors.HexColor('#2E7D32'),
-        fontName='Helvetica-Bold',
-        leftIndent=0
-    )
-    
-    normal_style = ParagraphStyle(
-        'Normal',
-        parent=styles['Normal'],
-        fontSize=10,
-        spaceAfter=8,
-        textColor=colors.HexColor('#333333'),
-        fontName='Helvetica'
-    )
-    
-    highlight_style = ParagraphStyle(
-        'Highlight',
-        parent=styles['Normal'],
-        fontSize=11,
-        spaceAfter=6,
-        textColor=colors.HexColor('#1B5E20'),
-        fontName='Helvetica-Bold',
-        backColor=colors.HexColor('#E8F5E8'),
-        borderPadding=8,
-        borderColor=colors.HexColor('#C8E6C9'),
-        borderWidth=1
-    )
-    
-    footer_style = ParagraphStyle(
-        'Footer',
-        parent=styles['Normal'],
-        fontSize=9,
-        alignment=TA_CENTER,
-        spaceBefore=20,
-        textColor=colors.HexColor('#666666'),
-        fontName='Helvetica-Oblique'
-    )
-    
-    # Header Section
-    elements.append(Paragraph("STOCKSMART", title_style))
-    elements.append(Paragraph("PURCHASE MANAGEMENT REPORT", subtitle_style))
-    
-    # Report Metadata
-    elements.append(Paragraph(f"<b>Report Generated:</b> {timezone.now().strftime('%B %d, %Y at %I:%M %p')}", normal_style))
-    
-    # Filter Information
-    if filters:
-        filter_text = "<b>Report Filters:</b> "
-        filter_parts = []
-        
-        if filters.get('date_from') and filters.get('date_to'):
-            filter_parts.append(f"Period: {filters['date_from']} to {filters['date_to']}")
-        elif filters.get('date_from'):
-            filter_parts.append(f"From: {filters['date_from']}")
-        elif filters.get('date_to'):
-            filter_parts.append(f"To: {filters['date_to']}")
-        
-        if filters.get('supplier'):
-            filter_parts.append(f"Supplier: {filters['supplier']}")
-        
-        if filters.get('search'):
-            filter_parts.append(f"Search: {filters['search']}")
-        
-        filter_text += " • ".join(filter_parts) if filter_parts else "All Received Orders"
-        elements.append(Paragraph(filter_text, normal_style))
-    
-    elements.append(Spacer(1, 25))
-    
-    # Executive Summary Section
-    elements.append(Paragraph("EXECUTIVE SUMMARY", section_header_style))
-    
-    # Calculate key metrics
-    total_purchases = sum(po.total_cost for po in purchase_orders)
-    total_orders = len(purchase_orders)
-    average_purchase = total_purchases / total_orders if total_orders > 0 else 0
-    
-    # Count total items purchased
-    total_items = sum(po.purchaseitem_set.count() for po in purchase_orders)
-    
-    # Summary in a professional layout
-    summary_data = [
-        [f"P {total_purchases:,.2f}", "Total Purchases"],
-        [f"{total_orders}", "Purchase Orders"],
-        [f"P {average_purchase:,.2f}", "Average Order Value"],
-        [f"{total_items}", "Total Items Purchased"],
-    ]
-    
-    # Create a grid layout for summary
-    summary_table = Table(summary_data, colWidths=[2.5*inch, 3*inch])
-    summary_table.setStyle(TableStyle([
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('LEFTPADDING', (0, 0), (0, -1), 20),
-        ('RIGHTPADDING', (0, 0), (0, -1), 20),
-        ('LEFTPADDING', (1, 0), (1, -1), 10),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (0, -1), 16),
-        ('FONTSIZE', (1, 0), (1, -1), 11),
-        ('TEXTCOLOR', (0, 0), (0, -1), colors.HexColor('#2E7D32')),
-        ('TEXTCOLOR', (1, 0), (1, -1), colors.HexColor('#666666')),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 15),
-        ('TOPPADDING', (0, 0), (-1, -1), 15),
-        ('LINEBELOW', (0, 0), (-1, -1), 1, colors.HexColor('#E0E0E0')),
-    ]))
-    
-    elements.append(summary_table)
-    elements.append(Spacer(1, 25))
-    
-    # Purchase Analysis Section
-    if purchase_orders:
-        elements.append(Paragraph("PURCHASE ANALYSIS", section_header_style))
-        
-        # Group by date for trend analysis
-        daily_purchases = defaultdict(float)
-        supplier_analysis = defaultdict(lambda: {'purchases': 0, 'orders': 0, 'items': 0})
-        
-        for po in purchase_orders:
-            date_str = po.date_created.strftime('%Y-%m-%d')
-            daily_purchases[date_str] += float(po.total_cost)
-            supplier_analysis[po.supplier_name]['purchases'] += float(po.total_cost)
-            supplier_analysis[po.supplier_name]['orders'] += 1
-            supplier_analysis[po.supplier_name]['items'] += po.purchaseitem_set.count()
-        
-        # Top purchasing days
-        if daily_purchases:
-            elements.append(Paragraph("<b>Top Purchasing Days:</b>", normal_style))
-            top_days = sorted(daily_purchases.items(), key=lambda x: x[1], reverse=True)[:5]
-            
-            for date, amount in top_days:
-                date_obj = datetime.strptime(date, '%Y-%m-%d')
-                elements.append(Paragraph(
-                    f"• {date_obj.strftime('%B %d, %Y')}: <b>P{amount:,.2f}</b>", 
-                    normal_style
-                ))
-        
-        elements.append(Spacer(1, 15))
-        
-        # Supplier Performance
-        if supplier_analysis:
-            elements.append(Paragraph("<b>Supplier Analysis:</b>", normal_style))
-            sorted_suppliers = sorted(supplier_analysis.items(), key=lambda x: x[1]['purchases'], reverse=True)
-            
-            for supplier, data in sorted_suppliers:
-                avg_order = data['purchases'] / data['orders'] if data['orders'] > 0 else 0
-                elements.append(Paragraph(
-                    f"• {supplier}: {data['orders']} orders, {data['items']} items, P{data['purchases']:,.2f} total (P{avg_order:,.2f} avg)", 
-                    normal_style
-                ))
-        
-        elements.append(Spacer(1, 25))
-        
-        # Recent Purchases Section
-        elements.append(Paragraph("RECENT PURCHASE ORDERS", section_header_style))
-        
-        # Show last 10 purchase orders
-        recent_orders = purchase_orders[:10]
-        for i, po in enumerate(recent_orders, 1):
-            # Get item details
-            items_text = ", ".join([f"{item.product_name} (x{item.quantity})" for item in po.purchaseitem_set.all()[:3]])
-            if po.purchaseitem_set.count() > 3:
-                items_text += f" ... and {po.purchaseitem_set.count() - 3} more items"
-            
-            purchase_text = f"""
-            <b>PO #{po.id}</b> • {po.date_created.strftime('%b %d, %Y')}<br/>
-            Supplier: {po.supplier_name} • Items: {po.purchaseitem_set.count()}<br/>
-            Total: <font color="#2E7D32"><b>P {po.total_cost:,.2f}</b></font><br/>
-            Products: {items_text}
-            """
-            
-            # Alternate background colors for readability
-            if i % 2 == 0:
-                bg_color = colors.HexColor('#F8F9FA')
-            else:
-                bg_color = colors.HexColor('#FFFFFF')
-            
-            purchase_table = Table([[Paragraph(purchase_text, normal_style)]], 
-                                 colWidths=[6*inch])
-            purchase_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, -1), bg_color),
-                ('BOX', (0, 0), (-1, -1), 1, colors.HexColor('#E0E0E0')),
-                ('PADDING', (0, 0), (-1, -1), 10),
-                ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-            ]))
-            
-            elements.append(purchase_table)
-        
-        # Show "more orders" note if there are more
-        if len(purchase_orders) > 10:
-            elements.append(Spacer(1, 10))
-            elements.append(Paragraph(
-                f"<i>... and {len(purchase_orders) - 10} more purchase orders</i>", 
-                footer_style
-            ))
-    
-    else:
-        # No data message
-        elements.append(Paragraph("No purchase data available for the selected period.", normal_style))
-        elements.append(Paragraph("Please adjust your filters or check your data.", normal_style))
-    
-    elements.append(Spacer(1, 25))
-    
-    # Top Purchased Products Section
-    if purchase_orders:
-        product_purchases = defaultdict(lambda: {'quantity': 0, 'total_cost': 0})
-        
-        # Aggregate product purchases across all orders
-        for po in purchase_orders:
-            for item in po.purchaseitem_set.all():
-                product_purchases[item.product_name]['quantity'] += item.quantity
-                product_purchases[item.product_name]['total_cost'] += item.quantity * item.cost_per_unit
-        
-        if product_purchases:
-            elements.append(Paragraph("MOST PURCHASED PRODUCTS", section_header_style))
-            
-            # Sort products by quantity purchased, descending
-            sorted_products = sorted(product_purchases.items(), key=lambda x: x[1]['quantity'], reverse=True)
-            top_products = sorted_products[:5]  # Top 5 most purchased
-            
-            for product, data in top_products:
-                avg_cost = data['total_cost'] / data['quantity'] if data['quantity'] > 0 else 0
-                elements.append(Paragraph(
-                    f"• {product}: <b>{data['quantity']}</b> units (P{data['total_cost']:,.2f} total, P{avg_cost:,.2f} avg)", 
-                    normal_style
-                ))
-            
-            # Add small note if there are many products
-            if len(product_purchases) > 5:
-                elements.append(Spacer(1, 10))
-                elements.append(Paragraph(
-                    f"<i>... and {len(product_purchases) - 5} more products.</i>",
-                    footer_style
-                ))
-        
-        elements.append(Spacer(1, 25))
-    
-    # Inventory Insights
-    if purchase_orders and total_orders > 1:
-        elements.append(Paragraph("INVENTORY INSIGHTS", section_header_style))
-        
-        # Calculate some insights
-        max_order = max(po.total_cost for po in purchase_orders)
-        min_order = min(po.total_cost for po in purchase_orders)
-        
-        insights = [
-            f"• <b>Largest single purchase:</b> P{max_order:,.2f}",
-            f"• <b>Average purchase value:</b> P{average_purchase:,.2f}",
-            f"• <b>Total items restocked:</b> {total_items} units",
-            f"• <b>Average items per order:</b> {total_items/total_orders:.1f}",
-        ]
-        
-        if len(daily_purchases) > 1:
-            best_day = max(daily_purchases.items(), key=lambda x: x[1])
-            best_day_date = datetime.strptime(best_day[0], '%Y-%m-%d')
-            insights.append(f"• <b>Highest spending day:</b> {best_day_date.strftime('%B %d')} (P{best_day[1]:,.2f})")
-        
-        for insight in insights:
-            elements.append(Paragraph(insight, normal_style))
-    
-    # Cost Analysis
-    if purchase_orders:
-        elements.append(Spacer(1, 25))
-        elements.append(Paragraph("COST DISTRIBUTION", section_header_style))
-        
-        # Categorize orders by size
-        small_orders = [po for po in purchase_orders if po.total_cost < 1000]
-        medium_orders = [po for po in purchase_orders if 1000 <= po.total_cost < 5000]
-        large_orders = [po for po in purchase_orders if po.total_cost >= 5000]
-        
-        cost_distribution = [
-            f"• <b>Small orders</b> (< P1,000): {len(small_orders)} orders",
-            f"• <b>Medium orders</b> (P1,000 - P5,000): {len(medium_orders)} orders", 
-            f"• <b>Large orders</b> (≥ P5,000): {len(large_orders)} orders",
-        ]
-        
-        for distribution in cost_distribution:
-            elements.append(Paragraph(distribution, normal_style))
-    
-    # Footer
-    elements.append(Spacer(1, 30))
-    elements.append(Paragraph("Confidential Business Document • Generated by StockSmart POS", footer_style))
-    elements.append(Paragraph(f"Page 1 of 1 • Report ID: PR-{timezone.now().strftime('%Y%m%d-%H%M')}", footer_style))
-    
-    # Build PDF
-    doc.build(elements)
-    
+    built = {}
+    reached = []
+    for section in report['sections']:
+        if section.get('when') and not section['when'](data):
+            continue
+        start = time.perf_counter()
+        flowables = SECTION_KINDS[section['kind']](section, report, data, filters, styles)
+        built[section['name']] = time.perf_counter() - start
+        elements += [SectionMark(section['name'], reached), *flowables]
+
+    doc.build(elements, onFirstPage=draw_page_number, onLaterPages=draw_page_number, canvasmaker=ReportCanvas)
+    finished = time.perf_counter()
+
+    if timings is not None:
+        for (name, start), (_, end) in zip(reached, reached[1:] + [(None, finished)]):
+            timings[name] = {'build': built[name], 'layout': end - start}
+    if output:
+        return output
     pdf = buffer.getvalue()
     buffer.close()
-    
-    return pdf
\ No newline at end of file
+    return pdf
+
+
+def _average(total, count):
+    return total / count if count > 0 else 0
+
+
+def _purchase_products(order):
+    products = ", ".join(f"{product_name} (x{quantity})" for product_name, quantity in order['items'])
+    if order['item_count'] > 3:
+        products += f" ... and {order['item_count'] - 3} more items"
+    return products
+
+
+SALES_REPORT = {
+    'subtitle': 'SALES PERFORMANCE REPORT',
+    'id_prefix': 'SR',
+    # Filters shown besides the dates, as (name, label)
+    'filters': (('cashier', 'Cashier'), ('customer_id', 'Customer'), ('invoice_number', 'Invoice')),
+    'unfiltered': 'All Records',
+    'count': 'total_transactions',
+    'sections': [
+        {'name': 'header', 'kind': 'header'},
+        {'name': 'summary', 'kind': 'summary', 'rows': (
+            ("P {total_sales:,.2f}", "Total Revenue"),
+            ("{total_transactions}", "Transactions Processed"),
+            ("P {average_sale:,.2f}", "Average Transaction Value"),
+        )},
+        {'name': 'breakdown', 'kind': 'lists', 'when': lambda data: data['total_transactions'],
+         'heading': 'SALES BREAKDOWN', 'lists': (
+            ('Top Performing Days', 'top_days', "• {day:%B %d, %Y}: <b>P{sales:,.2f}</b>"),
+            ('Cashier Performance', 'cashiers', lambda cashier: (
+                f"• {cashier['staff_name']}: {cashier['transactions']} transactions, P{cashier['sales']:,.2f} total "
+                f"(P{_average(cashier['sales'], cashier['transactions']):,.2f} avg)"
+            )),
+        )},
+        {'name': 'recent', 'kind': 'boxes', 'heading': 'RECENT TRANSACTIONS', 'rows': 'recent',
+         'box': (
+             "<b>{invoice_number}</b> • {date_issued:%b %d, %Y %I:%M %p}<br/>"
+             "Customer: {customer_id} • Cashier: {staff_name}<br/>"
+             "Amount: <font color=\"#2E7D32\"><b>P {total_amount:,.2f}</b></font> • Items: {item_count}"
+         ),
+         'more': ('total_transactions', 'transactions'),
+         'empty': ("No sales data available for the selected period.",
+                   "Please adjust your filters or check your data.")},
+        {'name': 'top_products', 'kind': 'bullets', 'when': lambda data: data['top_products'],
+         'heading': 'TOP SELLING PRODUCTS', 'rows': 'top_products', 'line': "• {product_name}: <b>{quantity}</b> sold",
+         'more': ('product_count', 'products.'), 'space_after': 25},
+        {'name': 'insights', 'kind': 'bullets', 'when': lambda data: data['total_transactions'] > 1,
+         'heading': 'PERFORMANCE INSIGHTS', 'lines': (
+            "• <b>Highest single transaction:</b> P{max_sale:,.2f}",
+            "• <b>Average transaction value:</b> P{average_sale:,.2f}",
+            "• <b>Total processing volume:</b> {total_transactions} transactions",
+            ("• <b>Best performing day:</b> {top_days[0][day]:%B %d} (P{top_days[0][sales]:,.2f})",
+             lambda data: data['days'] > 1),
+        )},
+        {'name': 'footer', 'kind': 'footer'},
+    ],
+}
+
+PURCHASE_REPORT = {
+    'subtitle': 'PURCHASE MANAGEMENT REPORT',
+    'id_prefix': 'PR',
+    'filters': (('supplier', 'Supplier'), ('search', 'Search')),
+    'unfiltered': 'All Received Orders',
+    'count': 'total_orders',
+    'sections': [
+        {'name': 'header', 'kind': 'header'},
+        {'name': 'summary', 'kind': 'summary', 'rows': (
+            ("P {total_purchases:,.2f}", "Total Purchases"),
+            ("{total_orders}", "Purchase Orders"),
+            ("P {average_purchase:,.2f}", "Average Order Value"),
+            ("{total_items}", "Total Items Purchased"),
+        )},
+        {'name': 'analysis', 'kind': 'lists', 'when': lambda data: data['total_orders'],
+         'heading': 'PURCHASE ANALYSIS', 'lists': (
+            ('Top Purchasing Days', 'top_days', "• {day:%B %d, %Y}: <b>P{purchases:,.2f}</b>"),
+            ('Supplier Analysis', 'suppliers', lambda supplier: (
+                f"• {supplier['supplier_name']}: {supplier['orders']} orders, {supplier['items']} items, "
+                f"P{supplier['purchases']:,.2f} total (P{_average(supplier['purchases'], supplier['orders']):,.2f} avg)"
+            )),
+        )},
+        {'name': 'recent', 'kind': 'boxes', 'heading': 'RECENT PURCHASE ORDERS', 'rows': 'recent',
+         'box': lambda order: (
+             f"<b>PO #{order['id']}</b> • {order['date_created']:%b %d, %Y}<br/>"
+             f"Supplier: {order['supplier_name']} • Items: {order['item_count']}<br/>"
+             f"Total: <font color=\"#2E7D32\"><b>P {order['total_cost']:,.2f}</b></font><br/>"
+             f"Products: {_purchase_products(order)}"
+         ),
+         'more': ('total_orders', 'purchase orders'),
+         'empty': ("No purchase data available for the selected period.",
+                   "Please adjust your filters or check your data.")},
+        {'name': 'top_products', 'kind': 'bullets', 'when': lambda data: data['top_products'],
+         'heading': 'MOST PURCHASED PRODUCTS', 'rows': 'top_products', 'line': lambda product: (
+             f"• {product['product_name']}: <b>{product['quantity']}</b> units "
+             f"(P{product['total_cost']:,.2f} total, P{_average(product['total_cost'], product['quantity']):,.2f} avg)"
+         ),
+         'more': ('product_count', 'products.'), 'space_after': 25},
+        {'name': 'insights', 'kind': 'bullets', 'when': lambda data: data['total_orders'] > 1,
+         'heading': 'INVENTORY INSIGHTS', 'lines': (
+            "• <b>Largest single purchase:</b> P{max_order:,.2f}",
+            "• <b>Average purchase value:</b> P{average_purchase:,.2f}",
+            "• <b>Total items restocked:</b> {total_items} units",
+            lambda data: f"• <b>Average items per order:</b> {data['total_items'] / data['total_orders']:.1f}",
+            ("• <b>Highest spending day:</b> {top_days[0][day]:%B %d} (P{top_days[0][purchases]:,.2f})",
+             lambda data: data['days'] > 1),
+        )},
+        {'name': 'cost_distribution', 'kind': 'bullets', 'when': lambda data: data['total_orders'],
+         'heading': 'COST DISTRIBUTION',
+         'space_before': 25, 'lines': (
+             "• <b>Small orders</b> (< P1,000): {small_orders} orders",
+             "• <b>Medium orders</b> (P1,000 - P5,000): {medium_orders} orders",
+             "• <b>Large orders</b> (≥ P5,000): {large_orders} orders",
+         )},
+        {'name': 'footer', 'kind': 'footer'},
+    ],
+}
+
+
+def _invoice_detail(row):
+    number, date_issued, customer_id, cashier, subtotal, tax, total, is_active = row
+    return (
+        number if is_active else f"{number} (void)", f"{date_issued:%Y-%m-%d %H:%M}", customer_id, cashier,
+        f"{subtotal:,.2f}", f"{tax:,.2f}", f"{total:,.2f}",
+    )
+
+
+# The sales report with every invoice instead of the latest ones, at the end
+DETAILED_SALES_REPORT = dict(
+    SALES_REPORT,
+    subtitle='DETAILED SALES REPORT',
+    id_prefix='SD',
+    sections=[
+        *(section for section in SALES_REPORT['sections'] if section['name'] not in ('recent', 'footer')),
+        {'name': 'transactions', 'kind': 'table', 'heading': 'ALL TRANSACTIONS',
+         'rows': lambda filters: sales_detail_rows(filter_invoices(sales_filters(filters))),
+         'row': _invoice_detail,
+         'columns': (('Invoice', 78), ('Date', 76), ('Customer', 60), ('Cashier', 66),
+                     ('Subtotal', 54), ('Tax', 48), ('Total', 58)),
+         'numeric_from': 4,
+         'empty': ("No sales data available for the selected period.",
+                   "Please adjust your filters or check your data.")},
+        {'name': 'footer', 'kind': 'footer'},
+    ],
+)
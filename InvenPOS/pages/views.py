@@ -4,24 +4,41 @@ from django.contrib.auth import login as auth_login, logout as auth_logout, upda
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.core.paginator import Paginator
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse, FileResponse
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 import json
-from .models import Product, Category, Supplier, Invoice, TaxRate, SoldItem, PurchaseOrder, PurchaseItem
-from .utils import generate_invoice_pdf
+import hashlib
+import tempfile
+from asgiref.sync import sync_to_async
+from .models import Product, Category, Supplier, Invoice, TaxRate, SoldItem, PurchaseOrder, PurchaseItem, ReportJob, normalize_sku
+from .caches import get_active_tax_rate, get_tax_rate_entry, aget_tax_rate_entry, lookup_sku
+from .checkout import process_sale, process_sales_batch, sale_summary, find_replay
+from .reservations import ReservationError, set_hold, release_holds, held_by
+from .sequences import catalog_version
+from .catalog import PRODUCT, catalog_changes, record_changes, snapshot_bytes
+from .receipts import (
+    cached_receipt, clear_receipts, print_receipt, receipt_key, render_receipt_escpos, render_receipt_text,
+)
+from .report_jobs import enqueue_report, job_status, render_now, requeue_stale_jobs, worker_running
+from .rollups import sales_totals, updating_sales
+from .reports import (
+    export_invoice_rows, export_purchase_item_rows, export_sold_item_rows, filter_invoices,
+    filter_purchase_orders, parse_day, sales_filters,
+)
+from .spreadsheets import SpreadsheetError, export_product_rows, import_products, read_product_rows, stream_csv, write_xlsx
+from .images import update_variants
+from .search import GRID_FIELDS, filter_products, grid_product, search_products
 from django.utils import timezone
 from django.contrib.auth.models import User
-from django.db.models import Q, F, DecimalField, ExpressionWrapper
-from .utils import generate_sales_report_pdf, generate_purchase_report_pdf # Make sure this is imported
-from django.db import transaction
-from reportlab.lib.units import inch
+from django.db.models import F, Q, Sum, Count
+from django.db import transaction, IntegrityError
 
 from django.contrib.auth.hashers import make_password
 
-# ADD THESE IMPORTS FOR AGGREGATION AND DATE HANDLING
-from django.db.models import Sum, Count  # ← ADD THIS LINE
-from datetime import datetime, timedelta  # ← ADD THIS LINE
 # ---------------- AUTHENTICATION ----------------
 
 @login_required
@@ -85,11 +102,11 @@ def products(request):
     query = request.GET.get('q')
     category_id = request.GET.get('category')
 
-    products = Product.objects.all().order_by('id')
+    products = Product.objects.select_related('product_category').order_by('id')
 
     # --- FILTER BY SEARCH QUERY ---
     if query:
-        products = products.filter(product_name__icontains=query)
+        products = filter_products(products, query)
 
     # --- FILTER BY CATEGORY ---
     selected_category = None
@@ -97,7 +114,7 @@ def products(request):
         try:
             category = Category.objects.get(id=category_id)
             selected_category = category
-            products = products.filter(product_category=category.name)
+            products = products.filter(product_category=category)
         except Category.DoesNotExist:
             pass
 
@@ -142,6 +159,11 @@ def add_product(request):
         quantity = request.POST.get('quantity')
         category_id = request.POST.get('category')
         image = request.FILES.get('image')
+        sku = normalize_sku(request.POST.get('sku'))
+
+        if sku and Product.objects.filter(sku=sku).exists():
+            messages.error(request, f'SKU "{sku}" is already used by another product.')
+            return redirect('pages:products')
 
         # Find category object if exists
         category = None
@@ -151,21 +173,33 @@ def add_product(request):
             except Category.DoesNotExist:
                 category = None
 
-        Product.objects.create(
+        product = Product.objects.create(
             product_name=name,
             product_price=price,
             product_quantity=quantity,
-            product_category=category.name if category else '',
-            product_img=image
+            product_category=category,
+            product_img=image,
+            sku=sku,
         )
+        if image and not update_variants(product):
+            messages.warning(request, IMAGE_NOT_RESIZED)
         return redirect('pages:products')
     return redirect('pages:products')
 
 
+IMAGE_NOT_RESIZED = "The product was saved, but its image couldn't be read to make smaller copies; it is shown as uploaded."
+
+
 @login_required
 def edit_product(request, id):
     product = get_object_or_404(Product, id=id)
     if request.method == "POST":
+        sku = normalize_sku(request.POST.get('sku'))
+        if sku and Product.objects.filter(sku=sku).exclude(id=product.id).exists():
+            messages.error(request, f'SKU "{sku}" is already used by another product.')
+            return redirect('pages:products')
+
+        product.sku = sku
         product.product_name = request.POST.get('name')
         product.product_price = request.POST.get('price')
         product.product_quantity = request.POST.get('quantity')
@@ -174,14 +208,20 @@ def edit_product(request, id):
         if category_id:
             try:
                 category = Category.objects.get(id=category_id)
-                product.product_category = category.name
+                product.product_category = category
             except Category.DoesNotExist:
                 pass
 
-        if request.FILES.get('image'):
-            product.product_img = request.FILES.get('image')
+        # Only what the form edits; reserved_quantity moves under us as carts hold stock
+        fields = ['sku', 'product_name', 'product_price', 'product_quantity', 'product_category']
+        new_image = request.FILES.get('image')
+        if new_image:
+            product.product_img = new_image
+            fields.append('product_img')
 
-        product.save()
+        product.save(update_fields=fields)
+        if new_image and not update_variants(product):
+            messages.warning(request, IMAGE_NOT_RESIZED)
         return redirect('pages:products')
 
     return render(request, 'admin/edit_product.html', {'product': product})
@@ -193,6 +233,64 @@ def delete_product(request, id):
     product.delete()
     return redirect('pages:products')
 
+
+@login_required
+def product_import(request):
+    """Create and update products from an uploaded CSV or XLSX price list.
+
+    With "preview" ticked nothing is saved; the page shows what would change.
+    """
+    if request.method != "POST":
+        return redirect('pages:products')
+
+    upload = request.FILES.get('file')
+    if not upload:
+        messages.error(request, 'Choose a CSV or XLSX file to import.')
+        return redirect('pages:products')
+
+    dry_run = bool(request.POST.get('dry_run'))
+    try:
+        result = import_products(read_product_rows(upload, upload.name), dry_run=dry_run)
+    except SpreadsheetError as e:
+        messages.error(request, str(e))
+        return redirect('pages:products')
+
+    return render(request, 'admin/product_import.html', {'result': result, 'filename': upload.name})
+
+
+@login_required
+def product_export(request):
+    """Download every product as CSV (streamed) or XLSX: ?format=xlsx"""
+    return spreadsheet_response(
+        request, export_product_rows(), f"products-{timezone.localdate():%Y%m%d}", 'Products', 'pages:products',
+    )
+
+
+def spreadsheet_response(request, rows, filename, title, error_redirect):
+    """``rows`` as a streamed CSV download, or as XLSX with ?format=xlsx.
+
+    CSV is sent as it is produced. An XLSX file is a zip that can't be sent
+    before it is finished, so it is written to a temporary file first; with
+    openpyxl's write-only mode memory stays flat either way.
+    """
+    if request.GET.get('format') == 'xlsx':
+        output = tempfile.TemporaryFile()
+        try:
+            write_xlsx(rows, output, title)
+        except SpreadsheetError as e:
+            output.close()
+            messages.error(request, str(e))
+            return redirect(error_redirect)
+        output.seek(0)
+        return FileResponse(
+            output, as_attachment=True, filename=f'{filename}.xlsx',
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        )
+
+    response = StreamingHttpResponse(stream_csv(rows), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+    return response
+
 def users(request):
     return render(request, 'admin/users.html')
 
@@ -223,7 +321,7 @@ def edit_category(request, category_id):
 def delete_category(request, category_id):
     category = get_object_or_404(Category, id=category_id)
     # Delete all products with this category
-    Product.objects.filter(product_category=category.name).delete()
+    Product.objects.filter(product_category=category).delete()
     category.delete()
     messages.warning(request, f'Category "{category.name}" and all its products have been deleted!')
     return redirect('pages:products')
@@ -281,8 +379,9 @@ def restock_product(request, id):
             supplier_id = request.POST.get("supplier")
 
             if restock_qty > 0:
-                product.product_quantity += restock_qty
-                product.save()
+                # In the database, so sales and holds made meanwhile aren't overwritten
+                Product.objects.filter(id=product.id).update(product_quantity=F('product_quantity') + restock_qty)
+                record_changes(PRODUCT, [product.id])
 
                 supplier = None
                 if supplier_id:
@@ -317,15 +416,14 @@ def restock_product(request, id):
     })
 
 def cashier_dashboard(request):
-    category = request.GET.get('category')
-    if category:
-        products = Product.objects.filter(product_category=category)
-    else:
-        products = Product.objects.all()
+    # The product grid is loaded page by page from product_feed
     categories = Category.objects.all()
     return render(request, 'cashier/cashier_dashboard.html', {
-        'products': products,
-        'categories': categories
+        'categories': categories,
+        'page_size': getattr(settings, 'PRODUCT_FEED_PAGE_SIZE', 60),
+        # Read before the first feed page, so the sync that follows can't miss a change
+        'catalog_version': catalog_version(),
+        'catalog_poll_interval': getattr(settings, 'CATALOG_POLL_INTERVAL', 5),
     })
 
 @login_required
@@ -368,7 +466,9 @@ def invoice_update(request, invoice_id):
             invoice.tax_rate = TaxRate.objects.get(id=tax_rate_id)
         else:
             invoice.tax_rate = None
-        invoice.update_total()
+        with updating_sales(invoice):
+            invoice.save()
+        clear_receipts(invoice.id)
         messages.success(request, "Invoice updated with new tax.")
         return redirect("pages:invoice_detail", invoice_id=invoice.id)
 
@@ -424,78 +524,51 @@ def tax_delete_inline(request, pk):
 @require_POST
 @login_required  # Add login required decorator
 def create_invoice(request):
+    return invoice_response(request, request.user)
+
+
+def invoice_response(request, user):
+    """Record the sale posted in ``request`` for ``user`` and answer with its summary.
+
+    Shared by create_invoice and acreate_invoice, which only differ in how
+    they are served.
+    """
     try:
+        # A retried request with a key we've seen gets the original response back
+        idempotency_key = request.headers.get('Idempotency-Key')
+        if idempotency_key:
+            if len(idempotency_key) > 100:
+                return JsonResponse({
+                    'success': False,
+                    'error': 'Idempotency-Key is too long'
+                }, status=400)
+            replay = find_replay(user, idempotency_key)
+            if replay is not None:
+                return replayed_response(replay)
+
         data = json.loads(request.body)
         
-        # Get the default active tax rate
-        tax_rate = TaxRate.objects.filter(is_active=True).first()
+        # Get the default active tax rate (cached, see caches.py)
+        tax_rate = get_active_tax_rate()
         
         # Use the actual logged-in user's information
-        staff_name = f"{request.user.first_name} {request.user.last_name}".strip()
-        if not staff_name:
-            staff_name = request.user.username
+        staff_name = get_staff_name(user)
         
-        # Create invoice with actual user info
-        invoice = Invoice(
-            customer_id=data['customer_id'],
-            subtotal=data['subtotal'],
-            cash_received=data['cash_received'],
-            change=data['change'],
-            staff_name=staff_name,  # Use actual user info instead of hardcoded "Cashier Staff"
-            tax_rate=tax_rate,
-            created_by=request.user  # Store the actual user object
-        )
-        invoice.save()
-        
-        # Create sold items and update product quantities
-        for item_data in data['sold_items']:
-            try:
-                product = Product.objects.get(id=item_data['product_id'])
-                
-                # Check if enough stock is available
-                if product.product_quantity < item_data['quantity']:
-                    invoice.delete()
-                    return JsonResponse({
-                        'success': False,
-                        'error': f'Not enough stock for {product.product_name}. Available: {product.product_quantity}, Requested: {item_data["quantity"]}'
-                    }, status=400)
-                
-                # Update product quantity
-                product.product_quantity -= item_data['quantity']
-                product.save()
-                
-            except Product.DoesNotExist:
-                invoice.delete()
-                return JsonResponse({
-                    'success': False,
-                    'error': f'Product with ID {item_data["product_id"]} does not exist'
-                }, status=400)
-            
-            sold_item = SoldItem(
-                invoice=invoice,
-                product=product,
-                product_name=item_data['product_name'],
-                quantity=item_data['quantity'],
-                unit_price=item_data['unit_price'],
-                total_price=item_data['total_price']
+        # Create the invoice, its sold items and the stock movements in one transaction
+        try:
+            invoice, sold_items = process_sale(
+                data, user, staff_name, tax_rate, idempotency_key, get_terminal(request)
             )
-            sold_item.save()
+        except IntegrityError:
+            # A concurrent retry with the same key got there first
+            replay = find_replay(user, idempotency_key) if idempotency_key else None
+            if replay is None:
+                raise
+            return replayed_response(replay)
         
-        # Get the sold items for the response
-        sold_items = SoldItem.objects.filter(invoice=invoice)
-        
-        return JsonResponse({
-            'success': True,
-            'invoice_number': invoice.invoice_number,
-            'customer_id': invoice.customer_id,
-            'total_amount': float(invoice.total_amount),
-            'tax_amount': float(invoice.tax_amount),
-            'tax_rate_name': invoice.tax_rate.name if invoice.tax_rate else 'No Tax',
-            'tax_rate_percentage': float(invoice.tax_rate.percentage) if invoice.tax_rate else 0,
-            'invoice_id': invoice.id,
-            'staff_name': staff_name,  # Return the actual staff name for confirmation
-            'message': 'Invoice created successfully'
-        })
+        if settings.RECEIPT_PRINTER:
+            print_receipt(invoice, sold_items)
+        return JsonResponse(sale_summary(invoice))
         
     except Exception as e:
         return JsonResponse({
@@ -504,40 +577,145 @@ def create_invoice(request):
         }, status=400)
 
 
-def download_invoice_pdf(request, invoice_id):
-    """Download PDF for a specific invoice"""
+def get_staff_name(user):
+    staff_name = f"{user.first_name} {user.last_name}".strip()
+    return staff_name or user.username
+
+
+def replayed_response(replay):
+    response = JsonResponse(replay)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def get_terminal(request):
+    """Stock holds belong to the browser session the cart lives in"""
+    return request.session.session_key
+
+
+@require_POST
+@login_required
+def hold_stock(request):
+    """Hold units for a cart line; quantity is the line's new total, 0 drops it"""
+    terminal = get_terminal(request)
     try:
-        invoice = get_object_or_404(Invoice, id=invoice_id)
-        sold_items = SoldItem.objects.filter(invoice=invoice)
-        
-        # Generate PDF
-        pdf_content = generate_invoice_pdf(invoice, sold_items)
-        
-        # Create HTTP response with PDF
-        response = HttpResponse(pdf_content, content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="invoice_{invoice.invoice_number}.pdf"'
-        
-        return response
-        
+        data = json.loads(request.body)
+        product_id = int(data['product_id'])
+        quantity = int(data['quantity'])
+    except (KeyError, TypeError, ValueError):
+        return JsonResponse({
+            'success': False,
+            'error': 'Expected product_id and quantity'
+        }, status=400)
+
+    try:
+        available = set_hold(terminal, product_id, quantity)
+    except ReservationError as e:
+        product = Product.objects.filter(id=product_id).first()
+        if product is None:
+            return JsonResponse({'success': False, 'error': str(e)}, status=404)
+        return JsonResponse({
+            'success': False,
+            'error': str(e),
+            'available_quantity': product.available_quantity + held_by(terminal, [product_id]).get(product_id, 0),
+        }, status=409)
+
+    return JsonResponse({
+        'success': True,
+        'product_id': product_id,
+        'quantity': quantity,
+        'available_quantity': available,
+    })
+
+
+@require_POST
+@login_required
+def release_stock_holds(request):
+    """Give back everything this terminal holds, e.g. when the cart is emptied"""
+    return JsonResponse({
+        'success': True,
+        'released': release_holds(get_terminal(request)),
+    })
+
+
+@require_POST
+@login_required
+def sync_sales(request):
+    """Apply the sales a terminal queued while it was offline, in one pass"""
+    try:
+        data = json.loads(request.body)
+        sales = data.get('sales')
+        if not isinstance(sales, list):
+            return JsonResponse({
+                'success': False,
+                'error': 'Expected a list of sales'
+            }, status=400)
+
+        max_sales = getattr(settings, 'OFFLINE_SYNC_MAX_SALES', 1000)
+        if len(sales) > max_sales:
+            return JsonResponse({
+                'success': False,
+                'error': f'Too many sales in one batch (max {max_sales})'
+            }, status=400)
+
+        tax_rate = get_active_tax_rate()
+        results = process_sales_batch(sales, request.user, get_staff_name(request.user), tax_rate)
+
+        return JsonResponse({
+            'success': True,
+            'applied': sum(1 for result in results if result['success'] and not result.get('replayed')),
+            'results': results,
+        })
+
     except Exception as e:
         return JsonResponse({
             'success': False,
             'error': str(e)
         }, status=400)
 
+
+def download_invoice_pdf(request, invoice_id):
+    """Download PDF for a specific invoice"""
+    return receipt_response(request, invoice_id, as_attachment=True)
+
 def print_invoice_pdf(request, invoice_id):
     """View PDF for a specific invoice (open in browser)"""
+    return receipt_response(request, invoice_id, as_attachment=False)
+
+
+@login_required
+def invoice_receipt(request, invoice_id):
+    """The receipt as ESC/POS bytes for a thermal printer, or as plain text with ?format=text"""
+    invoice = get_object_or_404(Invoice.objects.select_related('tax_rate'), id=invoice_id)
+    sold_items = SoldItem.objects.filter(invoice=invoice).order_by('id')
+    if request.GET.get('format') == 'text':
+        return HttpResponse(render_receipt_text(invoice, sold_items), content_type='text/plain; charset=utf-8')
+    response = HttpResponse(render_receipt_escpos(invoice, sold_items), content_type='application/octet-stream')
+    response['Content-Disposition'] = f'attachment; filename="invoice_{invoice.invoice_number}.bin"'
+    return response
+
+
+def receipt_response(request, invoice_id, as_attachment):
+    """The receipt PDF, rendered once and then read from the receipt cache.
+
+    The cache key doubles as the ETag, so a reprint of an unchanged receipt
+    the browser already has is a 304.
+    """
     try:
-        invoice = get_object_or_404(Invoice, id=invoice_id)
-        sold_items = SoldItem.objects.filter(invoice=invoice)
-        
-        # Generate PDF
-        pdf_content = generate_invoice_pdf(invoice, sold_items)
-        
-        # Create HTTP response with PDF
-        response = HttpResponse(pdf_content, content_type='application/pdf')
-        response['Content-Disposition'] = f'inline; filename="invoice_{invoice.invoice_number}.pdf"'
-        
+        invoice = get_object_or_404(Invoice.objects.select_related('tax_rate'), id=invoice_id)
+        sold_items = list(SoldItem.objects.filter(invoice=invoice).order_by('id'))
+        key = receipt_key(invoice, sold_items)
+        etag = f'"{key}"'
+
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            name = cached_receipt(invoice, sold_items, key)
+            response = FileResponse(
+                default_storage.open(name, 'rb'), content_type='application/pdf',
+                as_attachment=as_attachment, filename=f'invoice_{invoice.invoice_number}.pdf',
+            )
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
         return response
         
     except Exception as e:
@@ -548,23 +726,225 @@ def print_invoice_pdf(request, invoice_id):
 
 def get_default_tax_rate(request):
     """API to get the default tax rate that will be applied automatically"""
-    tax_rate = TaxRate.objects.filter(is_active=True).first()
-    
-    if tax_rate:
-        tax_data = {
-            'id': tax_rate.id,
-            'name': tax_rate.name,
-            'percentage': float(tax_rate.percentage),
-            'display_name': f"{tax_rate.name} ({tax_rate.percentage}%)"
-        }
-    else:
-        tax_data = None
-    
+    return tax_rate_response(request, get_tax_rate_entry())
+
+
+def tax_rate_response(request, entry):
+    """Tax rate JSON with an ETag; 304 if the terminal's copy is current.
+
+    No Last-Modified: the active rate can change to another row, or be
+    deleted, and nothing stored says when. The ETag follows the data itself.
+    """
+    response = get_conditional_response(request, etag=entry.etag)
+    if response is None:
+        response = JsonResponse({
+            'success': True,
+            'tax_rate': tax_rate_data(entry.tax_rate)
+        })
+    response['ETag'] = entry.etag
+    # Let browsers keep the body but always revalidate it
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+def tax_rate_data(tax_rate):
+    if not tax_rate:
+        return None
+    return {
+        'id': tax_rate.id,
+        'name': tax_rate.name,
+        'percentage': float(tax_rate.percentage),
+        'display_name': f"{tax_rate.name} ({tax_rate.percentage}%)"
+    }
+
+
+@login_required
+def product_stock(request):
+    """Name, price and stock of several products in one request: ?ids=1,2,3
+
+    The ETag comes from the catalog version (see sequences.py), so re-checking
+    a cart nothing has touched gets a 304 without the products being loaded.
+    ``available_quantity`` counts the units this terminal holds for its cart.
+    """
+    try:
+        product_ids = sorted({int(value) for value in request.GET.get('ids', '').split(',') if value.strip()})
+    except ValueError:
+        return JsonResponse({
+            'success': False,
+            'error': 'ids must be a comma-separated list of product IDs'
+        }, status=400)
+
+    max_ids = getattr(settings, 'PRODUCT_STOCK_MAX_IDS', 500)
+    if not product_ids or len(product_ids) > max_ids:
+        return JsonResponse({
+            'success': False,
+            'error': f'Expected between 1 and {max_ids} product IDs'
+        }, status=400)
+
+    terminal = get_terminal(request)
+    version = catalog_version()
+    fingerprint = f"{version}:{terminal}:{','.join(map(str, product_ids))}"
+    etag = '"%s"' % hashlib.md5(fingerprint.encode()).hexdigest()
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        products = Product.objects.only(
+            'product_name', 'product_price', 'product_quantity', 'reserved_quantity'
+        ).in_bulk(product_ids)
+        held = held_by(terminal, product_ids) if terminal else {}
+        response = JsonResponse({
+            'success': True,
+            'version': version,
+            'products': {
+                product_id: {
+                    'id': product_id,
+                    'product_name': product.product_name,
+                    'product_price': float(product.product_price),
+                    'product_quantity': product.product_quantity,
+                    'available_quantity': product.available_quantity + held.get(product_id, 0),
+                }
+                for product_id, product in products.items()
+            },
+            'missing': [product_id for product_id in product_ids if product_id not in products],
+        })
+    response['ETag'] = etag
+    patch_cache_control(response, no_cache=True, private=True)
+    return response
+
+
+@login_required
+def product_feed(request):
+    """One page of the cashier grid: ?category=<id>&after=<id>&limit=<n>
+
+    Keyset pagination on (category, id), read straight from the
+    product_category_id_idx index (or the primary key without a category),
+    so every page costs the same however far the cashier scrolls. ``next``
+    is the ``after`` for the following page, or null on the last one.
+    """
+    try:
+        after = int(request.GET.get('after') or 0)
+        limit = int(request.GET.get('limit') or getattr(settings, 'PRODUCT_FEED_PAGE_SIZE', 60))
+        category = request.GET.get('category')
+        category = int(category) if category else None
+    except ValueError:
+        return JsonResponse({
+            'success': False,
+            'error': 'after, limit and category must be numbers'
+        }, status=400)
+    limit = min(max(limit, 1), 200)
+
+    products = Product.objects.filter(id__gt=after)
+    if category is not None:
+        products = products.filter(product_category_id=category)
+    # One extra row tells us whether there is a next page
+    rows = list(products.order_by('id').values_list(*GRID_FIELDS)[:limit + 1])
+
     return JsonResponse({
         'success': True,
-        'tax_rate': tax_data
+        'products': [grid_product(*row) for row in rows[:limit]],
+        'next': rows[limit - 1][0] if len(rows) > limit else None,
     })
 
+
+@login_required
+def product_search(request):
+    """Ranked prefix search over product names, categories and SKUs: ?q=bal pe"""
+    query = request.GET.get('q', '').strip()
+    try:
+        limit = min(max(int(request.GET.get('limit', 20)), 1), 100)
+    except ValueError:
+        limit = 20
+
+    return JsonResponse({
+        'success': True,
+        'query': query,
+        'results': search_products(query, limit) if query else [],
+    })
+
+
+@login_required
+def product_scan(request):
+    """Price and stock for a scanned barcode/SKU: ?code=4800016644290"""
+    product = lookup_sku(request.GET.get('code', ''))
+    if product is None:
+        return JsonResponse({'success': False, 'error': 'No product with this code'}, status=404)
+    return JsonResponse({'success': True, 'product': product})
+
+
+@login_required
+def catalog_sync(request):
+    """Products and categories for terminals to keep a local copy of.
+
+    Without ``since`` this is the full snapshot, gzipped when the client
+    accepts it and built once per catalog version however many terminals ask.
+    With ``?since=<version>`` only the rows changed after that version are
+    sent, plus the ids deleted since; if nothing changed the answer is an
+    empty 204, which costs one primary-key read. A ``since`` the server can't
+    answer from its change log gets the full snapshot (``"full": true``).
+    """
+    try:
+        since = int(request.GET.get('since', 0))
+    except ValueError:
+        since = 0
+
+    changes = catalog_changes(since) if since else None
+    if changes is not None:
+        if not (changes['products'] or changes['categories']
+                or changes['deleted']['products'] or changes['deleted']['categories']):
+            response = HttpResponse(status=204)
+            response['X-Catalog-Version'] = changes['version']
+            return response
+        return JsonResponse(changes)
+
+    content, compressed = snapshot_bytes()
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        response = HttpResponse(compressed, content_type='application/json')
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(content, content_type='application/json')
+    response['Vary'] = 'Accept-Encoding'
+    return response
+
+
+# ---------------- ASYNC API (served natively under ASGI) ----------------
+# Checkout and catalog calls from the terminals don't have to wait behind
+# slow report and PDF requests on the same worker.
+
+@csrf_exempt
+@require_POST
+@login_required
+async def acreate_invoice(request):
+    """Async version of create_invoice, used by the payment page.
+
+    The checkout transaction has no async ORM equivalent, so the whole sale
+    runs in the sync thread; the event loop stays free for other terminals.
+    """
+    user = await request.auser()
+    return await sync_to_async(invoice_response)(request, user)
+
+
+async def aget_default_tax_rate(request):
+    """Async version of get_default_tax_rate"""
+    return tax_rate_response(request, await aget_tax_rate_entry())
+
+
+@login_required
+async def aproduct_detail(request, product_id):
+    """Current name, price and stock of one product, used by the payment page"""
+    product = await Product.objects.filter(id=product_id).values(
+        'id', 'product_name', 'product_price', 'product_quantity', 'reserved_quantity'
+    ).afirst()
+    if product is None:
+        return JsonResponse({
+            'success': False,
+            'error': f'Product with ID {product_id} does not exist'
+        }, status=404)
+
+    product['product_price'] = float(product['product_price'])
+    product['available_quantity'] = max(product['product_quantity'] - product.pop('reserved_quantity'), 0)
+    return JsonResponse(dict(product, success=True))
+
+
 # SALES MANAGEMENT
 def sales_list(request):
     sales = Invoice.objects.all()
@@ -625,22 +1005,24 @@ def sales_edit(request, invoice_id):
     staff_list = User.objects.filter(is_staff=False, is_superuser=False)  # show only staff users
 
     if request.method == 'POST':
-        # Update invoice details
-        invoice.staff_name = request.POST.get('staff_name')
-        invoice.cash_received = request.POST.get('cash_received')
-        invoice.change = request.POST.get('change')
-        invoice.date_issued = request.POST.get('date_issued') or invoice.date_issued
-        invoice.save()
-
-        # Update sold items
-        for item in sold_items:
-            qty = request.POST.get(f'quantity_{item.id}')
-            price = request.POST.get(f'unit_price_{item.id}')
-            if qty and price:
-                item.quantity = int(qty)
-                item.unit_price = float(price)
-                item.total_price = item.quantity * item.unit_price
-                item.save()
+        with updating_sales(invoice):
+            # Update invoice details
+            invoice.staff_name = request.POST.get('staff_name')
+            invoice.cash_received = request.POST.get('cash_received')
+            invoice.change = request.POST.get('change')
+            invoice.date_issued = request.POST.get('date_issued') or invoice.date_issued
+            invoice.save()
+
+            # Update sold items
+            for item in sold_items:
+                qty = request.POST.get(f'quantity_{item.id}')
+                price = request.POST.get(f'unit_price_{item.id}')
+                if qty and price:
+                    item.quantity = int(qty)
+                    item.unit_price = float(price)
+                    item.total_price = item.quantity * item.unit_price
+                    item.save()
+        clear_receipts(invoice.id)
 
         messages.success(request, 'Invoice updated successfully!')
         return redirect('pages:sales_list')
@@ -662,50 +1044,22 @@ def sales_delete(request, invoice_id):
 
 @login_required
 def sales_reports(request):
-    # Start with all invoices
-    invoices = Invoice.objects.all().order_by('-date_issued')
-    
-    # Get filter inputs and clean them
-    date_from = request.GET.get('date_from', '').strip()
-    date_to = request.GET.get('date_to', '').strip()
-    cashier = request.GET.get('cashier', '').strip()
-    customer_id = request.GET.get('customer_id', '').strip()
-    invoice_number = request.GET.get('invoice_number', '').strip()
-    
-    # Convert "None" strings to empty strings
-    if date_from == 'None': date_from = ''
-    if date_to == 'None': date_to = ''
-    if cashier == 'None': cashier = ''
-    if customer_id == 'None': customer_id = ''
-    if invoice_number == 'None': invoice_number = ''
-    
-    # Apply filters only if they have actual values
-    if date_from:
-        try:
-            date_from_obj = datetime.strptime(date_from, "%Y-%m-%d")
-            invoices = invoices.filter(date_issued__date__gte=date_from_obj.date())
-        except ValueError:
-            pass
-
-    if date_to:
-        try:
-            date_to_obj = datetime.strptime(date_to, "%Y-%m-%d")
-            invoices = invoices.filter(date_issued__date__lte=date_to_obj.date())
-        except ValueError:
-            pass
-
-    if cashier:
-        invoices = invoices.filter(staff_name__iexact=cashier)
-    
-    if customer_id:
-        invoices = invoices.filter(customer_id__icontains=customer_id)
-    
-    if invoice_number:
-        invoices = invoices.filter(invoice_number__icontains=invoice_number)
+    # Get filter inputs and clean them, then apply the ones with actual values
+    filters = sales_filters(request.GET)
+    date_from, date_to, cashier = filters['date_from'], filters['date_to'], filters['cashier']
+    customer_id, invoice_number = filters['customer_id'], filters['invoice_number']
+    invoices = filter_invoices(filters)
 
     # Calculate statistics
-    total_sales = invoices.aggregate(Sum('total_amount'))['total_amount__sum'] or 0
-    total_transactions = invoices.count()
+    if customer_id or invoice_number:
+        # Not something the daily rollup is keyed by, so add up the invoices
+        totals = invoices.filter(is_active=True).aggregate(total=Sum('total_amount'), count=Count('id'))
+        total_sales = totals['total'] or 0
+        total_transactions = totals['count']
+    else:
+        totals = sales_totals(parse_day(date_from), parse_day(date_to), cashier)
+        total_sales = totals['total']
+        total_transactions = totals['transactions']
     average_sale = total_sales / total_transactions if total_transactions > 0 else 0
     
     # Get distinct cashiers for dropdown
@@ -727,60 +1081,48 @@ def sales_reports(request):
 
 @login_required
 def print_sales_report(request):
-    """Generate PDF sales report based on current filters"""
-    # Get the same filters as sales_reports view
-    date_from = request.GET.get('date_from')
-    date_to = request.GET.get('date_to')
-    cashier = request.GET.get('cashier')
-    customer_id = request.GET.get('customer_id')
-    invoice_number = request.GET.get('invoice_number')
-    
-    # Apply the same filtering logic
-    invoices = Invoice.objects.all().order_by('-date_issued')
-    
-    filters_applied = {}
-    
-    if date_from:
-        try:
-            date_from_obj = datetime.strptime(date_from, '%Y-%m-%d').date()
-            invoices = invoices.filter(date_issued__date__gte=date_from_obj)
-            filters_applied['date_from'] = date_from
-        except ValueError:
-            pass
-    
-    if date_to:
-        try:
-            date_to_obj = datetime.strptime(date_to, '%Y-%m-%d').date()
-            invoices = invoices.filter(date_issued__date__lte=date_to_obj)
-            filters_applied['date_to'] = date_to
-        except ValueError:
-            pass
-    
-    if cashier:
-        invoices = invoices.filter(staff_name__icontains=cashier)
-        filters_applied['cashier'] = cashier
-    
-    if customer_id:
-        invoices = invoices.filter(customer_id__icontains=customer_id)
-        filters_applied['customer_id'] = customer_id
-    
-    if invoice_number:
-        invoices = invoices.filter(invoice_number__icontains=invoice_number)
-        filters_applied['invoice_number'] = invoice_number
-    
-    try:
-        # Generate PDF
-        pdf_content = generate_sales_report_pdf(invoices, filters_applied)
-        
-        # Create HTTP response with PDF - CHANGED TO INLINE
-        response = HttpResponse(pdf_content, content_type='application/pdf')
-        response['Content-Disposition'] = 'inline; filename="sales_report.pdf"'  # Changed to inline
-        
-        return response
-        
-    except Exception as e:
-        messages.error(request, f'Error generating report: {str(e)}')
-        return redirect('sales_reports')
+    """Queue the PDF sales report for the current filters (with ?detailed=1, every invoice); see report_job"""
+    return queue_report(request, ReportJob.SALES)
+
+
+def queue_report(request, kind):
+    """Queue a report PDF (or reuse a cached one) and send the browser to its
+    page, or with ?format=json answer with the job ID to poll."""
+    worker = worker_running()
+    if not worker:
+        # A request that died while rendering leaves its job running for good
+        requeue_stale_jobs()
+    job = enqueue_report(kind, request.GET, request.user)
+    if job.status == ReportJob.PENDING and not worker:
+        # Nothing would pick it up; better a slow response than a page that waits forever
+        job = render_now(job)
+    if request.GET.get('format') == 'json':
+        return JsonResponse(job_status(job))
+    return redirect('pages:report_job', job_id=job.id)
+
+
+@login_required
+def report_job(request, job_id):
+    """The finished PDF of a report job, or a page that waits for it (?format=json for polling)"""
+    job = get_object_or_404(ReportJob, id=job_id)
+    if request.GET.get('format') == 'json':
+        return JsonResponse(job_status(job))
+    if job.status == ReportJob.DONE:
+        return FileResponse(job.file.open('rb'), content_type='application/pdf', filename=f'{job.kind}_report.pdf')
+    return render(request, 'admin/report_job.html', {'job': job})
+
+
+@login_required
+def export_sales_report(request):
+    """Every invoice (or, with ?rows=items, every line item) matching the sales report filters"""
+    invoices = filter_invoices(sales_filters(request.GET))
+    if request.GET.get('rows') == 'items':
+        rows, name, title = export_sold_item_rows(invoices), 'sold-items', 'Sold items'
+    else:
+        rows, name, title = export_invoice_rows(invoices), 'invoices', 'Invoices'
+    return spreadsheet_response(
+        request, rows, f"{name}-{timezone.localdate():%Y%m%d}", title, 'pages:sales_reports',
+    )
     
 
 
@@ -967,48 +1309,12 @@ def cancel_purchase(request, pk):
 
 
 def purchase_reports(request):
-    # Only include received orders for reports
-    purchase_orders = PurchaseOrder.objects.filter(status='Received')
-    
-    # Apply filters
+    # Only include received orders for reports, with the filters applied
+    purchase_orders = filter_purchase_orders(request.GET)
     search = request.GET.get('search')
-    if search:
-        purchase_orders = purchase_orders.filter(
-            Q(id__icontains=search) | 
-            Q(supplier_name__icontains=search)
-        )
-    
     date_from = request.GET.get('date_from')
     date_to = request.GET.get('date_to')
-    
-    # Fix date filtering - use date__range for proper date comparison
-    if date_from and date_to:
-        # Convert to datetime for proper range filtering
-        try:
-            start_date = datetime.strptime(date_from, '%Y-%m-%d')
-            end_date = datetime.strptime(date_to, '%Y-%m-%d') + timedelta(days=1)
-            purchase_orders = purchase_orders.filter(
-                date_created__range=[start_date, end_date]
-            )
-        except ValueError:
-            # Handle invalid date formats
-            pass
-    elif date_from:
-        try:
-            start_date = datetime.strptime(date_from, '%Y-%m-%d')
-            purchase_orders = purchase_orders.filter(date_created__gte=start_date)
-        except ValueError:
-            pass
-    elif date_to:
-        try:
-            end_date = datetime.strptime(date_to, '%Y-%m-%d') + timedelta(days=1)
-            purchase_orders = purchase_orders.filter(date_created__lte=end_date)
-        except ValueError:
-            pass
-    
     supplier = request.GET.get('supplier')
-    if supplier:
-        purchase_orders = purchase_orders.filter(supplier_name=supplier)
     
     # Calculate statistics
     total_purchases = sum(po.total_cost for po in purchase_orders)
@@ -1033,65 +1339,19 @@ def purchase_reports(request):
     return render(request, 'admin/purchase_reports.html', context)
 
 
+@login_required
 def print_purchase_report(request):
-    """Generate PDF purchase report based on filters"""
-    # Get filtered purchase orders (only received)
-    purchase_orders = PurchaseOrder.objects.filter(status='Received')
-    
-    # Apply the same filters as in purchase_reports view
-    search = request.GET.get('search')
-    if search:
-        purchase_orders = purchase_orders.filter(
-            Q(id__icontains=search) | 
-            Q(supplier_name__icontains=search)
-        )
-    
-    date_from = request.GET.get('date_from')
-    date_to = request.GET.get('date_to')
-    
-    if date_from and date_to:
-        try:
-            start_date = datetime.strptime(date_from, '%Y-%m-%d')
-            end_date = datetime.strptime(date_to, '%Y-%m-%d') + timedelta(days=1)
-            purchase_orders = purchase_orders.filter(
-                date_created__range=[start_date, end_date]
-            )
-        except ValueError:
-            pass
-    elif date_from:
-        try:
-            start_date = datetime.strptime(date_from, '%Y-%m-%d')
-            purchase_orders = purchase_orders.filter(date_created__gte=start_date)
-        except ValueError:
-            pass
-    elif date_to:
-        try:
-            end_date = datetime.strptime(date_to, '%Y-%m-%d') + timedelta(days=1)
-            purchase_orders = purchase_orders.filter(date_created__lte=end_date)
-        except ValueError:
-            pass
-    
-    supplier = request.GET.get('supplier')
-    if supplier:
-        purchase_orders = purchase_orders.filter(supplier_name=supplier)
-    
-    # Prepare filters for PDF
-    filters = {
-        'date_from': date_from,
-        'date_to': date_to,
-        'supplier': supplier,
-        'search': search,
-    }
-    
-    # Generate PDF
-    pdf = generate_purchase_report_pdf(purchase_orders, filters)
-    
-    # Create HTTP response with PDF
-    response = HttpResponse(pdf, content_type='application/pdf')
-    filename = f"purchase_report_{timezone.now().strftime('%Y%m%d_%H%M')}.pdf"
-    response['Content-Disposition'] = f'inline; filename="{filename}"'
-    
-    return response
+    """Queue the PDF purchase report for the current filters; see report_job"""
+    return queue_report(request, ReportJob.PURCHASES)
+
+
+@login_required
+def export_purchase_report(request):
+    """Every item of the received purchase orders matching the purchase report filters"""
+    return spreadsheet_response(
+        request, export_purchase_item_rows(filter_purchase_orders(request.GET)),
+        f"purchase-items-{timezone.localdate():%Y%m%d}", 'Purchase items', 'pages:purchase_reports',
+    )
 
 def view_purchase(request, pk):
     """View purchase order details"""
@@ -1243,10 +1503,10 @@ def admin_dashboard(request):
         return redirect('pages:cashier_dashboard')
     
     # Calculate date ranges
-    today = timezone.now().date()
+    today = timezone.localdate()
     
     # Basic stats - convert to float to avoid Decimal/float mixing
-    total_sales = float(Invoice.objects.aggregate(total=Sum('total_amount'))['total'] or 0)
+    total_sales = float(sales_totals()['total'])
     
     # Purchases - use 'Received' status and convert to float
     total_purchases_result = PurchaseOrder.objects.filter(status='Received').aggregate(total=Sum('total_cost'))['total']
@@ -1256,9 +1516,9 @@ def admin_dashboard(request):
     total_profit = total_sales - total_purchases  # Now both are floats
     
     # Today's stats
-    today_sales_result = Invoice.objects.filter(date_issued__date=today).aggregate(total=Sum('total_amount'))['total']
-    today_sales = float(today_sales_result or 0)
-    today_orders = Invoice.objects.filter(date_issued__date=today).count()
+    today_totals = sales_totals(today, today)
+    today_sales = float(today_totals['total'])
+    today_orders = today_totals['transactions']
     
     # Inventory stats - ensure we're working with floats
     total_inventory_value = 0